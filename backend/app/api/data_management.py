@@ -1,14 +1,37 @@
-from fastapi import APIRouter, Body, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, Body, File, Form, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import json
-import os
+from datetime import datetime
 from pathlib import Path
+from app.core.columnar_export import COLUMNAR_FORMATS, check_columns, columnar_available, columnar_export_stream, iter_metric_rows
+from app.core.data_export import EXPORT_FORMATS, export_stream, gzip_chunks
+from app.core.data_import import DEFAULT_BATCH_SIZE, FORMAT_BY_EXTENSION, IMPORT_FORMATS, import_jobs, import_questions, prepare_record
+from app.core.document_processing import spool_upload
+from app.core.http_cache import conditional_json, make_etag
+from app.core.repository import check_filters, get_repository
+import asyncio
+import os
 
 # 创建路由
 router = APIRouter()
 
+# 可导入导出的数据类型，对应数据仓库中的集合
+DATA_TYPES = ("questions", "documents", "evaluation_results")
+
+def _check_data_type(data_type):
+    if data_type not in DATA_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的数据类型: {data_type}")
+
+async def _import_items(data_type, items):
+    items = [prepare_record(data_type, item) for item in items]
+    if data_type == "questions":
+        return await asyncio.to_thread(import_questions, items)
+    return await asyncio.to_thread(get_repository().bulk_upsert, data_type, items), []
+
+async def _export_items(data_type, ids):
+    return await asyncio.to_thread(get_repository().find_by_ids, data_type, ids)
+
 # 定义请求和响应模型
 class ImportRequest(BaseModel):
     data_type: str  # questions, evaluation_results, etc.
@@ -16,71 +39,105 @@ class ImportRequest(BaseModel):
 
 class ExportRequest(BaseModel):
     data_type: str  # questions, evaluation_results, etc.
-    ids: List[str]
-    format: str = "json"  # json, csv, etc.
+    ids: List[str] = []  # 为空时按 filters 导出
+    format: str = "json"  # json, ndjson, csv, xlsx；评测结果另支持 parquet, arrow
+    filters: Dict[str, Any] = {}  # 索引字段的查询条件，如 {"evaluation_id": "..."}，ids 非空时忽略
+    gzip: bool = False  # 是否gzip压缩导出文件
+    # 以下条件仅用于评测结果，在数据仓库查询中执行
+    models: List[str] = []  # 只导出这些模型的结果
+    metrics: List[str] = []  # 只导出这些指标
+    start_time: Optional[str] = None  # 回答时间下界（含），ISO 8601
+    end_time: Optional[str] = None  # 回答时间上界（不含），ISO 8601
+    columns: List[str] = []  # 列式格式导出的列，为空时导出除回答原文外的全部列
+
+def _export_filters(request):
+    """
+    合并请求中的查询条件，评测结果的模型、指标与时间范围转换为索引字段上的条件
+    """
+    filters = dict(request.filters)
+    if request.data_type == "evaluation_results":
+        if request.models:
+            filters["model_id"] = {"$in": request.models}
+        if request.metrics:
+            filters["metrics"] = {"$in": request.metrics}
+        time_range = {}
+        if request.start_time:
+            time_range["$gte"] = request.start_time
+        if request.end_time:
+            time_range["$lt"] = request.end_time
+        if time_range:
+            filters["created_at"] = time_range
+    return filters
 
 @router.post("/import")
 async def import_data(request: ImportRequest):
     """
-    导入数据（题目、评测结果等）
+    导入数据（题目、评测结果等），content 中的 items 批量写入数据仓库，已有ID的条目被覆盖
     """
+    _check_data_type(request.data_type)
     try:
-        # 实际项目中，这里会将数据保存到数据库
-        # 这里简单模拟导入成功
+        items = request.content["items"] if "items" in request.content else [request.content]
+        imported_count, duplicates = await _import_items(request.data_type, items)
         return {
             "success": True,
             "message": f"成功导入{request.data_type}数据",
-            "imported_count": len(request.content.get("items", [])) if "items" in request.content else 1
+            "imported_count": imported_count,
+            "duplicates": duplicates
         }
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"数据格式错误: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"数据导入失败: {str(e)}")
 
 @router.post("/import-file")
-async def import_data_file(file: UploadFile = File(...)):
+async def import_data_file(
+    file: UploadFile = File(...),
+    data_type: str = Form("questions"),
+    format: Optional[str] = Form(None),
+    batch_size: int = Form(DEFAULT_BATCH_SIZE, ge=1, le=10000)
+):
     """
-    通过文件导入数据
+    通过文件导入数据，支持JSON数组、NDJSON与CSV，未指定格式时按扩展名判断
+
+    上传文件落盘后立即返回导入任务，后台逐条解析、分批校验写入；
+    通过 /import-jobs/{job_id} 查询进度、成功与被拒绝的记录数及错误明细
     """
+    _check_data_type(data_type)
+    import_format = format or FORMAT_BY_EXTENSION.get(Path(file.filename or "").suffix.lower())
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导入格式: {import_format or '未知'}")
     try:
-        # 实际项目中，这里会解析文件内容并保存到数据库
-        # 这里简单模拟导入成功
-        content = await file.read()
-        
-        # 尝试解析JSON文件
-        try:
-            data = json.loads(content)
-            item_count = len(data.get("items", [])) if "items" in data else 1
-        except:
-            # 非JSON文件或格式不正确
-            item_count = 1
-        
-        return {
-            "success": True,
-            "message": f"成功导入文件 {file.filename}",
-            "imported_count": item_count
-        }
+        path, _, _ = await spool_upload(file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件导入失败: {str(e)}")
+    try:
+        job = import_jobs.submit(path, data_type, import_format, file.filename, batch_size)
+    except Exception as e:
+        os.unlink(path)
+        raise HTTPException(status_code=500, detail=f"文件导入失败: {str(e)}")
+    return job.summary()
+
+@router.get("/import-jobs/{job_id}")
+async def get_import_job(job_id: str):
+    """
+    查询导入任务的进度
+    """
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"导入任务不存在: {job_id}")
+    return job.summary()
 
 @router.post("/export")
 async def export_data(request: ExportRequest):
     """
-    导出数据（题目、评测结果等）
+    导出数据（题目、评测结果等），全部ID通过一次索引查询取回，不存在的ID被忽略
     """
+    _check_data_type(request.data_type)
     try:
-        # 实际项目中，这里会从数据库查询数据并格式化
-        # 这里简单模拟导出数据
-        data = {
+        return {
             "data_type": request.data_type,
-            "items": [
-                {
-                    "id": item_id,
-                    "name": f"{request.data_type}_{item_id}",
-                    "content": f"这是{request.data_type} {item_id}的内容"
-                } for item_id in request.ids
-            ]
+            "items": await _export_items(request.data_type, request.ids)
         }
-        
-        return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"数据导出失败: {str(e)}")
 
@@ -88,51 +145,65 @@ async def export_data(request: ExportRequest):
 async def export_data_file(request: ExportRequest = Body(...)):
     """
     导出数据到文件
+
+    数据从数据仓库游标中逐条读取、逐条编码后以流式响应发送，不生成临时文件，
+    内存占用与导出条数无关；指定 ids 时按ID导出，否则导出满足 filters 的全部数据。
+    评测结果可导出为 Parquet / Arrow，每个指标一行，按行组写出并支持列投影
     """
+    _check_data_type(request.data_type)
+    columnar = request.format in COLUMNAR_FORMATS
+    if request.format not in EXPORT_FORMATS and not columnar:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.format}")
+    if columnar and request.data_type != "evaluation_results":
+        raise HTTPException(status_code=400, detail=f"{request.format} 格式只支持导出评测结果")
+    if columnar and not columnar_available():
+        raise HTTPException(status_code=501, detail="服务端未安装 pyarrow，无法导出列式格式")
+    filters = _export_filters(request)
     try:
-        # 实际项目中，这里会从数据库查询数据并生成文件
-        # 这里简单模拟生成文件并返回
-        
-        # 生成临时文件路径
-        temp_dir = Path("./temp")
-        temp_dir.mkdir(exist_ok=True)
-        
-        file_name = f"{request.data_type}_export.{request.format}"
-        file_path = temp_dir / file_name
-        
-        # 生成示例数据
-        data = {
-            "data_type": request.data_type,
-            "items": [
-                {
-                    "id": item_id,
-                    "name": f"{request.data_type}_{item_id}",
-                    "content": f"这是{request.data_type} {item_id}的内容"
-                } for item_id in request.ids
-            ]
-        }
-        
-        # 写入文件
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        # 返回文件下载响应
-        return FileResponse(
-            path=file_path,
-            filename=file_name,
-            media_type="application/json"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"文件导出失败: {str(e)}")
+        check_filters(request.data_type, filters)
+        if columnar:
+            check_columns(request.columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    repository = get_repository()
+    if request.ids:
+        rows = repository.iter_by_ids(request.data_type, request.ids)
+    else:
+        rows = repository.iter_find(request.data_type, filters)
+
+    file_name = f"{request.data_type}_export_{datetime.now().strftime('%Y%m%d%H%M%S')}.{request.format}"
+    if columnar:
+        media_type = COLUMNAR_FORMATS[request.format]
+        content = columnar_export_stream(iter_metric_rows(rows, request.metrics), request.format, request.columns)
+        if request.gzip:
+            content = gzip_chunks(content)
+    else:
+        media_type = EXPORT_FORMATS[request.format]
+        content = export_stream(request.data_type, rows, request.format, request.gzip)
+    if request.gzip:
+        file_name += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+# 支持的数据格式，内容固定，ETag 只需计算一次
+SUPPORTED_FORMATS = [
+    {"id": "json", "name": "JSON", "description": "JavaScript Object Notation"},
+    {"id": "ndjson", "name": "NDJSON", "description": "每行一条记录的JSON"},
+    {"id": "csv", "name": "CSV", "description": "Comma-Separated Values"},
+    {"id": "xlsx", "name": "Excel", "description": "Microsoft Excel 文件"},
+    {"id": "parquet", "name": "Parquet", "description": "列式存储文件，仅用于评测结果，可直接读入 pandas"},
+    {"id": "arrow", "name": "Arrow IPC", "description": "Apache Arrow 流格式，仅用于评测结果"}
+]
+FORMATS_ETAG = make_etag("formats", SUPPORTED_FORMATS)
 
 @router.get("/formats")
-async def get_supported_formats():
+async def get_supported_formats(request: Request):
     """
-    获取支持的数据格式
+    获取支持的数据格式，携带 If-None-Match 的请求返回304
     """
-    formats = [
-        {"id": "json", "name": "JSON", "description": "JavaScript Object Notation"},
-        {"id": "csv", "name": "CSV", "description": "Comma-Separated Values"},
-        {"id": "xlsx", "name": "Excel", "description": "Microsoft Excel 文件"}
-    ]
-    return formats
\ No newline at end of file
+    return await conditional_json(request, "formats", FORMATS_ETAG, lambda: (SUPPORTED_FORMATS, None), offload=False)
\ No newline at end of file
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
+from pathlib import Path
+from datetime import datetime, timezone
+import asyncio
 import json
+import os
+from app.core.document_processing import SUPPORTED_EXTENSIONS, spool_upload, parse_document, chunk_hash
+from app.core.document_store import document_store, document_id_for
+from app.core.http_cache import conditional_json, make_etag
+from app.core.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from app.core.question_generation import QuestionGenerator
 
 # 创建路由
 router = APIRouter()
 
+# 实例化题目生成器
+question_generator = QuestionGenerator()
+
 # 定义响应模型
 class DocumentAnalysisResult(BaseModel):
     document_id: str
@@ -17,79 +29,115 @@ class DocumentAnalysisResult(BaseModel):
 async def upload_document(
     file: UploadFile = File(...),
     question_type: str = Form("multiple_choice"),
-    num_questions: int = Form(5)
+    num_questions: int = Form(5),
+    topic: Optional[str] = Form(None)
 ):
     """
     上传文档并解析生成题目
+
+    上传内容按块写入临时文件，文本提取与分块在进程池中进行，内存占用与文件大小无关。
+    文档按内容哈希寻址：相同内容重复上传直接返回已有结果，修改后的文档只为变化的文本块重新出题。
+    提供 topic 时只在与主题最相关的文本块上出题
     """
+    extension = Path(file.filename or "").suffix.lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"不支持的文件类型: {extension or '未知'}")
+
+    spool_path = None
     try:
-        # 实际项目中，这里会解析文档内容并调用大模型生成题目
-        # 这里简单模拟返回解析结果
-        document_content = await file.read()
+        spool_path, size, content_hash = await spool_upload(file)
+        document_id = document_id_for(content_hash)
+
+        # 相同内容、相同出题参数已经解析过，直接返回
+        analysis = await asyncio.to_thread(document_store.get_analysis, content_hash, question_type, num_questions, topic)
+        if analysis is not None:
+            return DocumentAnalysisResult(
+                document_id=document_id,
+                document_name=file.filename,
+                total_questions=len(analysis["questions"]),
+                questions=analysis["questions"]
+            )
+
+        chunks = await parse_document(spool_path, file.filename)
         
-        # 生成题目
-        questions = [
-            {
-                "id": f"q{i+1}",
-                "type": question_type,
-                "content": f"这是从文档'{file.filename}'中提取的第{i+1}个问题",
-                "options": ["选项A", "选项B", "选项C", "选项D"],
-                "answer": "选项C"
-            } for i in range(num_questions)
-        ]
+        # 生成题目，未变化的文本块复用已有题目
+        questions = await question_generator.generate_from_document(
+            chunks,
+            num_questions=num_questions,
+            question_type=question_type,
+            chunk_store=document_store,
+            document_id=document_id,
+            topic=topic
+        )
+
+        # 只缓存完整的解析结果，部分失败时下次上传重新补齐
+        if len(questions) == num_questions:
+            await asyncio.to_thread(
+                document_store.save_analysis,
+                content_hash,
+                file.filename,
+                datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                size,
+                [chunk_hash(chunk) for chunk in chunks],
+                question_type,
+                num_questions,
+                questions,
+                topic
+            )
         
         return DocumentAnalysisResult(
-            document_id=f"doc-{hash(file.filename) % 10000}",
+            document_id=document_id,
             document_name=file.filename,
             total_questions=len(questions),
             questions=questions
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文档解析失败: {str(e)}")
+    finally:
+        if spool_path is not None:
+            os.unlink(spool_path)
 
 @router.get("/documents", response_model=List[Dict[str, Any]])
-async def get_documents():
+async def get_documents(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
     """
-    获取已上传的文档列表
+    获取已上传的文档列表，按上传时间倒序
+
+    指定 limit 时分页返回，还有下一页时响应头 X-Next-Cursor 为下一页的游标；
+    响应带 ETag，文档未变化时携带 If-None-Match 的请求返回304
     """
-    # 实际项目中，这里会从数据库查询文档列表
-    # 这里简单模拟返回文档列表
-    documents = [
-        {
-            "id": "doc-1234",
-            "name": "示例文档1.pdf",
-            "upload_time": "2023-07-15T10:30:00Z",
-            "total_questions": 10
-        },
-        {
-            "id": "doc-5678",
-            "name": "示例文档2.docx",
-            "upload_time": "2023-07-16T14:20:00Z",
-            "total_questions": 8
-        }
-    ]
-    return documents
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if after is not None and (limit is None or not isinstance(after, list) or len(after) != 2):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    version = await asyncio.to_thread(document_store.repository.version, "documents")
+
+    def build():
+        documents, next_after = document_store.list_documents(limit, after)
+        next_cursor = encode_cursor(next_after)
+        return documents, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    etag = make_etag("documents", version, limit, cursor)
+    return await conditional_json(request, "documents", etag, build, ("documents",))
 
 @router.get("/documents/{document_id}", response_model=DocumentAnalysisResult)
 async def get_document_analysis(document_id: str):
     """
-    获取指定文档的解析结果
+    获取指定文档的解析结果，有多次解析时返回最近一次
     """
-    # 实际项目中，这里会从数据库查询文档解析结果
-    # 这里简单模拟返回文档解析结果
-    questions = [
-        {
-            "id": f"q{i+1}",
-            "type": "multiple_choice",
-            "content": f"这是从文档'{document_id}'中提取的第{i+1}个问题",
-            "options": ["选项A", "选项B", "选项C", "选项D"],
-            "answer": "选项C"
-        } for i in range(8)
-    ]
+    document = await asyncio.to_thread(document_store.get_document, document_id)
+    if document is None or not document["analyses"]:
+        raise HTTPException(status_code=404, detail=f"文档不存在: {document_id}")
+    analysis = list(document["analyses"].values())[-1]
     
     return DocumentAnalysisResult(
         document_id=document_id,
-        document_name="示例文档.pdf",
-        total_questions=len(questions),
-        questions=questions
-    )
\ No newline at end of file
+        document_name=document["name"],
+        total_questions=len(analysis["questions"]),
+        questions=analysis["questions"]
+    )
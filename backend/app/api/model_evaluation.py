@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query, Request
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
+from app.core.evaluation_jobs import RESPONSE_FIELDS, evaluation_jobs
+from app.core.http_cache import conditional_json, make_etag
+from app.core.llm_client import ProviderConfigError, check_model_configured, get_llm_client
+from app.core.pagination import MAX_PAGE_SIZE, decode_position, encode_cursor
+from app.core.serialization import FastJSONResponse, parse_fields
 
 # 创建路由
 router = APIRouter()
@@ -10,46 +15,60 @@ class ModelEvaluationRequest(BaseModel):
     model_id: str
     questions: List[Dict[str, Any]]
     evaluation_metrics: List[str] = ["accuracy", "fluency", "relevance"]
+    use_cache: bool = True  # 相同模型与题目的回答直接复用缓存结果
 
 class ModelResponse(BaseModel):
     question_id: str
     model_id: str
     response_content: str
-    score: Optional[float] = None
+    score: Optional[float] = None  # 各指标得分的均值
+    metrics_scores: Dict[str, Optional[float]] = {}
+    extracted_answer: Optional[str] = None  # 选择题从回答中提取出的选项
+    answered_at: Optional[str] = None
 
 class EvaluationResult(BaseModel):
     model_id: str
     total_score: float
     metrics_scores: Dict[str, float]
     responses: List[ModelResponse]
+    evaluation_id: Optional[str] = None
+    status: Optional[str] = None  # pending / running / completed / failed / cancelled / interrupted
+    completed: int = 0
+    failed: int = 0
+    total: int = 0
+    metrics_ci: Dict[str, List[Optional[float]]] = {}  # 指标 -> [95%置信区间下界, 上界]
+    category_scores: Dict[str, Dict[str, Optional[float]]] = {}  # 题目类型 -> 指标 -> 均值
+    next_cursor: Optional[str] = None  # 分页查询逐题结果时下一页的游标
 
-@router.post("/evaluate", response_model=EvaluationResult)
+class EvaluationJobInfo(BaseModel):
+    evaluation_id: str
+    model_id: str
+    status: str
+    total: int
+
+@router.post("/evaluate", response_model=EvaluationJobInfo)
 async def evaluate_model(request: ModelEvaluationRequest):
     """
-    评测指定模型在给定题目上的表现
+    提交评测任务，立即返回评测ID
+
+    模型调用由后台工作协程并发执行，通过 /results/{evaluation_id} 查询进度与结果
     """
     try:
-        # 实际项目中，这里会调用模型并进行评测
-        # 这里简单模拟返回评测结果
-        responses = []
-        for i, question in enumerate(request.questions):
-            response = ModelResponse(
-                question_id=question.get("id", f"q{i+1}"),
-                model_id=request.model_id,
-                response_content=f"这是{request.model_id}对问题{question.get('id', f'q{i+1}')}的回答",
-                score=0.85
-            )
-            responses.append(response)
-        
-        # 计算总分和各指标分数
-        metrics_scores = {metric: 0.8 + (i * 0.05) for i, metric in enumerate(request.evaluation_metrics)}
-        total_score = sum(metrics_scores.values()) / len(metrics_scores)
-        
-        return EvaluationResult(
+        check_model_configured(request.model_id)
+    except ProviderConfigError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job = evaluation_jobs.submit(
             model_id=request.model_id,
-            total_score=total_score,
-            metrics_scores=metrics_scores,
-            responses=responses
+            questions=request.questions,
+            metrics=request.evaluation_metrics,
+            use_cache=request.use_cache
+        )
+        return EvaluationJobInfo(
+            evaluation_id=job.evaluation_id,
+            model_id=job.model_id,
+            status=job.status,
+            total=job.total
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"模型评测失败: {str(e)}")
@@ -89,28 +108,93 @@ async def get_available_models():
     ]
     return models
 
+@router.get("/rate-limits")
+async def get_rate_limits():
+    """
+    获取各服务提供方/模型当前的限流状态
+    """
+    return get_llm_client().limiters.get_stats()
+
+def _parse_response_fields(fields):
+    try:
+        return parse_fields(fields, RESPONSE_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _result_content(job, response_fields, start=0, limit=None):
+    """
+    按 EvaluationResult 的字段整理评测结果，分页时附带下一页的游标
+
+    逐题结果可能有数万条，不再逐条构造 Pydantic 模型校验后由标准库二次编码
+    """
+    summary = job.summary(response_fields, start, limit)
+    content = {name: summary.get(name) for name in EvaluationResult.model_fields}
+    end = start + len(summary["responses"])
+    if limit is not None and end < len(job.responses):
+        content["next_cursor"] = encode_cursor(end)
+    return content
+
+def _result_response(job, fields):
+    return FastJSONResponse(_result_content(job, _parse_response_fields(fields)))
+
 @router.get("/results/{evaluation_id}", response_model=EvaluationResult)
-async def get_evaluation_result(evaluation_id: str):
+async def get_evaluation_result(
+    evaluation_id: str,
+    request: Request,
+    fields: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
     """
-    获取指定评测的结果
+    获取指定评测的结果，任务未结束时返回当前进度与部分得分
+
+    fields 为逗号分隔的逐题结果字段，如 "question_id,score"，只返回这些字段；
+    指定 limit 时逐题结果分页返回，还有下一页时 next_cursor 为下一页的游标（汇总得分每页都完整返回）。
+    响应带 ETag，进度与结果未变化时携带 If-None-Match 的请求返回304
     """
-    # 实际项目中，这里会从数据库查询评测结果
-    # 这里简单模拟返回评测结果
-    responses = [
-        ModelResponse(
-            question_id=f"q{i+1}",
-            model_id="gpt-3.5-turbo",
-            response_content=f"这是对问题q{i+1}的回答",
-            score=0.85
-        ) for i in range(5)
-    ]
-    
-    metrics_scores = {"accuracy": 0.82, "fluency": 0.88, "relevance": 0.79}
-    total_score = sum(metrics_scores.values()) / len(metrics_scores)
-    
-    return EvaluationResult(
-        model_id="gpt-3.5-turbo",
-        total_score=total_score,
-        metrics_scores=metrics_scores,
-        responses=responses
-    )
\ No newline at end of file
+    response_fields = _parse_response_fields(fields)
+    try:
+        start = decode_position(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await evaluation_jobs.get(evaluation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"评测不存在: {evaluation_id}")
+    await job.refresh_aggregate()
+    # 逐题结果只追加或原位替换（得分表的版本随之递增），状态、得分表与汇总得分的版本不变时结果不变
+    etag = make_etag(
+        "results", evaluation_id, job.status, job.table.version, job.aggregated_version, response_fields, limit, start
+    )
+    return await conditional_json(
+        request, "results", etag, lambda: (_result_content(job, response_fields, start, limit), None), offload=False
+    )
+
+@router.post("/results/{evaluation_id}/resume", response_model=EvaluationJobInfo)
+async def resume_evaluation(evaluation_id: str):
+    """
+    从检查点继续被中断、取消或失败的评测，已成功回答的题目不再调用模型，回答失败的题目重新调用；
+    已完成但有失败题目的评测也可以继续，只重试失败的题目
+    """
+    try:
+        job = await evaluation_jobs.resume(evaluation_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"评测不存在: {evaluation_id}")
+    return EvaluationJobInfo(
+        evaluation_id=job.evaluation_id,
+        model_id=job.model_id,
+        status=job.status,
+        total=job.total
+    )
+
+@router.post("/results/{evaluation_id}/cancel", response_model=EvaluationResult)
+async def cancel_evaluation(evaluation_id: str, fields: Optional[str] = Query(None)):
+    """
+    取消运行中的评测，已完成的题目结果保留
+    """
+    job = await evaluation_jobs.cancel(evaluation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"评测不存在: {evaluation_id}")
+    await job.refresh_aggregate()
+    return _result_response(job, fields)
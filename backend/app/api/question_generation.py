@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Body, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from pydantic import BaseModel
+from app.core.http_cache import conditional_json, make_etag
+from app.core.pagination import MAX_PAGE_SIZE, decode_position, encode_cursor
 from app.core.question_generation import QuestionGenerator
+from app.core.repository import get_repository
+from app.core.serialization import parse_fields, project
+import asyncio
+import json
 
 # 创建路由
 router = APIRouter()
@@ -11,11 +18,13 @@ class QuestionRequest(BaseModel):
     prompt: str
     num_questions: int = 5
     question_type: str = "multiple_choice"
+    use_cache: bool = True  # 为False时跳过补全缓存，强制重新调用大模型
 
 class DocumentRequest(BaseModel):
     document_content: str
     num_questions: int = 5
     question_type: str = "multiple_choice"
+    topic: Optional[str] = None  # 出题主题，提供时只在与主题最相关的文本块上出题
 
 class Question(BaseModel):
     id: str
@@ -27,6 +36,24 @@ class Question(BaseModel):
 class QuestionsResponse(BaseModel):
     questions: List[Question]
 
+class QuestionBankResponse(BaseModel):
+    total: int
+    questions: List[Question]
+
+class QuestionExportResponse(BaseModel):
+    questions: List[Question]
+    next_cursor: Optional[str] = None  # 分页导出时下一页的游标
+
+# 题库列表与导出可投影的字段，默认返回 Question 的字段
+QUESTION_FIELDS = ("id", "type", "content", "options", "answer", "tags", "document_id", "source", "created_at", "duplicate_of")
+DEFAULT_QUESTION_FIELDS = tuple(Question.model_fields)
+
+def _question_fields(fields):
+    try:
+        return parse_fields(fields, QUESTION_FIELDS) or DEFAULT_QUESTION_FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # 实例化题目生成器
 question_generator = QuestionGenerator()
 
@@ -36,44 +63,116 @@ async def generate_questions_from_prompt(request: QuestionRequest):
     通过提示词生成题目
     """
     try:
-        questions = question_generator.generate_from_prompt(
+        questions = await question_generator.generate_from_prompt(
             prompt=request.prompt,
             num_questions=request.num_questions,
-            question_type=request.question_type
+            question_type=request.question_type,
+            use_cache=request.use_cache
         )
         return {"questions": questions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成题目失败: {str(e)}")
 
+@router.post("/from-prompt/stream")
+async def stream_questions_from_prompt(request: QuestionRequest):
+    """
+    通过提示词流式生成题目，以NDJSON格式逐行返回，每行一道题目
+    """
+    async def question_lines():
+        try:
+            async for question in question_generator.stream_from_prompt(
+                prompt=request.prompt,
+                num_questions=request.num_questions,
+                question_type=request.question_type
+            ):
+                yield json.dumps(question, ensure_ascii=False) + "\n"
+        except Exception as e:
+            # 响应头已经发出，错误以单独一行返回
+            yield json.dumps({"error": f"生成题目失败: {str(e)}"}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(question_lines(), media_type="application/x-ndjson")
+
 @router.post("/from-document", response_model=QuestionsResponse)
 async def generate_questions_from_document(request: DocumentRequest):
     """
     通过文档内容生成题目
     """
     try:
-        questions = question_generator.generate_from_document(
+        questions = await question_generator.generate_from_document(
             document_content=request.document_content,
             num_questions=request.num_questions,
-            question_type=request.question_type
+            question_type=request.question_type,
+            topic=request.topic
         )
         return {"questions": questions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成题目失败: {str(e)}")
 
-@router.get("/export", response_model=QuestionsResponse)
-async def export_questions(question_ids: List[str] = Query(...)):
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    获取大模型补全缓存的命中统计
+    """
+    return question_generator.llm_client.cache.get_stats()
+
+@router.get("/questions", response_model=QuestionBankResponse)
+async def list_questions(
+    request: Request,
+    document_id: Optional[str] = None,
+    question_type: Optional[str] = None,
+    tag: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None)
+):
+    """
+    按来源文档、题目类型或标签查询题库，fields 为逗号分隔的返回字段，如 "id,content"
+
+    响应带 ETag，题库未变化时携带 If-None-Match 的请求返回304
+    """
+    selected = _question_fields(fields)
+    filters = {"document_id": document_id, "type": question_type, "tags": tag}
+    repository = get_repository()
+    version = await asyncio.to_thread(repository.version, "questions")
+
+    def build():
+        total = repository.count("questions", filters)
+        questions = repository.find("questions", filters, limit, offset)
+        return {"total": total, "questions": project(questions, selected)}, None
+
+    etag = make_etag("questions", version, filters, limit, offset, selected)
+    return await conditional_json(request, "questions", etag, build, ("questions",))
+
+@router.get("/export", response_model=QuestionExportResponse)
+async def export_questions(
+    request: Request,
+    question_ids: List[str] = Query(...),
+    fields: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
     """
-    导出指定ID的题目
+    导出指定ID的题目，全部ID通过一次索引查询取回，不存在的ID被忽略；fields 为逗号分隔的返回字段
+
+    指定 limit 时按 question_ids 的顺序每页取 limit 个ID，还有下一页时 next_cursor 为下一页的游标，
+    翻页时需携带相同的 question_ids。响应带 ETag，题库未变化时携带 If-None-Match 的请求返回304
     """
-    # 实际项目中，这里会从数据库查询题目
-    # 这里简单模拟返回题目
-    questions = [
-        {
-            "id": qid,
-            "type": "multiple_choice",
-            "content": f"这是ID为{qid}的题目",
-            "options": ["选项A", "选项B", "选项C", "选项D"],
-            "answer": "选项A"
-        } for qid in question_ids
-    ]
-    return {"questions": questions}
\ No newline at end of file
+    selected = _question_fields(fields)
+    try:
+        start = decode_position(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ids = list(dict.fromkeys(question_ids))
+    end = len(ids) if limit is None else min(start + limit, len(ids))
+    repository = get_repository()
+    version = await asyncio.to_thread(repository.version, "questions")
+
+    def build():
+        questions = repository.find_by_ids("questions", ids[start:end])
+        content = {"questions": project(questions, selected)}
+        if end < len(ids):
+            content["next_cursor"] = encode_cursor(end)
+        return content, None
+
+    etag = make_etag("export", version, ids, selected, start, end)
+    return await conditional_json(request, "export", etag, build, ("questions",))
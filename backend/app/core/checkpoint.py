@@ -0,0 +1,211 @@
+import os
+import time
+
+from app.core.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 检查点日志：长时间运行的任务每完成一个单元就向只追加的日志写一行（带幂等键），
+# 每行写入后立即 flush，fsync 按条数或时间间隔批量执行；进程崩溃或重新部署后按幂等键跳过已完成的单元。
+# 日志中的记录定期并入数据仓库后截断，日志大小与任务规模无关
+
+# 累计多少条未 fsync 的记录后执行一次 fsync
+CHECKPOINT_FSYNC_BATCH = int(os.getenv("CHECKPOINT_FSYNC_BATCH", "64"))
+# 距上次 fsync 超过该秒数时执行一次 fsync
+CHECKPOINT_FSYNC_INTERVAL = float(os.getenv("CHECKPOINT_FSYNC_INTERVAL", "1.0"))
+# 日志累计多少条记录后并入数据仓库并截断
+CHECKPOINT_COMPACT_SIZE = int(os.getenv("CHECKPOINT_COMPACT_SIZE", "5000"))
+
+
+class CheckpointLog:
+    """
+    只追加的检查点日志，每行一条JSON记录，key 字段为幂等键
+
+    崩溃时最后一行可能只写了一半，打开与读取时丢弃不完整的末行；同一幂等键出现多次时以最后一次为准
+    """
+
+    def __init__(self, path, fsync_batch=CHECKPOINT_FSYNC_BATCH, fsync_interval=CHECKPOINT_FSYNC_INTERVAL):
+        """
+        初始化日志，调用 open 后才能写入
+
+        Args:
+            path: 日志文件路径
+            fsync_batch: 累计多少条记录后 fsync
+            fsync_interval: 距上次 fsync 超过多少秒后 fsync
+        """
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.size = 0
+        self._file = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    @staticmethod
+    def read(path, key=None):
+        """
+        读取日志中的记录
+
+        Args:
+            path: 日志文件路径
+            key: 没有 key 字段的记录（早期版本写入）计算幂等键的函数
+
+        Returns:
+            幂等键到记录的字典，按幂等键首次出现的顺序；同一幂等键出现多次时取最后一条
+            （重试成功的结果追加在失败的结果之后），文件不存在时为空字典
+        """
+        records = {}
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n") or not line.strip():
+                        continue
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        continue
+                    record_key = record.pop("key", None)
+                    if record_key is None and key is not None:
+                        record_key = key(record)
+                    records[record_key] = record
+        except FileNotFoundError:
+            pass
+        return records
+
+    def open(self):
+        """
+        打开日志用于追加，末尾不完整的一行被截掉
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+b")
+        end = self._file.seek(0, os.SEEK_END)
+        if end:
+            # 从末尾向前找到最后一个换行符，其后的内容是崩溃时未写完的记录
+            position = end
+            while position > 0:
+                step = min(65536, position)
+                self._file.seek(position - step)
+                newline = self._file.read(step).rfind(b"\n")
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position < end:
+                self._file.truncate(position)
+                os.fsync(self._file.fileno())
+            self._file.seek(0)
+            self.size = sum(1 for _ in self._file)
+            self._file.seek(0, os.SEEK_END)
+        return self
+
+    def append(self, key, record):
+        """
+        追加一条记录并 flush 到操作系统，是否 fsync 由 sync_due 判断
+        """
+        self._file.write(dumps({**record, "key": key}) + b"\n")
+        self._file.flush()
+        self.size += 1
+        self._unsynced += 1
+
+    def sync_due(self):
+        """
+        是否达到了 fsync 的条数或时间间隔
+        """
+        return self._unsynced > 0 and (
+            self._unsynced >= self.fsync_batch or time.monotonic() - self._synced_at >= self.fsync_interval
+        )
+
+    def sync(self):
+        """
+        把已写入的记录 fsync 到磁盘
+        """
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def truncate(self):
+        """
+        清空日志，在日志中的记录已并入数据仓库后调用
+        """
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+        self.size = 0
+        self._unsynced = 0
+
+    def close(self, remove=False):
+        """
+        fsync 并关闭日志
+
+        Args:
+            remove: 是否删除日志文件（记录已全部并入数据仓库时）
+        """
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+        if remove:
+            self.path.unlink(missing_ok=True)
+
+
+class RunLock:
+    """
+    任务运行锁（文件上的排他 flock），保证多个工作进程中只有一个在运行同一个任务
+
+    持有锁的进程退出（包括崩溃）后锁自动释放；没有 fcntl 的平台上不做跨进程互斥
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """
+        尝试加锁，不等待
+
+        Returns:
+            是否加锁成功
+        """
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                return False
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def held_elsewhere(self):
+        """
+        锁是否被其他持有者占用；只读探测，锁文件不存在时不会创建
+
+        flock 按打开的文件描述区分持有者，本进程通过另一个 RunLock 持有的锁同样会报告为占用，
+        调用方需先排除本进程中正在运行的任务
+        """
+        if self._file is not None or fcntl is None:
+            return False
+        try:
+            file = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        with file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+        return False
@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from app.core.document_processing import chunk_hash
+
+# 文本块检索：按 BM25 为文档的文本块打分，出题时只把与主题最相关的 top-k 个文本块交给大模型，
+# 每次调用的提示词长度与文档长度无关；文本块的词项向量按内容哈希缓存
+
+# 按主题出题时最多使用的文本块数
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+# 内存中缓存的文本块向量数
+CHUNK_VECTOR_CACHE_SIZE = int(os.getenv("CHUNK_VECTOR_CACHE_SIZE", "50000"))
+# 词项哈希到 2^20 个桶，向量只保存桶编号与词频
+TERM_BUCKETS = 1 << 20
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 连续的汉字按二元组切分，英文单词与数字整体作为一个词项
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    切分词项：汉字取相邻二元组（单个汉字取本身），英文按单词，不依赖分词词典
+    """
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    terms = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _term_ids(terms):
+    return [zlib.crc32(term.encode("utf-8")) % TERM_BUCKETS for term in terms]
+
+
+class _VectorCache:
+    """
+    文本块向量的LRU缓存，键为文本块内容哈希，相同内容的文本块在不同文档、多次出题之间只计算一次
+    """
+
+    def __init__(self, max_entries=CHUNK_VECTOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, chunk):
+        key = chunk_hash(chunk)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return vector
+            self.stats["misses"] += 1
+        vector = vectorize(chunk)
+        with self._lock:
+            self._entries[key] = vector
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return vector
+
+
+def vectorize(text):
+    """
+    计算文本的词项向量
+
+    Returns:
+        (词项桶编号数组, 词频数组, 词项总数)，桶编号升序
+    """
+    counts = Counter(_term_ids(tokenize(text)))
+    ids = np.fromiter(sorted(counts), dtype=np.int64, count=len(counts))
+    tfs = np.fromiter((counts[i] for i in ids.tolist()), dtype=np.float32, count=len(counts))
+    return ids, tfs, int(tfs.sum())
+
+
+# 进程内共享的文本块向量缓存
+vector_cache = _VectorCache()
+
+
+class ChunkIndex:
+    """
+    一份文档的文本块检索索引
+
+    各文本块的词项拼接在连续数组中（词项桶编号、词频、所属文本块下标），
+    查询时一次向量化计算全部命中词项的 BM25 分数，再按文本块累加
+    """
+
+    def __init__(self, chunks, cache=None):
+        """
+        构建索引
+
+        Args:
+            chunks: 文本块列表
+            cache: 文本块向量缓存，默认使用进程内共享的缓存
+        """
+        cache = cache or vector_cache
+        vectors = [cache.get(chunk) for chunk in chunks]
+        self.size = len(chunks)
+        self._term_ids = np.concatenate([ids for ids, _, _ in vectors]) if vectors else np.empty(0, dtype=np.int64)
+        self._tfs = np.concatenate([tfs for _, tfs, _ in vectors]) if vectors else np.empty(0, dtype=np.float32)
+        self._rows = np.repeat(np.arange(self.size), [len(ids) for ids, _, _ in vectors])
+        lengths = np.array([length for _, _, length in vectors], dtype=np.float32)
+        average = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        # 每个词项位置上 BM25 的长度归一化项
+        self._norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths[self._rows] / average)
+        # 文档频率：每个文本块内的词项桶编号已去重
+        self._terms, self._df = np.unique(self._term_ids, return_counts=True)
+
+    def _idf(self, term_ids):
+        # term_ids 均取自索引中的词项，一定能找到
+        df = self._df[np.searchsorted(self._terms, term_ids)]
+        return np.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        """
+        按 BM25 分数检索与查询最相关的文本块
+
+        Args:
+            query: 查询文本，如出题主题
+            top_k: 返回的文本块数
+
+        Returns:
+            [(文本块下标, 分数)]，按分数降序，只包含分数大于0的文本块
+        """
+        query_ids = np.unique(np.array(_term_ids(tokenize(query)), dtype=np.int64))
+        if not self.size or not len(query_ids) or top_k <= 0:
+            return []
+        matched = np.isin(self._term_ids, query_ids)
+        if not matched.any():
+            return []
+        term_ids = self._term_ids[matched]
+        tfs = self._tfs[matched]
+        weights = self._idf(term_ids) * tfs * (BM25_K1 + 1) / (tfs + self._norms[matched])
+        scores = np.bincount(self._rows[matched], weights=weights, minlength=self.size)
+        count = min(top_k, int((scores > 0).sum()))
+        if count == 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(i), round(float(scores[i]), 4)) for i in best]
+
+
+def select_chunks(chunks, topic, top_k=RETRIEVAL_TOP_K, cache=None):
+    """
+    选出与主题最相关的文本块，保持它们在文档中的原有顺序
+
+    Args:
+        chunks: 文本块列表
+        topic: 出题主题
+        top_k: 最多选出的文本块数
+        cache: 文本块向量缓存
+
+    Returns:
+        选中的文本块列表；没有任何文本块与主题相关时返回前 top_k 个文本块
+    """
+    hits = ChunkIndex(chunks, cache).search(topic, top_k)
+    if not hits:
+        return list(chunks[:top_k])
+    return [chunks[i] for i in sorted(i for i, _ in hits)]
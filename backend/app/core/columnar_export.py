@@ -0,0 +1,178 @@
+# 评测结果的列式导出（Parquet / Arrow IPC），供离线分析直接读入 pandas
+# 每条评测结果按指标展开为一行，按行组批量写出，模型、题目等重复取值的列使用字典编码
+
+COLUMNAR_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# 可导出的列；字典编码的列在文件中只保存一份取值表与整数下标
+COLUMNAR_COLUMNS = [
+    "evaluation_id", "model_id", "question_id", "question_type", "metric", "score", "created_at", "response_content",
+]
+DICTIONARY_COLUMNS = {"evaluation_id", "model_id", "question_id", "question_type", "metric"}
+# 未指定列时默认导出的列，回答原文体积大，需要时显式指定
+DEFAULT_COLUMNAR_COLUMNS = [column for column in COLUMNAR_COLUMNS if column != "response_content"]
+
+# 每个行组的行数
+ROW_GROUP_SIZE = 65536
+
+
+def columnar_available():
+    """
+    是否安装了 pyarrow
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def check_columns(columns):
+    """
+    检查投影列，返回实际导出的列；为空时使用默认列
+
+    Raises:
+        ValueError: 包含未知列
+    """
+    if not columns:
+        return list(DEFAULT_COLUMNAR_COLUMNS)
+    unknown = [column for column in columns if column not in COLUMNAR_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的列: {', '.join(unknown)}")
+    return list(dict.fromkeys(columns))
+
+
+def iter_metric_rows(results, metrics=None):
+    """
+    将评测结果按指标展开为长表的行
+
+    Args:
+        results: evaluation_results 记录迭代器
+        metrics: 只保留这些指标，为空时保留记录中的全部指标
+
+    Yields:
+        每个 (结果, 指标) 一行的字典
+    """
+    wanted = set(metrics) if metrics else None
+    for result in results:
+        metrics_scores = result.get("metrics_scores") or {}
+        for metric in result.get("metrics") or ["score"]:
+            if wanted is not None and metric not in wanted:
+                continue
+            yield {
+                "evaluation_id": result.get("evaluation_id"),
+                "model_id": result.get("model_id"),
+                "question_id": result.get("question_id"),
+                "question_type": result.get("question_type"),
+                "metric": metric,
+                "score": metrics_scores.get(metric, result.get("score")),
+                "created_at": result.get("created_at"),
+                "response_content": result.get("response_content"),
+            }
+
+
+def _schema(pa, columns):
+    types = {
+        "score": pa.float64(),
+        "created_at": pa.timestamp("us", tz="UTC"),
+        "response_content": pa.string(),
+    }
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([(column, types.get(column, dictionary)) for column in columns])
+
+
+def _record_batch(pa, schema, buffer):
+    arrays = []
+    for field in schema:
+        values = buffer[field.name]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        elif pa.types.is_timestamp(field.type):
+            # ISO 8601 字符串（带 Z 时区）由 Arrow 直接解析
+            arrays.append(pa.array(values, type=pa.string()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """
+    pyarrow 写出目标：写入的字节暂存，由生成器在每个行组写完后取走
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def columnar_export_stream(rows, export_format="parquet", columns=None, row_group_size=ROW_GROUP_SIZE):
+    """
+    将长表的行写为 Parquet 或 Arrow IPC 流，逐个行组输出字节
+
+    Args:
+        rows: iter_metric_rows 产生的行
+        export_format: parquet 或 arrow（IPC流格式，支持各批次使用不同的字典）
+        columns: 导出的列，为空时使用默认列
+        row_group_size: 每个行组（记录批次）的行数
+
+    Yields:
+        字节块
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if export_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"不支持的列式格式: {export_format}")
+    columns = check_columns(columns)
+    schema = _schema(pa, columns)
+    sink = _ChunkSink()
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(
+            sink, schema, compression="zstd",
+            use_dictionary=[column for column in columns if column in DICTIONARY_COLUMNS]
+        )
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]), row_group_size=batch.num_rows)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    buffer = {column: [] for column in columns}
+    count = 0
+    try:
+        for row in rows:
+            for column in columns:
+                buffer[column].append(row.get(column))
+            count += 1
+            if count >= row_group_size:
+                write(_record_batch(pa, schema, buffer))
+                buffer = {column: [] for column in columns}
+                count = 0
+                yield sink.drain()
+        if count:
+            write(_record_batch(pa, schema, buffer))
+    finally:
+        writer.close()
+    yield sink.drain()
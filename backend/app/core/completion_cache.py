@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# 大模型补全结果缓存：内存LRU + 磁盘两级，按模型、消息与采样参数的哈希寻址
+
+
+class CompletionCache:
+    """
+    两级补全缓存
+
+    内存层为有界LRU，命中时毫秒级返回；磁盘层按键的前两位分目录存放JSON文件，
+    进程重启后仍然有效，超过TTL的条目视为未命中，总大小超限时按最近访问时间淘汰
+    """
+
+    def __init__(
+        self,
+        cache_dir=os.getenv("COMPLETION_CACHE_DIR", "cache/completions"),
+        max_memory_entries=512,
+        max_disk_bytes=256 * 1024 * 1024,
+        ttl_seconds=7 * 24 * 3600,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 磁盘缓存目录
+            max_memory_entries: 内存层最多保留的条目数
+            max_disk_bytes: 磁盘层总大小上限（字节）
+            ttl_seconds: 条目有效期（秒）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (写入时间, 结果)
+        self._lock = threading.Lock()
+        self._disk_bytes = None       # 磁盘层当前大小，首次写入时统计
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(payload, provider=""):
+        """
+        计算请求的缓存键：模型、消息与全部采样参数的SHA-256，与是否流式无关
+        """
+        material = {k: v for k, v in payload.items() if k != "stream"}
+        material["_provider"] = provider
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get_memory(self, key):
+        """
+        只查询内存层，未命中返回 None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return value
+
+    def get_disk(self, key):
+        """
+        查询磁盘层，命中后提升到内存层；未命中或已过期返回 None 并计入未命中次数
+        """
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # 刷新访问时间，淘汰时按最近使用排序
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        self._remember(key, value)
+        return value
+
+    def get(self, key):
+        """
+        依次查询内存层与磁盘层
+        """
+        value = self.get_memory(key)
+        if value is None:
+            value = self.get_disk(key)
+        return value
+
+    def set(self, key, value):
+        """
+        写入两级缓存，磁盘写入先写临时文件再原子替换
+        """
+        self._remember(key, value)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats["writes"] += 1
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data)
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = (time.time(), value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _scan_disk_bytes(self):
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*/*.json"))
+
+    def _evict_disk(self):
+        """
+        删除过期条目，并按最近访问时间从旧到新删除，直到总大小降到上限的九成
+        """
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_disk_bytes * 0.9)
+        now = time.time()
+        evicted = 0
+        for mtime, size, path in entries:
+            if total <= target and now - mtime <= self.ttl_seconds:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.stats["evictions"] += evicted
+
+    def get_stats(self):
+        """
+        返回命中/未命中计数与当前各层大小
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,275 @@
+import csv
+import io
+import json
+import re
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+from app.core.serialization import dumps
+
+# 数据导出：逐条编码为 JSON / NDJSON / CSV / XLSX，可选gzip压缩，全程以生成器输出字节，内存占用与导出条数无关
+
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# 表格格式（CSV/XLSX）各数据类型导出的列，数组与对象字段以JSON字符串写入单元格
+EXPORT_COLUMNS = {
+    "questions": ["id", "type", "content", "options", "answer", "document_id", "tags", "source", "created_at"],
+    "documents": ["id", "name", "content_hash", "size", "upload_time", "total_questions"],
+    "evaluation_results": [
+        "id", "evaluation_id", "model_id", "question_id", "response_content", "score", "metrics_scores", "extracted_answer",
+    ],
+}
+
+# 累积到该字节数后再向外输出一块，避免逐行输出过多的小块
+FLUSH_BYTES = 64 * 1024
+
+# XLSX 单个工作表的最大行数（含表头），超出后写入下一个工作表
+XLSX_MAX_ROWS = 1048576
+# XLSX 单元格文本的最大长度
+XLSX_MAX_CELL_CHARS = 32767
+# XML 1.0 不允许的控制字符
+_XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell_value(value):
+    """
+    表格单元格的值：数组与对象转为JSON字符串，None 为空
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _buffered(chunks):
+    """
+    合并小块输出，每次至少输出 FLUSH_BYTES 字节
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= FLUSH_BYTES:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def encode_json(data_type, rows):
+    """
+    编码为 {"data_type": ..., "items": [...]}，与 /export 接口的返回结构一致
+    """
+    yield f'{{"data_type": {json.dumps(data_type)}, "items": ['.encode("utf-8")
+    for i, row in enumerate(rows):
+        yield (b",\n" if i else b"\n") + dumps(row)
+    yield b"\n]}\n"
+
+
+def encode_ndjson(data_type, rows):
+    """
+    编码为NDJSON，每行一条记录
+    """
+    for row in rows:
+        yield dumps(row) + b"\n"
+
+
+def encode_csv(data_type, rows):
+    """
+    编码为CSV，带BOM以便Excel正确识别UTF-8中文
+    """
+    columns = EXPORT_COLUMNS[data_type]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_cell_value(row.get(column)) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ZipPipe:
+    """
+    zipfile 的输出目标：只支持写入，写入的字节暂存后由生成器取走。
+    没有 tell/seek，zipfile 会以流式模式（数据描述符）写入，不需要回填文件头
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _column_name(index):
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _xlsx_cell(reference, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        text = _XML_ILLEGAL.sub("", str(value))[:XLSX_MAX_CELL_CHARS]
+        return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+    return f'<c r="{reference}"><v>{value!r}</v></c>'
+
+
+def _xlsx_row(number, values):
+    cells = "".join(
+        _xlsx_cell(f"{_column_name(i)}{number}", value) for i, value in enumerate(values) if value != ""
+    )
+    return f'<row r="{number}">{cells}</row>'.encode("utf-8")
+
+
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+).encode("utf-8")
+_XLSX_SHEET_TAIL = b"</sheetData></worksheet>"
+
+
+def _xlsx_package_parts(num_sheets):
+    """
+    工作簿的其余部件，工作表数量确定后最后写入
+    """
+    sheets = range(1, num_sheets + 1)
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in sheets
+        )
+        + '</Types>'
+    )
+    root_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        + "".join(f'<sheet name="Sheet{i}" sheetId="{i}" r:id="rId{i}"/>' for i in sheets)
+        + '</sheets></workbook>'
+    )
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(
+            f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>'
+            for i in sheets
+        )
+        + '</Relationships>'
+    )
+    return {
+        "[Content_Types].xml": content_types,
+        "_rels/.rels": root_rels,
+        "xl/workbook.xml": workbook,
+        "xl/_rels/workbook.xml.rels": workbook_rels,
+    }
+
+
+def encode_xlsx(data_type, rows):
+    """
+    编码为XLSX：工作表XML逐行写入流式ZIP，单元格使用内联字符串，不需要先收集全部数据。
+    行数超过单个工作表上限时自动续写到下一个工作表，每个工作表都带表头
+    """
+    columns = EXPORT_COLUMNS[data_type]
+    pipe = _ZipPipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        num_sheets = 0
+        sheet = None
+        row_number = XLSX_MAX_ROWS
+        for row in rows:
+            if row_number >= XLSX_MAX_ROWS:
+                if sheet is not None:
+                    sheet.write(_XLSX_SHEET_TAIL)
+                    sheet.close()
+                num_sheets += 1
+                sheet = archive.open(f"xl/worksheets/sheet{num_sheets}.xml", "w", force_zip64=True)
+                sheet.write(_XLSX_SHEET_HEAD)
+                sheet.write(_xlsx_row(1, columns))
+                row_number = 1
+            row_number += 1
+            sheet.write(_xlsx_row(row_number, [_cell_value(row.get(column)) for column in columns]))
+            yield pipe.drain()
+        if sheet is None:
+            num_sheets = 1
+            sheet = archive.open("xl/worksheets/sheet1.xml", "w")
+            sheet.write(_XLSX_SHEET_HEAD)
+            sheet.write(_xlsx_row(1, columns))
+        sheet.write(_XLSX_SHEET_TAIL)
+        sheet.close()
+        for name, content in _xlsx_package_parts(num_sheets).items():
+            archive.writestr(name, content)
+    yield pipe.drain()
+
+
+_ENCODERS = {
+    "json": encode_json,
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "xlsx": encode_xlsx,
+}
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    对字节流做gzip压缩，逐块输出
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(data_type, rows, export_format="json", compress=False):
+    """
+    将记录迭代器编码为指定格式的字节流
+
+    Args:
+        data_type: 数据类型，决定表格格式的列
+        rows: 记录迭代器，通常是数据仓库的游标
+        export_format: json / ndjson / csv / xlsx
+        compress: 是否gzip压缩
+
+    Returns:
+        字节块生成器
+    """
+    if export_format not in _ENCODERS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+    chunks = _buffered(chunk for chunk in _ENCODERS[export_format](data_type, rows) if chunk)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,398 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.core.dedup_index import DEDUP_MODE, PendingDuplicates, get_dedup_index
+from app.core.json_stream import JSONArrayStream
+from app.core.metrics import question_duplicates
+from app.core.repository import COLLECTIONS, get_repository, question_id_for
+
+# 数据导入：JSON数组 / NDJSON / CSV 文件逐条解析、分批校验并批量写入数据仓库，后台执行并可查询进度
+
+IMPORT_FORMATS = {"json", "ndjson", "csv"}
+# 按文件扩展名推断导入格式
+FORMAT_BY_EXTENSION = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+# 默认每批写入的记录数
+DEFAULT_BATCH_SIZE = 1000
+# 每次从文件读取的字符数（JSON数组）
+READ_CHUNK_CHARS = 1024 * 1024
+# 任务中最多保留的错误明细条数，其余只计数
+MAX_REPORTED_ERRORS = 100
+# 内存中最多保留的已结束任务数
+MAX_CACHED_JOBS = 64
+
+# 题目必须包含的字段，均为字符串
+REQUIRED_QUESTION_FIELDS = ("type", "content", "answer")
+# 可写入索引列的标量类型
+SCALAR_TYPES = (str, int, float)
+# CSV 中以JSON字符串保存的字段（与导出一致）与需要转换为数值的字段
+CSV_JSON_FIELDS = {"options", "tags", "metrics_scores"}
+CSV_NUMERIC_FIELDS = {"score": float, "size": int, "total_questions": int}
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+
+
+def prepare_record(data_type, item):
+    """
+    校验并补全一条导入记录：题目检查必填字段，缺少ID时题目按内容哈希生成（与出题时写入题库的ID一致），
+    其他数据随机生成
+
+    Returns:
+        补全后的记录副本
+
+    Raises:
+        ValueError: 记录不合法
+    """
+    if not isinstance(item, dict):
+        raise ValueError("每个条目必须是JSON对象")
+    if data_type == "questions":
+        missing = [field for field in REQUIRED_QUESTION_FIELDS if field not in item]
+        if missing:
+            raise ValueError(f"题目缺少字段: {', '.join(missing)}")
+        invalid = [field for field in REQUIRED_QUESTION_FIELDS if not isinstance(item[field], str)]
+        if invalid:
+            raise ValueError(f"字段必须是字符串: {', '.join(invalid)}")
+        options = item.get("options")
+        if options is not None and not (isinstance(options, list) and all(isinstance(o, str) for o in options)):
+            raise ValueError("字段 options 必须是字符串数组")
+    if item.get("id") is not None and not isinstance(item["id"], (str, int)):
+        raise ValueError("字段 id 必须是字符串或整数")
+    # 索引字段会写入单独的列或关联表，类型不对时整批写入都会失败
+    for field, kind in COLLECTIONS.get(data_type, {}).items():
+        value = item.get(field)
+        if value is None:
+            continue
+        if kind == "scalar" and not isinstance(value, SCALAR_TYPES):
+            raise ValueError(f"字段 {field} 必须是字符串或数值")
+        if kind == "multi" and not (isinstance(value, list) and all(isinstance(v, SCALAR_TYPES) for v in value)):
+            raise ValueError(f"字段 {field} 必须是字符串或数值组成的数组")
+    item = dict(item)
+    if item.get("id") in (None, ""):
+        item["id"] = question_id_for(item) if data_type == "questions" else uuid.uuid4().hex
+    if data_type == "questions":
+        item.setdefault("options", [])
+        item.setdefault("tags", [])
+    return item
+
+
+def screen_duplicate(item, index, pending):
+    """
+    检查导入的题目是否与题库中的题目或同一批次中待写入的题目近似重复，保留的题目加入待写入批次，
+    批次写入成功后由 pending.commit 加入索引
+
+    reject 模式下返回错误信息；flag 模式下在 duplicate_of 字段记录相似题目ID后保留
+
+    Args:
+        item: prepare_record 补全后的题目
+        index: 已加载题库的近似重复索引
+        pending: 本批次待写入的题目（PendingDuplicates）
+
+    Returns:
+        (相似题目ID与相似度, 错误信息)，未重复时均为 None
+    """
+    signature = index.signature(item)
+    match = None
+    if signature is not None:
+        match = index.query(item, exclude_id=item["id"], signature=signature) or pending.query(item["id"], signature)
+    if match is not None:
+        if DEDUP_MODE == "reject":
+            question_duplicates.inc(source="import", action="rejected")
+            return match, f"与题库中的题目 {match[0]} 近似重复（相似度{match[1]}）"
+        question_duplicates.inc(source="import", action="flagged")
+        item["duplicate_of"] = match[0]
+    if signature is not None:
+        pending.add(item["id"], item, signature)
+    return match, None
+
+
+def _question_index(data_type, repository):
+    """
+    导入题目时使用的近似重复索引，不检查时返回 None
+    """
+    if data_type != "questions" or DEDUP_MODE == "off":
+        return None
+    index = get_dedup_index()
+    index.ensure_loaded(repository)
+    return index
+
+
+def import_questions(items, repository=None):
+    """
+    批量导入已补全的题目，近似重复的题目按 DEDUP_MODE 丢弃或标记
+
+    Args:
+        items: prepare_record 补全后的题目列表
+        repository: 数据仓库，默认使用进程内共享的仓库
+
+    Returns:
+        (写入的题目数, 近似重复的题目列表 [{"index", "duplicate_of", "similarity"}])
+    """
+    repository = repository or get_repository()
+    index = _question_index("questions", repository)
+    pending = PendingDuplicates(index) if index is not None else None
+    accepted = []
+    duplicates = []
+    for position, item in enumerate(items):
+        error = None
+        if index is not None:
+            match, error = screen_duplicate(item, index, pending)
+            if match is not None:
+                duplicates.append({"index": position, "duplicate_of": match[0], "similarity": match[1]})
+        if error is None:
+            accepted.append(item)
+    count = repository.bulk_upsert("questions", accepted)
+    if pending is not None:
+        pending.commit()
+    return count, duplicates
+
+
+def _csv_record(row):
+    """
+    将CSV的一行转换为记录：空单元格视为缺失，数组字段按JSON解析，数值字段转换类型
+    """
+    record = {}
+    for field, value in row.items():
+        if field is None or value in (None, ""):
+            continue
+        if field in CSV_JSON_FIELDS and value.lstrip().startswith(("[", "{")):
+            value = json.loads(value)
+        elif field in CSV_NUMERIC_FIELDS:
+            value = CSV_NUMERIC_FIELDS[field](value)
+        record[field] = value
+    return record
+
+
+def iter_records(text_file, import_format):
+    """
+    从文本文件中逐条解析记录
+
+    Yields:
+        (记录, 错误信息)，解析失败时记录为 None
+    """
+    if import_format == "ndjson":
+        for line in text_file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, f"JSON格式错误: {e}"
+    elif import_format == "csv":
+        for row in csv.DictReader(text_file):
+            try:
+                yield _csv_record(row), None
+            except ValueError as e:
+                yield None, f"字段格式错误: {e}"
+    elif import_format == "json":
+        # 顶层可以是记录数组，也可以是导出文件的 {"data_type": ..., "items": [...]} 结构
+        parser = JSONArrayStream(tolerant=False)
+        while not parser.finished:
+            chunk = text_file.read(READ_CHUNK_CHARS)
+            if not chunk:
+                break
+            reported = len(parser.errors)
+            for item in parser.feed(chunk):
+                yield item, None
+            for text in parser.errors[reported:]:
+                yield None, f"JSON格式错误: {text[:100]}"
+            parser.errors.clear()
+        if not parser.started:
+            yield None, "文件中没有找到JSON数组"
+        elif not parser.finished:
+            yield None, "JSON数组不完整，文件可能被截断"
+    else:
+        raise ValueError(f"不支持的导入格式: {import_format}")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class ImportJob:
+    """
+    单个导入任务的进度
+    """
+
+    def __init__(self, job_id, data_type, import_format, filename, total_bytes, batch_size):
+        self.job_id = job_id
+        self.data_type = data_type
+        self.format = import_format
+        self.filename = filename
+        self.total_bytes = total_bytes
+        self.batch_size = batch_size
+        self.status = PENDING
+        self.processed_bytes = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.errors = []
+        self.error = None
+        self.created_at = _now()
+        self.finished_at = None
+        self.task = None
+        self.stop_requested = False
+
+    def reject(self, record_number, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"record": record_number, "error": message})
+
+    def summary(self):
+        return {
+            "job_id": self.job_id,
+            "data_type": self.data_type,
+            "format": self.format,
+            "filename": self.filename,
+            "status": self.status,
+            "total_bytes": self.total_bytes,
+            "processed_bytes": self.processed_bytes,
+            "progress": round(self.processed_bytes / self.total_bytes, 4) if self.total_bytes else 1.0,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def run_import(job, path, repository=None):
+    """
+    在工作线程中执行导入：逐条解析，攒够一批后统一校验并批量写入
+
+    Args:
+        job: ImportJob，进度直接写在任务对象上
+        path: 待导入文件路径
+        repository: 数据仓库，默认使用进程内共享的仓库
+    """
+    repository = repository or get_repository()
+    index = _question_index(job.data_type, repository)
+    pending = PendingDuplicates(index) if index is not None else None
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        try:
+            repository.bulk_upsert(job.data_type, [record for _, record in batch])
+            written = None
+        except Exception:
+            # 整批写入失败时逐条写入，只拒绝写不进去的记录
+            written = set()
+            for record_number, record in batch:
+                try:
+                    repository.bulk_upsert(job.data_type, [record])
+                except Exception as e:
+                    job.reject(record_number, f"写入失败: {e}")
+                else:
+                    written.add(record["id"])
+        job.accepted += len(batch) if written is None else len(written)
+        if pending is not None:
+            pending.commit(written)
+        batch.clear()
+
+    with open(path, "rb") as raw:
+        text_file = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="" if job.format == "csv" else None)
+        for record_number, (record, error) in enumerate(iter_records(text_file, job.format), start=1):
+            if error is None:
+                try:
+                    record = prepare_record(job.data_type, record)
+                except ValueError as e:
+                    error = str(e)
+                else:
+                    if index is not None:
+                        match, error = screen_duplicate(record, index, pending)
+                        job.duplicates += match is not None
+                    if error is None:
+                        batch.append((record_number, record))
+            if error is not None:
+                job.reject(record_number, error)
+            if len(batch) >= job.batch_size:
+                flush()
+                job.processed_bytes = raw.tell()
+                if job.stop_requested:
+                    job.status = INTERRUPTED
+                    return
+        flush()
+    job.processed_bytes = job.total_bytes
+
+
+class ImportJobManager:
+    """
+    导入任务管理器：上传文件落盘后立即返回任务ID，解析与写入在工作线程中进行
+    """
+
+    def __init__(self):
+        self._jobs = {}
+
+    def submit(self, path, data_type, import_format, filename, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        提交导入任务，任务结束后删除导入文件
+
+        Args:
+            path: 已落盘的上传文件路径
+            data_type: 数据类型（集合名称）
+            import_format: json / ndjson / csv
+            filename: 原始文件名
+            batch_size: 每批写入的记录数
+
+        Returns:
+            ImportJob
+        """
+        job = ImportJob(f"import-{uuid.uuid4().hex[:16]}", data_type, import_format, filename,
+                        os.path.getsize(path), batch_size)
+        self._jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job, path))
+        return job
+
+    async def _run(self, job, path):
+        job.status = RUNNING
+        try:
+            await asyncio.to_thread(run_import, job, path)
+            if job.status == RUNNING:
+                job.status = COMPLETED
+        except UnicodeDecodeError:
+            job.status = FAILED
+            job.error = "文件编码不是UTF-8"
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = _now()
+            Path(path).unlink(missing_ok=True)
+            self._trim()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.task is not None and job.task.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_CACHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        获取任务，不存在时返回 None
+        """
+        return self._jobs.get(job_id)
+
+    async def shutdown(self):
+        """
+        通知运行中的任务在当前批次写完后停止，在应用退出时调用
+        """
+        running = [job for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for job in running:
+            job.stop_requested = True
+        await asyncio.gather(*[job.task for job in running], return_exceptions=True)
+
+
+# 进程内共享的导入任务管理器
+import_jobs = ImportJobManager()
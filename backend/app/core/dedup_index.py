@@ -0,0 +1,364 @@
+import os
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from app.core.metrics import metrics
+
+# 近似重复题目索引：题干与选项切分为字符n-gram，计算MinHash签名后按LSH分段入桶，
+# 新题目只与同桶的候选比较签名，查询耗时与题库规模基本无关；题目写入题库时增量更新。
+# 选项相同、题干只差一两个关键词的题目（如“定义函数”与“定义类”）整体相似度很高，
+# 因此题干另有一份签名，题干本身也足够相似才算重复
+
+# 近似重复的处理方式：flag 照常保存并在 duplicate_of 字段记录相似的题目ID，
+# reject 丢弃（出题时为缺少的数量追加调用，导入时计为不合法记录），off 不检查
+DEDUP_MODE = os.getenv("DEDUP_MODE", "flag")
+# 题干加选项的估计Jaccard相似度达到该值，且题干的相似度达到 DEDUP_STEM_THRESHOLD 时视为近似重复
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+DEDUP_STEM_THRESHOLD = float(os.getenv("DEDUP_STEM_THRESHOLD", "0.9"))
+# 字符n-gram长度，中文按字切分，不依赖分词
+SHINGLE_SIZE = 3
+# MinHash签名长度与LSH分段数：每段 NUM_PERM / NUM_BANDS 个值，
+# 相似度 0.7 的题目约 92% 至少有一段落入同一个桶，0.8 的超过 99.9%，0.3 以下的很少成为候选
+NUM_PERM = 120
+NUM_BANDS = 20
+# 新增条目先放在字典中，累计到该数量（或已合并条目的四分之一）后并入有序数组
+MERGE_SIZE = 65536
+
+_SHIFT = np.uint64(32)
+# 比较签名前先去掉的内容：空白、标点，以及选项前的字母标记
+_NON_WORD = re.compile(r"[\s\W_]+")
+_OPTION_PREFIX = re.compile(r"^\s*[\(（]?[A-Da-d][\.．、\)）:：]\s*")
+
+
+def _normalize(text):
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", str(text or "")).lower())
+
+
+def shingles(question, size=SHINGLE_SIZE, stem_only=False):
+    """
+    题目的字符n-gram集合：题干与各选项分别规范化（去空白、标点与选项字母）后切分
+
+    Args:
+        question: 题目字典
+        size: n-gram 长度
+        stem_only: 只切分题干
+
+    Returns:
+        n-gram 集合，题干与选项都为空时为空集合
+    """
+    parts = [_normalize(question.get("content"))]
+    if not stem_only:
+        parts.extend(_normalize(_OPTION_PREFIX.sub("", str(option))) for option in question.get("options") or [])
+    result = set()
+    for part in parts:
+        if len(part) <= size:
+            if part:
+                result.add(part)
+            continue
+        result.update(part[i:i + size] for i in range(len(part) - size + 1))
+    return result
+
+
+class NearDuplicateIndex:
+    """
+    基于 MinHash/LSH 的近似重复题目索引
+
+    每道题目保存题干加选项、以及只有题干的两个16位截断MinHash签名（用于估计相似度），
+    与按前者计算的每段一个64位桶键（各段的键互不相同）。
+    桶键存放在一个按键排序的数组中，一次向量化二分查找得到全部候选；新增条目先进字典，批量并入有序数组，
+    百万量级题库每道题约占 0.8KB 内存，单次查询在亚毫秒级。
+
+    索引只在当前进程内维护，首次使用时从题库加载；多个工作进程各自维护一份
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM, num_bands=NUM_BANDS, shingle_size=SHINGLE_SIZE, seed=1,
+                 stem_threshold=DEDUP_STEM_THRESHOLD):
+        """
+        初始化空索引
+
+        Args:
+            threshold: 视为近似重复的相似度（题干加选项）下限
+            num_perm: MinHash签名长度，需为 num_bands 的整数倍
+            num_bands: LSH分段数
+            shingle_size: 字符n-gram长度
+            seed: 哈希函数的随机种子，同一份索引必须使用同一个种子
+            stem_threshold: 视为近似重复的题干相似度下限
+        """
+        if num_perm % num_bands:
+            raise ValueError("num_perm 必须是 num_bands 的整数倍")
+        self.threshold = threshold
+        self.stem_threshold = stem_threshold
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # multiply-shift 哈希：((a * x + b) mod 2^64) >> 32，x 为32位，按 2^64 取模即 uint64 自然溢出
+        self._a = rng.randint(1, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        # 把一段签名合成为一个桶键的乘数（奇数），每段另加一个偏移，不同段的相同取值不会落入同一个桶
+        self._band_multipliers = rng.randint(1, 1 << 62, size=num_perm // num_bands, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._band_offsets = rng.randint(0, 1 << 63, size=num_bands, dtype=np.uint64)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._ids = []
+        self._rows = {}
+        self._signatures = np.empty((0, num_perm), dtype=np.uint16)
+        self._stem_signatures = np.empty((0, num_perm), dtype=np.uint16)
+        self._alive = np.empty(0, dtype=bool)
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._recent = {}
+        self._pending_keys = []
+        self._pending_rows = []
+        self.stats = {"queries": 0, "candidates": 0, "matches": 0}
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _minhash(self, grams):
+        if not grams:
+            # 没有题干的题目彼此视为题干相同，只按选项比较
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams)
+        )
+        return ((np.outer(hashes, self._a) + self._b) >> _SHIFT).min(axis=0)
+
+    def signature(self, question):
+        """
+        计算题目的MinHash签名
+
+        Returns:
+            (签名, 各段桶键, 题干签名)，题目没有可比较的文本时返回 None
+        """
+        grams = shingles(question, self.shingle_size)
+        if not grams:
+            return None
+        values = self._minhash(grams)
+        keys = (values.reshape(self.num_bands, -1) * self._band_multipliers).sum(axis=1) + self._band_offsets
+        stem_values = self._minhash(shingles(question, self.shingle_size, stem_only=True))
+        return values.astype(np.uint16), keys, stem_values.astype(np.uint16)
+
+    def is_match(self, similarity, stem_similarity):
+        """
+        整体与题干的相似度是否都达到阈值
+        """
+        return similarity >= self.threshold and stem_similarity >= self.stem_threshold
+
+    def query(self, question, exclude_id=None, signature=None):
+        """
+        查找与题目最相似的已有题目
+
+        Args:
+            question: 题目字典，使用 content 与 options
+            exclude_id: 忽略该ID（题目自身已在题库中时）
+            signature: 已计算好的签名，省略时按题目计算
+
+        Returns:
+            (题目ID, 估计相似度)，没有达到阈值的题目时返回 None
+        """
+        signature = signature or self.signature(question)
+        if signature is None:
+            return None
+        values, keys, stem_values = signature
+        with self._lock:
+            self.stats["queries"] += 1
+            found = []
+            starts = np.searchsorted(self._sorted_keys, keys, side="left")
+            ends = np.searchsorted(self._sorted_keys, keys, side="right")
+            for start, end in zip(starts[starts < ends], ends[starts < ends]):
+                found.append(self._sorted_rows[start:end])
+            if self._recent:
+                for key in keys.tolist():
+                    recent = self._recent.get(key)
+                    if recent:
+                        found.append(np.asarray(recent, dtype=np.int64))
+            if not found:
+                return None
+            rows = np.unique(np.concatenate(found))
+            rows = rows[self._alive[rows]]
+            if exclude_id is not None and exclude_id in self._rows:
+                rows = rows[rows != self._rows[exclude_id]]
+            if not len(rows):
+                return None
+            self.stats["candidates"] += len(rows)
+            similarity = (self._signatures[rows] == values).mean(axis=1)
+            stem_similarity = (self._stem_signatures[rows] == stem_values).mean(axis=1)
+            similarity[(similarity < self.threshold) | (stem_similarity < self.stem_threshold)] = -1
+            best = int(similarity.argmax())
+            if similarity[best] < 0:
+                return None
+            self.stats["matches"] += 1
+            return self._ids[rows[best]], round(float(similarity[best]), 4)
+
+    def add(self, question_id, question, signature=None):
+        """
+        将题目加入索引，同一ID重复加入时替换为新内容
+
+        Args:
+            question_id: 题库中的题目ID
+            question: 题目字典
+            signature: 已计算好的签名，省略时按题目计算
+        """
+        signature = signature or self.signature(question)
+        if signature is None:
+            return
+        values, keys, stem_values = signature
+        with self._lock:
+            old = self._rows.get(question_id)
+            if old is not None:
+                if np.array_equal(self._signatures[old], values) and np.array_equal(self._stem_signatures[old], stem_values):
+                    return
+                self._alive[old] = False
+            row = len(self._ids)
+            if row >= len(self._signatures):
+                capacity = max(1024, 2 * len(self._signatures))
+                self._signatures = np.resize(self._signatures, (capacity, self.num_perm))
+                self._stem_signatures = np.resize(self._stem_signatures, (capacity, self.num_perm))
+                self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+            self._signatures[row] = values
+            self._stem_signatures[row] = stem_values
+            self._alive[row] = True
+            self._ids.append(question_id)
+            self._rows[question_id] = row
+            for key in keys.tolist():
+                self._recent.setdefault(key, []).append(row)
+            self._pending_keys.append(keys)
+            self._pending_rows.append(row)
+            if len(self._pending_rows) >= max(MERGE_SIZE, len(self._sorted_keys) // self.num_bands // 4):
+                self._merge()
+
+    def _merge(self):
+        """
+        把字典中的新增条目并入有序数组
+        """
+        keys = np.concatenate([self._sorted_keys, np.concatenate(self._pending_keys)])
+        rows = np.concatenate([self._sorted_rows, np.repeat(np.asarray(self._pending_rows, dtype=np.int64), self.num_bands)])
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._sorted_rows = rows[order]
+        self._recent.clear()
+        self._pending_keys = []
+        self._pending_rows = []
+
+    def ensure_loaded(self, repository):
+        """
+        首次使用时把题库中的全部题目加入索引，之后直接返回
+
+        加载期间写入的题目由 add 直接加入，重复加入同一ID不会产生重复条目
+
+        Args:
+            repository: 数据仓库，需提供 iter_find
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for question in repository.iter_find("questions"):
+                self.add(question["id"], question)
+            self._loaded = True
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "size": len(self._rows)}
+
+
+class PendingDuplicates:
+    """
+    已通过检查、尚未写入题库的一批题目
+
+    同一批次中后出现的题目也与这些题目比较签名（按LSH桶取候选），批次写入成功后再调用 commit 加入索引，
+    写入失败的题目不会留在索引中
+    """
+
+    def __init__(self, index):
+        """
+        Args:
+            index: 批次写入后要加入的近似重复索引
+        """
+        self.index = index
+        self._entries = {}
+        self._buckets = {}
+
+    def query(self, question_id, signature):
+        """
+        查找批次中与题目最相似的其他题目
+
+        Returns:
+            (题目ID, 估计相似度)，没有达到阈值的题目时返回 None
+        """
+        values, keys, stem_values = signature
+        candidates = {
+            candidate for key in keys.tolist() for candidate in self._buckets.get(key, ()) if candidate != question_id
+        }
+        best = None
+        for candidate in candidates:
+            other = self._entries[candidate][1]
+            similarity = float((other[0] == values).mean())
+            stem_similarity = float((other[2] == stem_values).mean())
+            if self.index.is_match(similarity, stem_similarity) and (best is None or similarity > best[1]):
+                best = (candidate, round(similarity, 4))
+        return best
+
+    def add(self, question_id, question, signature):
+        if question_id not in self._entries:
+            for key in signature[1].tolist():
+                self._buckets.setdefault(key, []).append(question_id)
+        self._entries[question_id] = (question, signature)
+
+    def commit(self, question_ids=None):
+        """
+        把已写入题库的题目加入索引并清空批次
+
+        Args:
+            question_ids: 写入成功的题目ID，默认为批次中的全部题目
+        """
+        for question_id, (question, signature) in self._entries.items():
+            if question_ids is None or question_id in question_ids:
+                self.index.add(question_id, question, signature)
+        self._entries.clear()
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 进程内共享的索引
+_dedup_index = None
+_dedup_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """
+    获取进程内共享的近似重复索引，首次使用前需调用 ensure_loaded 加载题库
+    """
+    global _dedup_index
+    with _dedup_index_lock:
+        if _dedup_index is None:
+            _dedup_index = NearDuplicateIndex()
+        return _dedup_index
+
+
+@metrics.register_collector
+def _collect_dedup_stats():
+    """
+    采集近似重复索引的规模与查询统计
+    """
+    if _dedup_index is None:
+        return []
+    stats = _dedup_index.get_stats()
+    return [
+        ("dedup_index_questions", "gauge", "近似重复索引中的题目数", [({}, stats["size"])]),
+        ("dedup_index_queries_total", "counter", "近似重复查询次数", [({}, stats["queries"])]),
+        ("dedup_index_candidates_total", "counter", "LSH返回并比较签名的候选题目数", [({}, stats["candidates"])]),
+        ("dedup_index_matches_total", "counter", "查到近似重复题目的次数", [({}, stats["matches"])]),
+    ]
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# 文档处理模块：上传文件分块落盘，文本提取与语义分块在进程池中完成
+
+# 上传文件每次读取并写入临时文件的块大小
+SPOOL_CHUNK_SIZE = 1024 * 1024
+# 临时文件目录，默认使用系统临时目录
+SPOOL_DIR = os.getenv("DOCUMENT_SPOOL_DIR") or None
+# 单个文本块的最大字符数
+MAX_CHUNK_CHARS = 1500
+# 支持解析的文件类型
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".md"}
+
+# 中英文句末标点，超长段落在这些位置切分
+_SENTENCE_END = re.compile(r"(?<=[。！？；.!?;])\s*")
+
+
+async def spool_upload(upload_file, chunk_size=SPOOL_CHUNK_SIZE):
+    """
+    将上传文件按块写入临时文件，内存中最多只保留一个块，同时计算内容哈希
+
+    Args:
+        upload_file: FastAPI 的 UploadFile
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        (临时文件路径, 文件大小, 内容的SHA-256)
+    """
+    suffix = Path(upload_file.filename or "").suffix.lower()
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=SPOOL_DIR)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload_file.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def chunk_hash(chunk):
+    """
+    文本块的内容哈希，忽略首尾空白
+    """
+    return hashlib.sha256(chunk.strip().encode("utf-8")).hexdigest()
+
+
+def _extract_pdf(path):
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _extract_docx(path):
+    import docx
+
+    document = docx.Document(path)
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+
+
+def _extract_text_file(path):
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            with open(path, "r", encoding=encoding) as f:
+                for line in f:
+                    yield line
+            return
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("无法识别文本文件编码")
+
+
+def extract_paragraphs(path, filename):
+    """
+    按文件类型逐段提取文本，PDF逐页、DOCX逐段、TXT逐行读取，不会一次性载入整个文件
+
+    Args:
+        path: 文件路径
+        filename: 原始文件名，用于判断文件类型
+
+    Yields:
+        文本段落
+    """
+    extension = Path(filename or path).suffix.lower()
+    if extension == ".pdf":
+        pages = _extract_pdf(path)
+    elif extension == ".docx":
+        pages = _extract_docx(path)
+    elif extension in (".txt", ".md"):
+        pages = _extract_text_file(path)
+    else:
+        raise ValueError(f"不支持的文件类型: {extension}")
+    for page in pages:
+        for paragraph in re.split(r"\n\s*\n|\r\n\s*\r\n", page):
+            paragraph = paragraph.strip()
+            if paragraph:
+                yield paragraph
+
+
+def split_into_chunks(paragraphs, max_chars=MAX_CHUNK_CHARS):
+    """
+    语义分块：按段落累积到 max_chars，超长段落再按句子切分
+
+    Args:
+        paragraphs: 段落迭代器，也可以直接传入整段文本
+        max_chars: 单个文本块的最大字符数
+
+    Returns:
+        文本块列表
+    """
+    if isinstance(paragraphs, str):
+        paragraphs = [p for p in re.split(r"\n\s*\n", paragraphs) if p.strip()]
+    chunks = []
+    current = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        current_len = 0
+
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if len(paragraph) > max_chars:
+            pieces = [s for s in _SENTENCE_END.split(paragraph) if s]
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            while len(piece) > max_chars:
+                # 没有标点的超长句子直接按长度截断
+                flush()
+                chunks.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            if current_len + len(piece) > max_chars:
+                flush()
+            current.append(piece)
+            current_len += len(piece)
+        if len(paragraph) > max_chars:
+            flush()
+    flush()
+    return chunks
+
+
+def process_document(path, filename, max_chars=MAX_CHUNK_CHARS):
+    """
+    提取文本并分块，供进程池调用
+
+    Returns:
+        文本块列表
+    """
+    return split_into_chunks(extract_paragraphs(path, filename), max_chars)
+
+
+# 文档解析进程池，CPU密集的PDF解析不占用事件循环所在的进程
+_process_pool = None
+
+
+def get_process_pool():
+    """
+    获取文档解析进程池
+    """
+    global _process_pool
+    if _process_pool is None:
+        workers = int(os.getenv("DOCUMENT_WORKERS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """
+    关闭文档解析进程池，在应用退出时调用
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+async def parse_document(path, filename, max_chars=MAX_CHUNK_CHARS):
+    """
+    在进程池中解析文档并分块
+
+    Args:
+        path: 临时文件路径
+        filename: 原始文件名
+        max_chars: 单个文本块的最大字符数
+
+    Returns:
+        文本块列表
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), process_document, path, filename, max_chars)
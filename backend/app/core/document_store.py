@@ -0,0 +1,150 @@
+import threading
+
+from app.core.repository import get_repository
+
+# 文档存储：文档与文本块均按内容哈希寻址，支持重复上传直接命中、修改后只为变化的文本块重新出题
+
+
+def document_id_for(content_hash):
+    """
+    根据文件内容哈希生成稳定的文档ID
+    """
+    return f"doc-{content_hash[:16]}"
+
+
+class DocumentStore:
+    """
+    基于数据仓库的文档存储
+
+    documents 集合中每个文档一条记录，包含文件信息、文本块哈希与各出题参数下的解析结果；
+    chunk_questions 集合按文本块哈希与题目类型存放该文本块已生成的题目，供内容相同的文本块复用
+    """
+
+    def __init__(self, repository=None):
+        """
+        初始化存储
+
+        Args:
+            repository: 数据仓库，默认使用进程内共享的仓库
+        """
+        self._repository = repository
+        self._lock = threading.Lock()
+
+    @property
+    def repository(self):
+        return self._repository or get_repository()
+
+    @staticmethod
+    def analysis_key(question_type, num_questions, topic=None):
+        key = f"{question_type}:{num_questions}"
+        return f"{key}:{topic}" if topic else key
+
+    def get_document(self, document_id):
+        """
+        按文档ID读取文档记录，不存在时返回 None
+        """
+        return self.repository.get("documents", document_id)
+
+    def get_analysis(self, content_hash, question_type, num_questions, topic=None):
+        """
+        查询同一内容在相同出题参数（含主题）下的解析结果，不存在时返回 None
+        """
+        document = self.get_document(document_id_for(content_hash))
+        if document is None:
+            return None
+        return document["analyses"].get(self.analysis_key(question_type, num_questions, topic))
+
+    def save_analysis(self, content_hash, name, upload_time, size, chunk_hashes, question_type, num_questions, questions, topic=None):
+        """
+        保存文档记录及一次解析结果，同一文档的其他解析结果保留
+        """
+        document_id = document_id_for(content_hash)
+        with self._lock:
+            document = self.get_document(document_id) or {
+                "id": document_id,
+                "name": name,
+                "content_hash": content_hash,
+                "size": size,
+                "upload_time": upload_time,
+                "chunk_hashes": chunk_hashes,
+                "analyses": {},
+            }
+            document["analyses"][self.analysis_key(question_type, num_questions, topic)] = {
+                "question_type": question_type,
+                "num_questions": num_questions,
+                "topic": topic,
+                "questions": questions,
+            }
+            document["total_questions"] = max(len(a["questions"]) for a in document["analyses"].values())
+            self.repository.bulk_upsert("documents", [document])
+        return document
+
+    def list_documents(self, limit=None, after=None):
+        """
+        列出文档的摘要信息，按上传时间倒序
+
+        Args:
+            limit: 每页文档数，为 None 时返回全部文档
+            after: 上一页返回的排序键
+
+        Returns:
+            (摘要列表, 下一页的排序键)，没有下一页时排序键为 None
+        """
+        if limit is None:
+            documents, next_after = self.repository.find("documents", order_by="upload_time", descending=True), None
+        else:
+            documents, next_after = self.repository.find_page(
+                "documents", limit=limit, after=after, order_by="upload_time", descending=True
+            )
+        return [
+            {
+                "id": document["id"],
+                "name": document["name"],
+                "upload_time": document["upload_time"],
+                "total_questions": document.get("total_questions", 0),
+            }
+            for document in documents
+        ], next_after
+
+    @staticmethod
+    def _chunk_key(chunk_hash, question_type):
+        return f"{chunk_hash}:{question_type}"
+
+    def get_chunk_questions(self, chunk_hash, question_type):
+        """
+        读取文本块已生成的题目，没有时返回空列表
+        """
+        record = self.repository.get("chunk_questions", self._chunk_key(chunk_hash, question_type))
+        return record["questions"] if record else []
+
+    def get_chunk_questions_many(self, chunk_hashes, question_type):
+        """
+        批量读取多个文本块已生成的题目，一次查询返回
+
+        Returns:
+            文本块哈希到题目列表的字典，没有题目的文本块不在其中
+        """
+        keys = [self._chunk_key(h, question_type) for h in chunk_hashes]
+        return {
+            record["chunk_hash"]: record["questions"]
+            for record in self.repository.find_by_ids("chunk_questions", keys)
+        }
+
+    def save_chunk_questions(self, chunk_hash, question_type, questions):
+        """
+        保存文本块生成的题目，已有题目更多时保留已有题目
+        """
+        with self._lock:
+            existing = self.get_chunk_questions(chunk_hash, question_type)
+            if len(existing) >= len(questions):
+                return
+            self.repository.bulk_upsert("chunk_questions", [{
+                "id": self._chunk_key(chunk_hash, question_type),
+                "chunk_hash": chunk_hash,
+                "question_type": question_type,
+                "questions": questions,
+            }])
+
+
+# 进程内共享的文档存储
+document_store = DocumentStore()
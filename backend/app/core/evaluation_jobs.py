@@ -0,0 +1,594 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.checkpoint import CHECKPOINT_COMPACT_SIZE, CheckpointLog, RunLock
+from app.core.llm_client import get_llm_client
+from app.core.metrics import evaluation_checkpoint
+from app.core.repository import get_repository
+from app.core.score_aggregation import ScoreTable, aggregate_scores
+from app.core.scoring import score_response
+
+# 评测任务引擎：/evaluate 只负责提交任务，模型调用由后台工作协程并发执行，每道题的结果完成即写入检查点日志；
+# 进程重启或重新部署后未结束的任务从检查点继续，已完成的题目不再调用模型
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# 所有评测任务共享的模型调用并发数
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "16"))
+# 内存中最多保留的已结束任务数，更早的任务查询时从磁盘加载
+MAX_CACHED_JOBS = 64
+# 任务运行中重新计算汇总得分（含bootstrap置信区间）的最短间隔（秒），期间查询返回上一次的汇总结果
+EVALUATION_AGGREGATE_INTERVAL = float(os.getenv("EVALUATION_AGGREGATE_INTERVAL", "2"))
+# 应用启动时是否自动继续上次未结束（运行中或被中断）的任务
+EVALUATION_AUTO_RESUME = os.getenv("EVALUATION_AUTO_RESUME", "1").lower() in ("1", "true", "yes")
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"  # 进程重启时仍未完成的任务
+
+_EVALUATION_ID = re.compile(r"^eval-[0-9a-f]{16}$")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def checkpoint_key(model_id, question_id):
+    """
+    一道题结果的幂等键，同一任务中同一模型对同一道题只记录一次
+    """
+    return f"{model_id}:{question_id}"
+
+
+def _record_key(record):
+    return checkpoint_key(record["model_id"], record["question_id"])
+
+
+def build_question_messages(question):
+    """
+    将题目转换为发送给被测模型的对话消息
+    """
+    lines = [question.get("content", "")]
+    lines.extend(question.get("options", []))
+    return [{"role": "user", "content": "\n".join(lines)}]
+
+
+def _has_content(result):
+    """
+    补全缓存的写入条件：回复内容为非空字符串
+    """
+    try:
+        content = result["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return False
+    return isinstance(content, str) and bool(content.strip())
+
+
+async def answer_question(model_id, question_id, question, use_cache=True, metrics=("accuracy",)):
+    """
+    调用被测模型回答单道题目并按各指标打分，调用失败时记录错误信息而不中断整个评测
+
+    选择题的 accuracy 在本地判分，其余指标由评审模型批量评审，见 app.core.scoring
+
+    Returns:
+        包含 question_id、model_id、response_content、score（各指标均值）、metrics_scores、
+        extracted_answer、answered_at 的字典
+    """
+    try:
+        content = await get_llm_client().chat(
+            model_id, build_question_messages(question), use_cache=use_cache, validate=_has_content
+        )
+        if not isinstance(content, str):
+            raise ValueError("模型返回的内容为空")
+        metrics_scores, choice = await score_response(question, content, metrics)
+    except Exception as e:
+        # 网络错误、非JSON响应、响应缺少字段等都只记为本题失败，不影响其他题目
+        content = f"模型调用失败: {str(e)}"
+        metrics_scores, choice = {metric: None for metric in metrics}, None
+    values = [value for value in metrics_scores.values() if value is not None]
+    return {
+        "question_id": question_id,
+        "model_id": model_id,
+        "response_content": content,
+        "score": round(sum(values) / len(values), 4) if values else None,
+        "metrics_scores": metrics_scores,
+        "extracted_answer": choice,
+        "answered_at": _now(),
+    }
+
+
+@dataclass(slots=True)
+class ResponseRecord:
+    """
+    一道题的评测结果
+
+    大规模评测的结果在内存中以 slots 对象保存，比每条一个字典省内存，且可由 orjson 直接编码
+    """
+    question_id: str
+    model_id: str
+    response_content: str
+    score: Optional[float] = None
+    metrics_scores: Dict[str, Optional[float]] = field(default_factory=dict)
+    extracted_answer: Optional[str] = None
+    answered_at: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        由 answer_question 的结果或 results.jsonl 中的一行构造，早期结果缺少的字段取默认值
+        """
+        return cls(**{name: data[name] for name in RESPONSE_FIELDS if data.get(name) is not None})
+
+    def to_dict(self, names=None):
+        """
+        转为字典
+
+        Args:
+            names: 只保留这些字段，默认全部字段
+        """
+        return {name: getattr(self, name) for name in names or RESPONSE_FIELDS}
+
+
+RESPONSE_FIELDS = tuple(item.name for item in fields(ResponseRecord))
+
+
+class EvaluationJob:
+    """
+    单个评测任务的运行状态
+    """
+
+    def __init__(self, evaluation_id, model_id, questions, metrics, use_cache=True):
+        self.evaluation_id = evaluation_id
+        self.model_id = model_id
+        self.questions = questions
+        self.metrics = metrics
+        self.use_cache = use_cache
+        self.status = PENDING
+        self.created_at = _now()
+        self.finished_at = None
+        self.error = None
+        self.responses = []
+        self.compacted = 0  # responses 中已并入数据仓库的条数，其余在检查点日志中
+        self.stale = set()  # 已并入数据仓库、之后又被重试结果替换的位置，下次并入时重新写入
+        self.task = None
+        self._positions = {}  # 幂等键 -> 在 responses 中的位置
+        self.table = ScoreTable(metrics)
+        self._categories = {str(q.get("id", f"q{i + 1}")): q.get("type", "unknown") for i, q in enumerate(questions)}
+        self._aggregate = (-1, {})  # (聚合时得分表的版本, 聚合结果)，没有新结果时复用
+        self._aggregated_at = 0.0
+        self._aggregate_lock = asyncio.Lock()
+
+    def question_id(self, index):
+        return str(self.questions[index].get("id", f"q{index + 1}"))
+
+    def record(self, response):
+        """
+        记录一道题的回答，同时写入得分表；同一幂等键的结果只记录一次，
+        只有失败的结果（score 为 None）可以被重试得到的成功结果替换，替换后位置不变
+
+        Args:
+            response: answer_question 的结果字典或 ResponseRecord
+
+        Returns:
+            是否为新的结果
+        """
+        if not isinstance(response, ResponseRecord):
+            response = ResponseRecord.from_dict(response)
+        key = checkpoint_key(response.model_id, response.question_id)
+        # 早期的结果只有一个总分，各指标沿用该得分
+        scores = response.metrics_scores or {metric: response.score for metric in self.metrics}
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self.responses)
+            self.responses.append(response)
+            self.table.add(response.model_id, self.category(response.question_id), scores)
+            return True
+        if self.responses[position].score is not None or response.score is None:
+            return False
+        self.responses[position] = response
+        self.table.set(position, response.model_id, self.category(response.question_id), scores)
+        if position < self.compacted:
+            self.stale.add(position)
+        return True
+
+    def is_answered(self, question_id):
+        """
+        题目是否已有成功的回答；失败的回答在继续任务时重试
+        """
+        position = self._positions.get(checkpoint_key(self.model_id, question_id))
+        return position is not None and self.responses[position].score is not None
+
+    @property
+    def failed(self):
+        return sum(1 for r in self.responses if r.score is None)
+
+    def category(self, question_id):
+        """
+        题目的分类（题目类型）
+        """
+        return self._categories.get(question_id, "unknown")
+
+    @property
+    def total(self):
+        return len(self.questions)
+
+    def meta(self):
+        return {
+            "evaluation_id": self.evaluation_id,
+            "model_id": self.model_id,
+            "metrics": self.metrics,
+            "total": self.total,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    @property
+    def aggregated_version(self):
+        """
+        当前汇总得分对应的得分表版本，尚未汇总时为 -1
+        """
+        return self._aggregate[0]
+
+    async def refresh_aggregate(self):
+        """
+        有新结果时在工作线程中重新汇总得分，bootstrap 在大规模评测中需要秒级时间，不阻塞事件循环；
+        任务运行中每 EVALUATION_AGGREGATE_INTERVAL 秒最多计算一次，任务结束后总是汇总全部结果
+        """
+        if self._aggregate[0] == self.table.version:
+            return
+        running = self.status in (PENDING, RUNNING)
+        if running and self._aggregate[0] >= 0 and time.monotonic() - self._aggregated_at < EVALUATION_AGGREGATE_INTERVAL:
+            return
+        async with self._aggregate_lock:
+            if self._aggregate[0] == self.table.version:
+                return
+            table = self.table.copy()
+            aggregated = await asyncio.to_thread(aggregate_scores, table)
+            self._aggregate = (table.version, aggregated.get(self.model_id, {}))
+            self._aggregated_at = time.monotonic()
+
+    def summary(self, response_fields=None, start=0, limit=None):
+        """
+        当前进度与（部分）得分，包含各指标的均值、95%置信区间与按题目类型的分类得分；
+        得分为最近一次 refresh_aggregate 的结果
+
+        Args:
+            response_fields: 逐题结果只保留这些字段，默认返回 ResponseRecord 对象
+            start: 逐题结果从该位置开始返回（结果只追加或原位替换，位置不会变化）
+            limit: 最多返回的逐题结果数，为 None 时返回全部
+        """
+        _, aggregated = self._aggregate
+        responses = self.responses[start:None if limit is None else start + limit]
+        return {
+            **self.meta(),
+            "completed": len(self.responses),
+            "failed": self.failed,
+            "total_score": aggregated.get("total_score", 0.0),
+            "metrics_scores": {
+                metric: score or 0.0 for metric, score in aggregated.get("metrics_scores", {}).items()
+            } or {metric: 0.0 for metric in self.metrics},
+            "metrics_ci": aggregated.get("metrics_ci", {}),
+            "category_scores": aggregated.get("category_scores", {}),
+            "responses": [r.to_dict(response_fields) for r in responses] if response_fields else responses,
+        }
+
+
+class EvaluationJobManager:
+    """
+    评测任务管理器
+
+    每个任务在 data/evaluations/<evaluation_id>/ 下保存 job.json（任务信息与状态）、
+    results.jsonl（检查点日志，每完成一道题追加一行）与 run.lock（运行锁）。
+    日志中的结果每累计 CHECKPOINT_COMPACT_SIZE 条、以及任务结束时并入数据仓库的 evaluation_results 集合后截断，
+    查询与继续任务时由数据仓库中的结果加上日志中的结果还原
+    """
+
+    def __init__(self, data_dir=DATA_DIR, workers=EVALUATION_WORKERS):
+        """
+        初始化任务管理器
+
+        Args:
+            data_dir: 数据根目录
+            workers: 所有任务共享的模型调用并发数
+        """
+        self.root = Path(data_dir) / "evaluations"
+        self.workers = workers
+        self._jobs = {}
+        self._semaphore = None
+        self._shutting_down = False
+
+    def _job_dir(self, evaluation_id):
+        return self.root / evaluation_id
+
+    def _write_meta(self, job):
+        path = self._job_dir(job.evaluation_id) / "job.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**job.meta(), "questions": job.questions, "use_cache": job.use_cache}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _start(self, job, lock):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        self._jobs[job.evaluation_id] = job
+        job.task = asyncio.create_task(self._run(job, lock))
+        return job
+
+    def submit(self, model_id, questions, metrics, use_cache=True):
+        """
+        提交评测任务并立即返回任务ID
+
+        Args:
+            model_id: 被测模型ID
+            questions: 题目列表
+            metrics: 评测指标列表
+            use_cache: 是否使用补全缓存
+
+        Returns:
+            EvaluationJob
+        """
+        evaluation_id = f"eval-{uuid.uuid4().hex[:16]}"
+        job = EvaluationJob(evaluation_id, model_id, questions, metrics, use_cache)
+        self._write_meta(job)
+        lock = RunLock(self._job_dir(evaluation_id) / "run.lock")
+        lock.acquire()
+        return self._start(job, lock)
+
+    async def resume(self, evaluation_id):
+        """
+        继续未结束的任务：从数据仓库与检查点日志还原已完成的结果，只为其余题目与回答失败的题目调用模型；
+        已完成但有失败题目的任务也可以继续，重试成功的结果替换原来的失败记录
+
+        Returns:
+            任务，不存在时返回 None
+
+        Raises:
+            ValueError: 任务已完成且没有失败的题目，或正在本进程或其他进程中运行
+        """
+        job = self._jobs.get(evaluation_id)
+        if job is not None and job.task is not None and not job.task.done():
+            raise ValueError(f"评测正在运行: {evaluation_id}")
+        if not _EVALUATION_ID.match(evaluation_id) or not (self._job_dir(evaluation_id) / "job.json").exists():
+            return None
+        lock = RunLock(self._job_dir(evaluation_id) / "run.lock")
+        if not await asyncio.to_thread(lock.acquire):
+            raise ValueError(f"评测正在其他进程中运行: {evaluation_id}")
+        try:
+            # 加锁后重新读取，得到上一个运行者写入的全部结果
+            job = await asyncio.to_thread(self._load, evaluation_id, True)
+            if job is not None and job.status == COMPLETED and not job.failed:
+                raise ValueError(f"评测已完成: {evaluation_id}")
+        except BaseException:
+            lock.release()
+            raise
+        if job is None:
+            lock.release()
+            return None
+        job.status = PENDING
+        job.finished_at = None
+        job.error = None
+        return self._start(job, lock)
+
+    async def resume_interrupted(self):
+        """
+        继续上次进程退出时未结束的任务，在应用启动时调用；
+        多个工作进程同时启动时，每个任务只由拿到运行锁的进程继续
+
+        Returns:
+            继续运行的任务ID列表
+        """
+        resumed = []
+        if not self.root.exists():
+            return resumed
+        for job_dir in sorted(self.root.iterdir()):
+            if not _EVALUATION_ID.match(job_dir.name):
+                continue
+            try:
+                with open(job_dir / "job.json", "r", encoding="utf-8") as f:
+                    status = json.load(f).get("status")
+            except (OSError, ValueError):
+                continue
+            if status not in (PENDING, RUNNING, INTERRUPTED):
+                continue
+            try:
+                await self.resume(job_dir.name)
+            except ValueError:
+                continue
+            except Exception as e:
+                print(f"继续评测 {job_dir.name} 失败: {str(e)}")
+                continue
+            resumed.append(job_dir.name)
+        if resumed:
+            print(f"从检查点继续了{len(resumed)}个评测任务: {', '.join(resumed)}")
+        return resumed
+
+    async def _run(self, job, lock):
+        job.status = RUNNING
+        await asyncio.to_thread(self._write_meta, job)
+        log = CheckpointLog(self._job_dir(job.evaluation_id) / "results.jsonl")
+
+        async def run_one(index, question):
+            async with self._semaphore:
+                return await answer_question(
+                    job.model_id, job.question_id(index), question, job.use_cache, job.metrics
+                )
+
+        pending = [i for i in range(job.total) if not job.is_answered(job.question_id(i))]
+        if len(pending) < job.total:
+            evaluation_checkpoint.inc(job.total - len(pending), outcome="skipped")
+        if job.failed:
+            evaluation_checkpoint.inc(job.failed, outcome="retried")
+        tasks = [asyncio.create_task(run_one(i, job.questions[i])) for i in pending]
+        try:
+            await asyncio.to_thread(log.open)
+            for finished in asyncio.as_completed(tasks):
+                response = await finished
+                if not job.record(response):
+                    continue
+                log.append(_record_key(response), response)
+                evaluation_checkpoint.inc(outcome="written")
+                if log.sync_due():
+                    await asyncio.to_thread(log.sync)
+                if log.size >= CHECKPOINT_COMPACT_SIZE:
+                    # 并入期间不再追加日志，截断不会丢失记录；写入失败时结果留在日志中，任务结束时再试
+                    try:
+                        await asyncio.to_thread(self._compact, job, log)
+                    except Exception as e:
+                        print(f"评测结果写入数据仓库失败: {str(e)}")
+            job.status = COMPLETED
+        except asyncio.CancelledError:
+            # 应用退出导致的取消记为中断，与用户主动取消区分；中断的任务在下次启动时继续
+            job.status = INTERRUPTED if self._shutting_down else CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            for task in tasks:
+                task.cancel()
+            job.finished_at = _now()
+            await asyncio.to_thread(self._finish, job, log)
+            lock.release()
+            self._trim()
+
+    def _finish(self, job, log):
+        """
+        任务结束时把检查点日志中剩余的结果并入数据仓库，成功后删除日志，再写入最终状态
+        """
+        try:
+            log.sync()
+            self._compact(job, log)
+        except Exception as e:
+            # 结果仍在检查点日志中，下次查询或继续任务时从日志还原
+            print(f"评测结果写入数据仓库失败: {str(e)}")
+            log.close()
+        else:
+            log.close(remove=True)
+        self._write_meta(job)
+
+    @staticmethod
+    def _compact(job, log):
+        """
+        把检查点日志中的结果并入数据仓库的 evaluation_results 集合后截断日志，供导出与跨任务查询；
+        同时记录评测指标、题目类型与回答时间，用于按指标与时间范围筛选。
+        写入后截断前崩溃时，日志与仓库中的同一结果按幂等键去重；已并入后又被重试结果替换的记录重新写入
+        """
+        end = len(job.responses)
+        stale, job.stale = job.stale, set()
+        positions = [*sorted(stale), *range(job.compacted, end)]
+        records = [
+            {
+                "id": f"{job.evaluation_id}:{r.question_id}",
+                "evaluation_id": job.evaluation_id,
+                **r.to_dict(),
+                "question_type": job.category(r.question_id),
+                "metrics": job.metrics,
+                "created_at": r.answered_at or job.finished_at or _now(),
+            }
+            for r in (job.responses[i] for i in positions)
+        ]
+        if records:
+            try:
+                get_repository().bulk_upsert("evaluation_results", records)
+            except BaseException:
+                job.stale |= stale
+                raise
+            evaluation_checkpoint.inc(len(records), outcome="compacted")
+        job.compacted = end
+        if log.size:
+            log.truncate()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.task is None or job.task.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_CACHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _running_here(self, evaluation_id):
+        job = self._jobs.get(evaluation_id)
+        return job is not None and job.task is not None and not job.task.done()
+
+    def _load(self, evaluation_id, locked=False):
+        """
+        从磁盘恢复任务状态，用于查询进程重启前提交的任务与继续任务；
+        结果按先数据仓库、后检查点日志的顺序还原，重复的结果按幂等键去重
+
+        Args:
+            evaluation_id: 任务ID
+            locked: 调用方是否已持有该任务的运行锁，持有时不再探测锁
+        """
+        job_dir = self._job_dir(evaluation_id)
+        try:
+            with open(job_dir / "job.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        job = EvaluationJob(evaluation_id, meta["model_id"], meta["questions"], meta["metrics"], meta.get("use_cache", True))
+        job.status = meta["status"]
+        if job.status in (PENDING, RUNNING) and not self._running_here(evaluation_id):
+            # 本进程没有在运行、其他进程也未持有运行锁的任务，是上次运行中断留下的
+            if locked or not RunLock(job_dir / "run.lock").held_elsewhere():
+                job.status = INTERRUPTED
+        job.created_at = meta["created_at"]
+        job.finished_at = meta.get("finished_at")
+        job.error = meta.get("error")
+        for record in get_repository().iter_find("evaluation_results", {"evaluation_id": evaluation_id}):
+            job.record(record)
+        job.compacted = len(job.responses)
+        for record in CheckpointLog.read(job_dir / "results.jsonl", _record_key).values():
+            job.record(record)
+        return job
+
+    async def get(self, evaluation_id):
+        """
+        获取任务，内存中没有时从磁盘加载，不存在时返回 None
+        """
+        job = self._jobs.get(evaluation_id)
+        if job is None and _EVALUATION_ID.match(evaluation_id):
+            job = await asyncio.to_thread(self._load, evaluation_id)
+            if job is not None:
+                self._jobs[evaluation_id] = job
+                self._trim()
+        return job
+
+    async def cancel(self, evaluation_id):
+        """
+        取消运行中的任务，已完成的结果保留
+
+        Returns:
+            任务，不存在时返回 None
+        """
+        job = await self.get(evaluation_id)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+        return job
+
+    async def shutdown(self):
+        """
+        取消全部运行中的任务，在应用退出时调用
+        """
+        self._shutting_down = True
+        for job in list(self._jobs.values()):
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        await asyncio.gather(*[job.task for job in self._jobs.values() if job.task is not None], return_exceptions=True)
+
+
+# 进程内共享的任务管理器
+evaluation_jobs = EvaluationJobManager()
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+
+from app.core.metrics import http_conditional_responses
+from app.core.repository import add_write_listener
+from app.core.serialization import FastJSONResponse, dumps
+
+# 读接口的条件请求与响应缓存：ETag 由数据版本号与请求参数计算，客户端携带 If-None-Match 且未变化时返回304；
+# 编码好的响应体按请求缓存在进程内，集合写入后对应的缓存条目失效。
+# 版本号保存在数据库中，多个进程各自缓存也不会返回过期内容
+
+# 进程内缓存的响应数
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# 单个响应体超过该字节数时不缓存
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+
+def make_etag(*parts):
+    """
+    由版本号与请求参数计算强 ETag
+
+    Args:
+        parts: 可JSON序列化的值，如集合版本号、分页游标、投影字段
+
+    Returns:
+        带引号的 ETag 字符串
+    """
+    return '"' + hashlib.sha256(dumps(parts)).hexdigest()[:32] + '"'
+
+
+def etag_matches(request, etag):
+    """
+    判断请求的 If-None-Match 是否包含该 ETag（支持逗号分隔的多个值与 *）
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    # 弱比较：W/ 前缀的同值 ETag 也视为匹配（部分代理压缩后会改为弱 ETag）
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+class ResponseCache:
+    """
+    编码后响应体的LRU缓存
+
+    条目按请求键存放，同时记录生成时的 ETag；读取时 ETag 不一致视为未命中。
+    条目登记依赖的集合，集合写入后立即清除，避免占用内存保存已过期的响应；
+    条目被淘汰、替换或清除时同时从各集合的登记中移除，登记的键数不超过缓存条目数
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._by_collection = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, etag):
+        """
+        读取缓存的 (响应体, 响应头)，不存在或 ETag 不一致时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def _remove(self, key):
+        """
+        删除条目及其在各集合中的登记，调用方需持有锁
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for collection in entry[3]:
+            keys = self._by_collection.get(collection)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_collection[collection]
+
+    def put(self, key, etag, body, headers=None, collections=()):
+        """
+        缓存响应体
+
+        Args:
+            key: 请求键
+            etag: 响应的 ETag
+            body: 编码后的响应体
+            headers: 需要一并返回的响应头
+            collections: 响应依赖的集合
+        """
+        if len(body) > self.max_bytes:
+            return
+        collections = tuple(collections)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (etag, body, dict(headers or {}), collections)
+            for collection in collections:
+                self._by_collection.setdefault(collection, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, collection):
+        """
+        清除依赖该集合的缓存条目
+        """
+        with self._lock:
+            for key in list(self._by_collection.get(collection, ())):
+                self._remove(key)
+            self._by_collection.pop(collection, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_collection.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 进程内共享的响应缓存，任一集合写入后清除依赖它的条目
+response_cache = ResponseCache()
+add_write_listener(response_cache.invalidate)
+
+
+def _render(build):
+    content, extra = build()
+    return dumps(content), extra
+
+
+async def conditional_json(request, endpoint, etag, build, collections=(), cache=None, offload=True):
+    """
+    返回带 ETag 的JSON响应：If-None-Match 命中时返回304，缓存中有相同 ETag 的响应体时直接返回，
+    否则调用 build 生成内容、编码并缓存
+
+    Args:
+        request: 当前请求
+        endpoint: 接口名称，用于指标标签
+        etag: make_etag 计算的 ETag
+        build: 无参函数，返回 (内容, 额外响应头)
+        collections: 响应依赖的集合，写入后缓存失效
+        cache: 响应缓存，默认使用进程内共享的缓存
+        offload: build 是否在线程池中执行；读取事件循环中正在修改的状态时设为 False，只把编码放到线程池
+
+    Returns:
+        Response
+    """
+    cache = response_cache if cache is None else cache
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        http_conditional_responses.inc(endpoint=endpoint, outcome="not_modified")
+        return Response(status_code=304, headers=headers)
+    # 查询串可能很长（如导出时携带的全部题目ID），只保存其摘要
+    key = (endpoint, request.url.path, hashlib.sha256(request.url.query.encode("utf-8")).digest())
+    cached = cache.get(key, etag)
+    if cached is not None:
+        body, extra = cached
+        http_conditional_responses.inc(endpoint=endpoint, outcome="cached")
+        return Response(body, media_type=FastJSONResponse.media_type, headers={**extra, **headers})
+    if offload:
+        body, extra = await asyncio.to_thread(_render, build)
+    else:
+        content, extra = build()
+        body = await asyncio.to_thread(dumps, content)
+    cache.put(key, etag, body, extra, collections)
+    http_conditional_responses.inc(endpoint=endpoint, outcome="built")
+    return Response(body, media_type=FastJSONResponse.media_type, headers={**(extra or {}), **headers})
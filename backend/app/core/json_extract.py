@@ -0,0 +1,345 @@
+import json
+import re
+
+# 大模型输出JSON的容错解析：一次线性扫描完成定位、修复与解析
+#
+# 相比先用正则逐遍改写整段文本再 json.loads 的做法，这里直接按字符解析出 Python 对象，
+# 在解析过程中顺带修复常见错误：
+#   - 数组/对象末尾多余的逗号、元素之间缺失的逗号
+#   - 未加引号的属性名、单引号字符串（只在字符串定界处处理，不会改写正文中的撇号）
+#   - 字符串中的原始控制字符、Python 风格的 True/False/None
+#   - 输出在 max_tokens 处被截断时，保留已经完整闭合的元素
+# 数组中的每个元素先交给标准库的C解析器，只有解析失败的元素才从同一位置改走容错解析，
+# 每个字符最多被扫描两次。
+
+_FENCE = re.compile(r"```(?:json|JSON)?[ \t]*\r?\n?")
+_ARRAY_OF_OBJECTS = re.compile(r"\[\s*\{")
+_NUMBER = re.compile(r"-?(?:\d+)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+# 字符串内需要逐个处理的字符：结束引号、转义符与控制字符，其余字符由正则整段跳过
+_STRING_SPECIAL = {
+    '"': re.compile(r'["\\\x00-\x1f]'),
+    "'": re.compile(r"['\\\x00-\x1f]"),
+}
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n﻿"
+_LITERALS = {
+    "true": True, "false": False, "null": None,
+    "True": True, "False": False, "None": None,
+}
+_ESCAPES = {
+    '"': '"', "'": "'", "\\": "\\", "/": "/",
+    "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+}
+# 字符串结束引号之后允许出现的字符，用于区分定界引号与正文中的引号
+_AFTER_STRING = ",:}]"
+# 未加引号的属性名或取值在遇到这些字符时结束
+_BARE_STOP = ",:}]\"'\r\n"
+
+
+class _Truncated(Exception):
+    """
+    文本在一个值的中途结束
+    """
+
+
+class _Malformed(Exception):
+    """
+    遇到无法修复的语法错误
+    """
+
+
+class _Parser:
+    """
+    容错的递归下降解析器，pos 只向前移动，整体为线性时间
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.pos = 0
+        self.repairs = 0
+
+    def skip_whitespace(self):
+        text = self.text
+        pos = self.pos
+        while pos < self.length and text[pos] in _WHITESPACE:
+            pos += 1
+        self.pos = pos
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= self.length:
+            raise _Truncated()
+        return self.text[self.pos]
+
+    def parse_value(self):
+        char = self.peek()
+        if char == "{":
+            return self.parse_object()
+        if char == "[":
+            return self.parse_array()
+        if char == '"' or char == "'":
+            return self.parse_string()
+        if char == "-" or char.isdigit():
+            return self.parse_number()
+        if char in ",:}]":
+            raise _Malformed(f"位置{self.pos}处缺少取值")
+        return self.parse_bare()
+
+    def parse_object(self):
+        self.pos += 1  # {
+        result = {}
+        expect_comma = False
+        while True:
+            char = self.peek()
+            if char == "}":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                if not expect_comma:
+                    self.repairs += 1  # 多余的逗号
+                expect_comma = False
+                if self.peek() == "}":
+                    self.repairs += 1  # 末尾多余的逗号
+                continue
+            if expect_comma:
+                self.repairs += 1  # 缺失的逗号
+            if char == '"' or char == "'":
+                key = self.parse_string()
+            elif char in ":{[]":
+                raise _Malformed(f"位置{self.pos}处缺少属性名")
+            else:
+                key = self.parse_bare_key()
+            if self.peek() == ":":
+                self.pos += 1
+            else:
+                self.repairs += 1  # 缺失的冒号
+            result[key] = self.parse_value()
+            expect_comma = True
+
+    def parse_array(self):
+        self.pos += 1  # [
+        result = []
+        expect_comma = False
+        while True:
+            char = self.peek()
+            if char == "]":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                if not expect_comma:
+                    self.repairs += 1
+                expect_comma = False
+                if self.peek() == "]":
+                    self.repairs += 1
+                continue
+            if expect_comma:
+                self.repairs += 1
+            result.append(self.parse_value())
+            expect_comma = True
+
+    def parse_string(self):
+        text = self.text
+        quote = text[self.pos]
+        if quote == "'":
+            self.repairs += 1
+        special = _STRING_SPECIAL[quote]
+        pos = self.pos + 1
+        start = pos
+        chunks = []
+        while True:
+            match = special.search(text, pos)
+            if match is None:
+                raise _Truncated()
+            pos = match.start()
+            char = text[pos]
+            if char == "\\":
+                chunks.append(text[start:pos])
+                if pos + 1 >= self.length:
+                    raise _Truncated()
+                code = text[pos + 1]
+                if code == "u":
+                    digits = text[pos + 2:pos + 6]
+                    if len(digits) < 4:
+                        raise _Truncated()
+                    try:
+                        chunks.append(chr(int(digits, 16)))
+                        pos += 6
+                    except ValueError:
+                        chunks.append("\\u")
+                        pos += 2
+                else:
+                    chunks.append(_ESCAPES.get(code, code))
+                    pos += 2
+                start = pos
+            elif char == quote:
+                # 引号后面紧跟分隔符、换行或文本结束才视为字符串结束，否则当作正文中的引号
+                after = pos + 1
+                newline = False
+                while after < self.length and text[after] in _WHITESPACE:
+                    newline = newline or text[after] == "\n"
+                    after += 1
+                if after >= self.length or newline or text[after] in _AFTER_STRING:
+                    chunks.append(text[start:pos])
+                    self.pos = pos + 1
+                    return "".join(chunks)
+                self.repairs += 1
+                pos += 1
+            elif char < " " and char not in "\t\n\r":
+                # 去除除换行、制表符之外的控制字符
+                chunks.append(text[start:pos])
+                self.repairs += 1
+                pos += 1
+                start = pos
+            else:
+                pos += 1
+
+    def parse_number(self):
+        match = _NUMBER.match(self.text, self.pos)
+        if match is None:
+            return self.parse_bare()
+        self.pos = match.end()
+        if self.pos >= self.length:
+            raise _Truncated()  # 数字可能还没输出完
+        literal = match.group()
+        if "." in literal or "e" in literal or "E" in literal:
+            return float(literal)
+        return int(literal)
+
+    def _read_bare(self):
+        text = self.text
+        start = self.pos
+        pos = start
+        while pos < self.length and text[pos] not in _BARE_STOP:
+            pos += 1
+        if pos >= self.length:
+            raise _Truncated()
+        self.pos = pos
+        return text[start:pos].strip()
+
+    def parse_bare_key(self):
+        key = self._read_bare()
+        if not key:
+            raise _Malformed(f"位置{self.pos}处缺少属性名")
+        self.repairs += 1
+        return key
+
+    def parse_bare(self):
+        word = self._read_bare()
+        if word in _LITERALS:
+            if word not in ("true", "false", "null"):
+                self.repairs += 1
+            return _LITERALS[word]
+        if not word:
+            raise _Malformed(f"位置{self.pos}处缺少取值")
+        self.repairs += 1  # 未加引号的字符串
+        return word
+
+    def parse_element(self):
+        """
+        解析数组中的一个元素：先用标准库的C解析器尝试，失败时从同一位置改用容错解析
+        """
+        try:
+            value, end = _DECODER.raw_decode(self.text, self.pos)
+        except ValueError:
+            return self.parse_value()
+        if end >= self.length and not isinstance(value, (dict, list, str)):
+            raise _Truncated()  # 末尾的数字或字面量可能还没输出完
+        self.pos = end
+        return value
+
+    def skip_to_next_object(self):
+        """
+        出错后跳到下一个 { 继续解析，返回是否找到
+        """
+        index = self.text.find("{", self.pos + 1)
+        if index < 0:
+            self.pos = self.length
+            return False
+        self.pos = index
+        return True
+
+
+def _locate(text):
+    """
+    定位JSON起始位置：优先使用 ```json 代码块，其次是第一个对象数组，最后退回到第一个 [ 或 {
+    """
+    fence = _FENCE.search(text)
+    start = fence.end() if fence else 0
+    match = _ARRAY_OF_OBJECTS.search(text, start)
+    if match:
+        return match.start()
+    candidates = [i for i in (text.find("[", start), text.find("{", start)) if i >= 0]
+    return min(candidates) if candidates else -1
+
+
+def extract_json_array(text):
+    """
+    从大模型回复中提取JSON数组，尽可能多地恢复其中的元素
+
+    支持有无 ```json 代码块、单个对象或多个并列对象（自动视为数组）、输出被截断等情况；
+    单个元素无法修复时跳过该元素，继续解析后面的元素。
+
+    Args:
+        text: 大模型回复的原始文本
+
+    Returns:
+        (items, report) 元组：
+            items: 解析出的元素列表
+            report: 解析情况，包含 found（是否找到JSON）、truncated（是否被截断）、
+                    skipped（跳过的元素数）、repairs（修复次数）
+    """
+    report = {"found": False, "truncated": False, "skipped": 0, "repairs": 0}
+    items = []
+    start = _locate(text or "")
+    if start < 0:
+        return items, report
+    report["found"] = True
+
+    parser = _Parser(text)
+    parser.pos = start
+    in_array = text[start] == "["
+    if in_array:
+        parser.pos += 1
+
+    while True:
+        try:
+            char = parser.peek()
+            if in_array and char == "]":
+                break
+            if char == ",":
+                parser.pos += 1
+                continue
+            if not in_array and char != "{":
+                break  # 并列对象之后的说明文字
+            items.append(parser.parse_element())
+        except _Truncated:
+            report["truncated"] = True
+            break
+        except _Malformed:
+            # 从出错位置向后找下一个对象，已扫描的字符不会重复扫描
+            report["skipped"] += 1
+            if not parser.skip_to_next_object():
+                break
+        except RecursionError:
+            report["skipped"] += 1
+            break
+
+    report["repairs"] = parser.repairs
+    return items, report
+
+
+def loads_tolerant(text):
+    """
+    容错解析单个JSON值，无法解析时抛出 ValueError
+    """
+    parser = _Parser(text)
+    try:
+        value = parser.parse_value()
+    except _Truncated:
+        raise ValueError("JSON文本不完整")
+    except _Malformed as e:
+        raise ValueError(str(e))
+    return value
@@ -0,0 +1,129 @@
+import json
+import re
+from json import JSONDecodeError
+
+from app.core.json_extract import loads_tolerant
+
+# 增量JSON数组解析：在大模型流式输出的过程中，每当数组中的一个对象闭合就立即解析返回
+
+# 字符串外需要处理的字符与字符串内需要处理的字符，其余字符用正则整段跳过
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class JSONArrayStream:
+    """
+    增量解析JSON数组中的对象元素
+
+    只扫描新到达的字符，记录字符串/转义状态与括号深度；
+    当数组第一层的对象闭合时，把该对象的文本交给 json.loads 解析。
+    数组开始之前的内容（如 ```json 代码块标记、说明文字）会被跳过。
+    """
+
+    def __init__(self, tolerant=True):
+        """
+        Args:
+            tolerant: 标准解析失败时是否退回到容错解析；导入数据时应关闭，格式错误的对象记入 errors
+        """
+        self.tolerant = tolerant
+        self._buffer = ""
+        self._pos = 0             # 下一个待扫描字符在缓冲区中的位置
+        self._depth = 0           # 当前括号深度，数组本身为1
+        self._in_string = False
+        self._escape = False
+        self._object_start = None  # 当前第一层对象在缓冲区中的起始位置
+        self.started = False       # 是否已遇到数组起始的 [
+        self.finished = False      # 是否已遇到数组结束的 ]
+        self.errors = []           # 无法解析的对象文本
+
+    def feed(self, text):
+        """
+        追加一段文本，返回其中新闭合的对象列表
+
+        Args:
+            text: 新到达的文本片段
+
+        Returns:
+            解析成功的对象列表
+        """
+        if self.finished or not text:
+            return []
+        self._buffer += text
+        items = []
+        buffer = self._buffer
+        pos = self._pos
+        end = len(buffer)
+
+        while pos < end:
+            if not self.started:
+                start = buffer.find("[", pos)
+                if start < 0:
+                    pos = end
+                    break
+                self.started = True
+                self._depth = 1
+                pos = start + 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = _STRING_SPECIAL.search(buffer, pos)
+                if match is None:
+                    pos = end
+                    break
+                pos = match.start()
+                if buffer[pos] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                pos += 1
+                continue
+            match = _STRUCTURAL.search(buffer, pos)
+            if match is None:
+                pos = end
+                break
+            pos = match.start()
+            char = buffer[pos]
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 1 and char == "{":
+                    self._object_start = pos
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1 and char == "}" and self._object_start is not None:
+                    item = self._decode(buffer[self._object_start:pos + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._object_start = None
+                elif self._depth == 0:
+                    self.finished = True
+                    pos += 1
+                    break
+            pos += 1
+
+        # 丢弃已经处理完的前缀，缓冲区只保留未闭合对象的文本
+        keep_from = self._object_start if self._object_start is not None else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return items
+
+    def _decode(self, text):
+        try:
+            item = json.loads(text, strict=False)
+        except JSONDecodeError:
+            if not self.tolerant:
+                self.errors.append(text)
+                return None
+            # 标准解析失败时退回到容错解析
+            try:
+                item = loads_tolerant(text)
+            except ValueError:
+                self.errors.append(text)
+                return None
+        return item if isinstance(item, dict) else None
@@ -0,0 +1,495 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.completion_cache import CompletionCache
+from app.core.local_inference import LOCAL_MODEL_PATH, get_local_engine
+from app.core.metrics import (
+    llm_attempt_seconds,
+    llm_completion_tokens,
+    llm_first_token_seconds,
+    llm_request_seconds,
+    llm_stream_generation_seconds,
+    llm_tokens,
+    metrics,
+    tracer,
+)
+from app.core.rate_limit import (
+    MAX_RETRIES,
+    RateLimiterRegistry,
+    backoff_delay,
+    call_with_limits,
+    estimate_tokens,
+    is_retryable,
+)
+from app.core.single_flight import SingleFlight
+
+# 大模型调用客户端：所有生成、评测请求共享同一个异步连接池
+
+# 各服务提供方的接口配置，均为 OpenAI 兼容的 /chat/completions 接口；
+# API密钥只从环境变量读取，云端服务未配置密钥时调用直接报错，本地推理服务的密钥可选
+PROVIDERS = {
+    "siliconflow": {
+        "base_url": os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1"),
+        "api_key": os.getenv("SILICONFLOW_API_KEY"),
+    },
+    "openai": {
+        "base_url": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        "api_key": os.getenv("OPENAI_API_KEY"),
+    },
+    "zhipu": {
+        "base_url": os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4"),
+        "api_key": os.getenv("ZHIPU_API_KEY"),
+    },
+    "wenxin": {
+        "base_url": os.getenv("WENXIN_BASE_URL", "https://qianfan.baidubce.com/v2"),
+        "api_key": os.getenv("WENXIN_API_KEY"),
+    },
+    "local": {
+        "base_url": os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8001/v1"),
+        "api_key": os.getenv("LOCAL_LLM_API_KEY", ""),
+        "optional_key": True,
+    },
+}
+
+# 评测模型ID到 (服务提供方, 上游模型名) 的映射，未列出的模型默认走硅基流动
+MODEL_ROUTES = {
+    "gpt-3.5-turbo": ("openai", "gpt-3.5-turbo"),
+    "glm-4": ("zhipu", "glm-4"),
+    "wenxin": ("wenxin", "ernie-4.0-8k"),
+    "custom-model": ("local", "custom-model"),
+}
+
+DEFAULT_PROVIDER = "siliconflow"
+
+# 本地模型的推理方式：transformers 在进程内加载 LOCAL_MODEL_PATH 并合批推理，http 调用 LOCAL_LLM_BASE_URL 上的推理服务；
+# 未显式指定时按配置了哪一项推断，两项都未配置时本地模型不可用
+LOCAL_LLM_BACKENDS = ("http", "transformers")
+LOCAL_LLM_BACKEND = os.getenv("LOCAL_LLM_BACKEND") or (
+    "http" if os.getenv("LOCAL_LLM_BASE_URL") else "transformers" if LOCAL_MODEL_PATH else ""
+)
+
+
+class ProviderConfigError(RuntimeError):
+    """
+    服务提供方未配置（如缺少API密钥），重试无意义
+    """
+
+
+def resolve_model(model_id):
+    """
+    将平台内的模型ID解析为服务提供方和上游模型名
+
+    Args:
+        model_id: 平台内的模型ID或上游模型名
+
+    Returns:
+        (provider, upstream_model) 元组
+    """
+    return MODEL_ROUTES.get(model_id, (DEFAULT_PROVIDER, model_id))
+
+
+def check_model_configured(model_id):
+    """
+    检查模型所在的服务提供方是否已配置，用于提交任务前尽早报错
+
+    Raises:
+        ProviderConfigError: 服务提供方未配置
+    """
+    LLMClient._endpoint(resolve_model(model_id)[0])
+
+
+class LLMClient:
+    """
+    异步大模型客户端，基于 httpx 的长连接池，按主机限制并发连接数，
+    连接超时与读取超时分开设置，避免一次慢请求阻塞整个事件循环
+    """
+
+    def __init__(
+        self,
+        max_connections=100,
+        max_keepalive_connections=20,
+        max_connections_per_host=20,
+        connect_timeout=5.0,
+        read_timeout=120.0,
+        write_timeout=10.0,
+        pool_timeout=30.0,
+        cache=None,
+    ):
+        """
+        初始化客户端
+
+        Args:
+            max_connections: 连接池总连接数上限
+            max_keepalive_connections: 保持长连接的空闲连接数上限
+            max_connections_per_host: 单个主机的并发请求上限
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应数据的超时时间（秒），大模型生成较慢，单独放宽
+            write_timeout: 发送请求体的超时时间（秒）
+            pool_timeout: 等待连接池空闲连接的超时时间（秒）
+            cache: 补全结果缓存，默认创建内存+磁盘两级缓存
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout,
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.cache = cache if cache is not None else CompletionCache()
+        self.limiters = RateLimiterRegistry()
+        self.inflight = SingleFlight()
+        self._client = None
+        self._host_semaphores = {}
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_connections_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @staticmethod
+    def _uses_local_engine(provider):
+        return provider == "local" and LOCAL_LLM_BACKEND == "transformers"
+
+    @staticmethod
+    def _endpoint(provider):
+        """
+        服务提供方的接口地址与请求头
+
+        Raises:
+            ProviderConfigError: 云端服务未配置API密钥，或本地模型未配置
+        """
+        config = PROVIDERS[provider]
+        if provider == "local":
+            if LOCAL_LLM_BACKEND not in LOCAL_LLM_BACKENDS:
+                raise ProviderConfigError(
+                    "本地模型未配置，请设置 LOCAL_LLM_BASE_URL（推理服务）或 LOCAL_MODEL_PATH（进程内推理）"
+                    if not LOCAL_LLM_BACKEND else f"不支持的 LOCAL_LLM_BACKEND: {LOCAL_LLM_BACKEND}"
+                )
+            if LOCAL_LLM_BACKEND == "transformers" and not LOCAL_MODEL_PATH:
+                raise ProviderConfigError("本地模型未配置，进程内推理需要设置 LOCAL_MODEL_PATH")
+        if not config["api_key"] and not config.get("optional_key"):
+            raise ProviderConfigError(f"服务提供方 {provider} 未配置API密钥，请设置环境变量 {provider.upper()}_API_KEY")
+        url = config["base_url"].rstrip("/") + "/chat/completions"
+        headers = {"Content-Type": "application/json"}
+        if config["api_key"]:
+            headers["Authorization"] = f"Bearer {config['api_key']}"
+        return url, headers
+
+    async def chat_completion(self, payload, provider=DEFAULT_PROVIDER, use_cache=False, validate=None):
+        """
+        调用 /chat/completions 接口并返回解析后的JSON响应
+
+        Args:
+            payload: 请求体，需包含 model 与 messages
+            provider: 服务提供方名称，对应 PROVIDERS 中的键
+            use_cache: 是否先查询补全缓存，并在调用成功后写入缓存
+            validate: 判断结果是否可用的函数，返回 False 时结果照常返回但不写入缓存，
+                已缓存的条目校验不通过时视为未命中；为 None 时所有成功的结果都写入缓存
+
+        相同请求（与缓存键相同）同时在途时合并为一次上游调用，所有调用方共享同一个结果，
+        返回的字典可能被多个调用方共享，不应原地修改
+
+        Returns:
+            接口返回的JSON字典
+
+        Raises:
+            httpx.HTTPError: 网络错误、超时或非2xx状态码
+            ProviderConfigError: 服务提供方未配置
+        """
+        model = payload.get("model") or ""
+        with tracer.span("llm.chat_completion", provider=provider, model=model) as span:
+            start = time.perf_counter()
+            key = self.cache.make_key(payload, provider)
+            if use_cache:
+                cached = self.cache.get_memory(key)
+                if cached is None:
+                    cached = await asyncio.to_thread(self.cache.get_disk, key)
+                if cached is not None and (validate is None or validate(cached)):
+                    llm_request_seconds.observe(time.perf_counter() - start, provider=provider, model=model, outcome="cached")
+                    if span is not None:
+                        span.attributes["cached"] = True
+                    return cached
+
+            url, headers = self._endpoint(provider)
+
+            async def send():
+                attempt_start = time.perf_counter()
+                status = "error"
+                try:
+                    async with self._host_semaphore(url):
+                        response = await self._get_client().post(url, headers=headers, json=payload)
+                    status = response.status_code
+                    response.raise_for_status()
+                    return response.json()
+                finally:
+                    llm_attempt_seconds.observe(
+                        time.perf_counter() - attempt_start, provider=provider, model=model, status=status
+                    )
+
+            async def call():
+                if self._uses_local_engine(provider):
+                    # 进程内推理不经过限流器，并发请求由推理引擎合批
+                    result = await get_local_engine().chat_completion(payload)
+                else:
+                    # 限流与重试：429/5xx/网络错误按 Retry-After 或带抖动的指数退避重试
+                    limiter = self.limiters.get(provider, payload.get("model"))
+                    result = await call_with_limits(limiter, payload, send)
+                self._record_usage(result, provider, model)
+                if use_cache and (validate is None or validate(result)):
+                    await asyncio.to_thread(self.cache.set, key, result)
+                return result
+
+            shared = key in self.inflight
+            try:
+                result = await self.inflight.do(key, call)
+            except BaseException:
+                llm_request_seconds.observe(time.perf_counter() - start, provider=provider, model=model, outcome="error")
+                raise
+            llm_request_seconds.observe(
+                time.perf_counter() - start, provider=provider, model=model, outcome="coalesced" if shared else "ok"
+            )
+            if span is not None:
+                span.attributes["coalesced"] = shared
+                usage = result.get("usage") if isinstance(result, dict) else None
+                if not shared and isinstance(usage, dict):
+                    span.attributes.update({k: usage.get(k) for k in ("prompt_tokens", "completion_tokens")})
+            return result
+
+    @staticmethod
+    def _record_usage(result, provider, model):
+        """
+        累计接口返回的token用量
+        """
+        usage = result.get("usage") if isinstance(result, dict) else None
+        if not isinstance(usage, dict):
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            value = usage.get(kind)
+            if isinstance(value, (int, float)):
+                llm_tokens.inc(value, provider=provider, model=model, kind=kind.split("_")[0])
+        if isinstance(usage.get("completion_tokens"), (int, float)):
+            llm_completion_tokens.observe(usage["completion_tokens"], provider=provider, model=model)
+
+    async def stream_chat_completion(self, payload, provider=DEFAULT_PROVIDER):
+        """
+        以流式方式调用 /chat/completions 接口，逐段返回生成的文本
+
+        Args:
+            payload: 请求体，stream 字段会被强制设为 True
+            provider: 服务提供方名称，对应 PROVIDERS 中的键
+
+        Yields:
+            每个SSE事件中新增的回复文本
+        """
+        url, headers = self._endpoint(provider)
+        if self._uses_local_engine(provider):
+            async for content in self._stream_local(payload):
+                yield content
+            return
+        payload = {**payload, "stream": True}
+        model = payload.get("model") or ""
+        limiter = self.limiters.get(provider, payload.get("model"))
+        reserved = estimate_tokens(payload)
+        attempt = 0
+        # 生成器会在 yield 处挂起，span 不设为当前span，避免调用方后续的span被错误地挂在它下面
+        span = tracer.start_span("llm.stream_chat_completion", provider=provider, model=model)
+        request_start = time.perf_counter()
+        error = None
+        try:
+            while True:
+                # 只在收到第一段内容之前重试，已经输出的内容无法撤回
+                yielded = False
+                await limiter.acquire(reserved)
+                start = time.monotonic()
+                first_token_at = None
+                status = "error"
+                try:
+                    async with self._host_semaphore(url):
+                        async with self._get_client().stream("POST", url, headers=headers, json=payload) as response:
+                            status = response.status_code
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                event = json.loads(data)
+                                choices = event.get("choices") or []
+                                if not choices:
+                                    continue
+                                delta = choices[0].get("delta") or {}
+                                if delta.get("content"):
+                                    if first_token_at is None:
+                                        first_token_at = time.monotonic()
+                                        llm_first_token_seconds.observe(first_token_at - start, provider=provider, model=model)
+                                    yielded = True
+                                    yield delta["content"]
+                except Exception as e:
+                    llm_attempt_seconds.observe(time.monotonic() - start, provider=provider, model=model, status=status)
+                    retryable, throttled, retry_after = is_retryable(e)
+                    await limiter.release(time.monotonic() - start, throttled, reserved, None, retry_after)
+                    if yielded or not retryable or attempt >= MAX_RETRIES:
+                        llm_request_seconds.observe(
+                            time.perf_counter() - request_start, provider=provider, model=model, outcome="error"
+                        )
+                        raise
+                    limiter.stats["retries"] += 1
+                    await asyncio.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                except BaseException:
+                    await limiter.release(None, False, reserved, None)
+                    raise
+                end = time.monotonic()
+                llm_attempt_seconds.observe(end - start, provider=provider, model=model, status=status)
+                if first_token_at is not None:
+                    llm_stream_generation_seconds.observe(end - first_token_at, provider=provider, model=model)
+                    if span is not None:
+                        span.attributes["time_to_first_token"] = first_token_at - start
+                llm_request_seconds.observe(time.perf_counter() - request_start, provider=provider, model=model, outcome="ok")
+                await limiter.release(end - start, False, reserved, None)
+                return
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracer.end_span(span, error)
+
+    async def _stream_local(self, payload):
+        """
+        由进程内推理引擎流式生成，逐段返回文本
+        """
+        model = payload.get("model") or ""
+        span = tracer.start_span("llm.stream_chat_completion", provider="local", model=model, backend="transformers")
+        start = time.perf_counter()
+        first_token_at = None
+        error = None
+        try:
+            async for content in get_local_engine().stream(payload):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    llm_first_token_seconds.observe(first_token_at - start, provider="local", model=model)
+                yield content
+            end = time.perf_counter()
+            if first_token_at is not None:
+                llm_stream_generation_seconds.observe(end - first_token_at, provider="local", model=model)
+                if span is not None:
+                    span.attributes["time_to_first_token"] = first_token_at - start
+            llm_request_seconds.observe(end - start, provider="local", model=model, outcome="ok")
+        except BaseException as e:
+            error = e
+            if isinstance(e, Exception):
+                llm_request_seconds.observe(time.perf_counter() - start, provider="local", model=model, outcome="error")
+            raise
+        finally:
+            tracer.end_span(span, error)
+
+    async def chat(self, model_id, messages, use_cache=False, validate=None, **params):
+        """
+        按平台模型ID调用大模型，返回第一条回复的文本内容
+
+        Args:
+            model_id: 平台内的模型ID，见 MODEL_ROUTES
+            messages: 对话消息列表
+            use_cache: 是否使用补全缓存
+            validate: 判断结果是否可以写入缓存的函数，见 chat_completion
+            **params: 其余采样参数，如 temperature、max_tokens
+
+        Returns:
+            回复文本
+        """
+        provider, upstream_model = resolve_model(model_id)
+        payload = {"model": upstream_model, "messages": messages, "stream": False, **params}
+        result = await self.chat_completion(payload, provider=provider, use_cache=use_cache, validate=validate)
+        return result["choices"][0]["message"]["content"]
+
+    async def aclose(self):
+        """
+        关闭连接池
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 进程内共享的客户端实例
+_llm_client = None
+
+
+def get_llm_client():
+    """
+    获取进程内共享的大模型客户端
+    """
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+@metrics.register_collector
+def _collect_client_stats():
+    """
+    采集共享客户端的限流器与补全缓存状态
+    """
+    if _llm_client is None:
+        return []
+    limiter_stats = [
+        ({"provider": limiter.provider, "model": limiter.model}, limiter.get_stats())
+        for limiter in _llm_client.limiters.all()
+    ]
+    cache_stats = _llm_client.cache.get_stats()
+    inflight_stats = _llm_client.inflight.get_stats()
+    families = [
+        ("llm_limiter_requests_total", "counter", "限流器放行的请求数", "requests"),
+        ("llm_limiter_throttled_total", "counter", "收到429限流响应的次数", "throttled"),
+        ("llm_limiter_retries_total", "counter", "重试次数", "retries"),
+        ("llm_limiter_waited_seconds_total", "counter", "等待配额的累计时间", "waited_seconds"),
+        ("llm_limiter_concurrency_limit", "gauge", "当前自适应并发上限", "concurrency_limit"),
+        ("llm_limiter_in_flight", "gauge", "进行中的请求数", "in_flight"),
+        ("llm_limiter_latency_ewma_seconds", "gauge", "调用耗时的指数滑动平均", "latency_ewma"),
+    ]
+    collected = [
+        (name, metric_type, documentation, [(labels, stats[field]) for labels, stats in limiter_stats])
+        for name, metric_type, documentation, field in families
+    ]
+    collected += [
+        ("completion_cache_hits_total", "counter", "补全缓存命中次数",
+         [({"tier": "memory"}, cache_stats["memory_hits"]), ({"tier": "disk"}, cache_stats["disk_hits"])]),
+        ("completion_cache_misses_total", "counter", "补全缓存未命中次数", [({}, cache_stats["misses"])]),
+        ("completion_cache_writes_total", "counter", "补全缓存写入次数", [({}, cache_stats["writes"])]),
+        ("completion_cache_evictions_total", "counter", "磁盘缓存淘汰的条目数", [({}, cache_stats["evictions"])]),
+        ("completion_cache_memory_entries", "gauge", "内存层条目数", [({}, cache_stats["memory_entries"])]),
+        ("completion_cache_disk_bytes", "gauge", "磁盘层总大小（首次写入前未统计）", [({}, cache_stats["disk_bytes"])]),
+        ("llm_coalesced_requests_total", "counter", "合并到相同在途调用上的请求数", [({}, inflight_stats["coalesced"])]),
+        ("llm_abandoned_calls_total", "counter", "所有等待方都已离开而取消的在途调用数", [({}, inflight_stats["abandoned"])]),
+        ("llm_inflight_calls", "gauge", "在途的去重后上游调用数", [({}, inflight_stats["in_flight"])]),
+    ]
+    return collected
+
+
+async def close_llm_client():
+    """
+    关闭共享客户端，在应用退出时调用
+    """
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
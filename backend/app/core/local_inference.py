@@ -0,0 +1,445 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.metrics import local_batch_size, local_queue_wait_seconds
+
+# 本地模型推理：每个工作进程只加载一次 Transformers 模型，
+# 并发的出题、评测请求在短时间窗口内合并为一个批次逐token解码，生成的文本逐段推送给各自的调用方
+
+# 模型路径（本地目录或模型仓库名），CPU上测试可使用 Qwen/Qwen2.5-0.5B-Instruct 等小模型；
+# 未配置时不启用进程内推理，避免下载并评测一个没有指定的模型
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH")
+LOCAL_MODEL_DEVICE = os.getenv("LOCAL_MODEL_DEVICE", "cpu")
+# 推理线程数，0 表示使用 torch 的默认值
+LOCAL_MODEL_THREADS = int(os.getenv("LOCAL_MODEL_THREADS", "0"))
+# 单个批次的最大请求数与凑批的最长等待时间（秒）
+LOCAL_MAX_BATCH_SIZE = int(os.getenv("LOCAL_MAX_BATCH_SIZE", "8"))
+LOCAL_MAX_WAIT = float(os.getenv("LOCAL_MAX_WAIT", "0.02"))
+# 未指定 max_tokens 时的生成长度上限
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
+def _stop_list(payload):
+    stop = payload.get("stop")
+    if isinstance(stop, str):
+        return [stop] if stop else []
+    return [item for item in stop or [] if isinstance(item, str) and item]
+
+
+def split_at_stop(text, stops):
+    """
+    计算流式输出中可以安全发送的文本长度
+
+    Args:
+        text: 目前生成的全部文本
+        stops: 停止词列表
+
+    Returns:
+        (可发送的字符数, 是否遇到停止词)。遇到停止词时只发送停止词之前的内容；
+        否则末尾可能是某个停止词开头的部分暂不发送，等后续token确定
+    """
+    positions = [text.find(stop) for stop in stops]
+    positions = [position for position in positions if position >= 0]
+    if positions:
+        return min(positions), True
+    held = 0
+    for stop in stops:
+        for size in range(min(len(stop) - 1, len(text)), held, -1):
+            if text.endswith(stop[:size]):
+                held = size
+                break
+    return len(text) - held, False
+
+
+class LocalInferenceError(Exception):
+    """
+    本地推理不可用（未安装依赖、模型加载失败）或推理出错
+    """
+
+
+class _Done:
+    """
+    生成结束的标记，携带结束原因与token用量
+    """
+
+    def __init__(self, finish_reason, prompt_tokens, completion_tokens):
+        self.finish_reason = finish_reason
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class _Request:
+    """
+    一条待生成的请求，生成的文本片段、结束标记或异常依次放入 output 队列
+    """
+
+    def __init__(self, prompt_ids, max_new_tokens, temperature, top_p, stop, loop):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop = stop
+        self.loop = loop
+        self.output = asyncio.Queue()
+        self.submitted = time.monotonic()
+        self.cancelled = False
+
+    def emit(self, item):
+        # 由推理线程调用，转交给事件循环
+        self.loop.call_soon_threadsafe(self.output.put_nowait, item)
+
+
+class _Decoder:
+    """
+    增量解码：只在新增token能组成完整字符时输出（避免把多字节汉字拆成乱码），
+    每次只解码最近的一小段token，单条序列的解码开销与长度成线性
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.text = ""
+        self.sent = 0  # 已推送给调用方的字符数
+
+    def push(self, token_id):
+        self.ids.append(token_id)
+        prefix = self.tokenizer.decode(self.ids[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+        current = self.tokenizer.decode(self.ids[self.prefix_offset:], skip_special_tokens=True)
+        if len(current) <= len(prefix) or current.endswith("�"):
+            return ""
+        delta = current[len(prefix):]
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.ids)
+        self.text += delta
+        return delta
+
+
+class LocalInferenceEngine:
+    """
+    本地推理引擎
+
+    请求进入队列后由调度协程按 max_batch_size / max_wait 组成批次，在专用线程中左侧补齐后逐步解码；
+    批次运行期间到达的请求组成下一个批次，负载越高批次越大，吞吐随之提升
+    """
+
+    def __init__(self, model_path=LOCAL_MODEL_PATH, device=LOCAL_MODEL_DEVICE,
+                 max_batch_size=LOCAL_MAX_BATCH_SIZE, max_wait=LOCAL_MAX_WAIT, model=None, tokenizer=None):
+        """
+        初始化引擎，模型在第一次请求时加载
+
+        Args:
+            model_path: 模型路径或模型仓库名，未提供 model 时必须指定
+            device: 推理设备，默认 cpu
+            max_batch_size: 单个批次的最大请求数
+            max_wait: 收到第一条请求后等待凑批的最长时间（秒）
+            model: 已加载的模型，提供时不再按 model_path 加载
+            tokenizer: 与 model 配套的分词器
+        """
+        self.model_path = model_path
+        self.device = device
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.model = model
+        self.tokenizer = tokenizer
+        self._torch = None
+        self._queue = None
+        self._scheduler = None
+        self._load_lock = None
+        # 模型不是线程安全的，所有推理都在同一个线程中执行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-inference")
+
+    def _load(self):
+        if self.model is None and not self.model_path:
+            raise LocalInferenceError("本地模型未配置，请设置 LOCAL_MODEL_PATH")
+        try:
+            import torch
+            if self.model is None:
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise LocalInferenceError(f"本地推理需要安装 torch 与 transformers: {e}")
+        if LOCAL_MODEL_THREADS:
+            torch.set_num_threads(LOCAL_MODEL_THREADS)
+        if self.model is None:
+            try:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+                self.model = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.float32)
+            except Exception as e:
+                raise LocalInferenceError(f"加载本地模型失败 {self.model_path}: {e}")
+        self.model.to(self.device).eval()
+        self._torch = torch
+
+    async def _ensure_started(self):
+        if self._scheduler is not None and not self._scheduler.done():
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._torch is None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+            if self._scheduler is None or self._scheduler.done():
+                self._queue = asyncio.Queue()
+                self._scheduler = asyncio.create_task(self._schedule())
+
+    def _encode(self, messages, max_new_tokens):
+        tokenizer = self.tokenizer
+        if getattr(tokenizer, "chat_template", None):
+            ids = tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=True)
+            if isinstance(ids, dict):
+                ids = ids["input_ids"]
+        else:
+            text = "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages) + "\nassistant: "
+            ids = tokenizer(text)["input_ids"]
+        # 超出上下文长度时保留提示词末尾
+        limit = getattr(self.model.config, "max_position_embeddings", None)
+        if limit and len(ids) + max_new_tokens > limit:
+            ids = ids[-max(1, limit - max_new_tokens):]
+        return list(ids)
+
+    async def _schedule(self):
+        """
+        调度协程：组批并提交到推理线程。协程因任何原因退出时，正在运行与仍在排队的请求都以异常结束，
+        调用方不会一直等待
+        """
+        loop = asyncio.get_running_loop()
+        batch = []
+        error = LocalInferenceError("本地推理引擎已关闭")
+        try:
+            await self._schedule_batches(loop, batch)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            error = LocalInferenceError(f"本地推理调度失败: {e}")
+            raise
+        finally:
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for request in batch:
+                # 推理线程中仍在运行的序列随之停止
+                request.cancelled = True
+                request.emit(error)
+
+    async def _schedule_batches(self, loop, batch):
+        """
+        循环组批执行；batch 为当前批次，由 _schedule 在退出时通知其中的请求
+        """
+        while True:
+            batch.clear()
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch[:] = [request for request in batch if not request.cancelled]
+            if not batch:
+                continue
+            now = time.monotonic()
+            for request in batch:
+                local_queue_wait_seconds.observe(now - request.submitted)
+            local_batch_size.observe(len(batch))
+            try:
+                await loop.run_in_executor(self._executor, self._run_batch, list(batch))
+            except Exception as e:
+                for request in batch:
+                    request.emit(LocalInferenceError(f"本地推理失败: {e}"))
+
+    def _sample(self, logits, batch):
+        torch = self._torch
+        greedy = logits.argmax(dim=-1)
+        if all(request.temperature <= 0 for request in batch):
+            return greedy
+        temperatures = torch.tensor([max(request.temperature, 1e-5) for request in batch], device=logits.device)
+        top_ps = torch.tensor([request.top_p for request in batch], device=logits.device)
+        probs = torch.softmax(logits.float() / temperatures.unsqueeze(1), dim=-1)
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        # top-p：保留累计概率达到 top_p 所需的最少候选
+        sorted_probs[(sorted_probs.cumsum(dim=-1) - sorted_probs) > top_ps.unsqueeze(1)] = 0
+        choice = torch.multinomial(sorted_probs, 1)
+        sampled = sorted_ids.gather(1, choice).squeeze(1)
+        use_greedy = torch.tensor([request.temperature <= 0 for request in batch], device=logits.device)
+        return torch.where(use_greedy, greedy, sampled)
+
+    def _run_batch(self, batch):
+        """
+        在推理线程中执行一个批次：左侧补齐后共享KV缓存逐步解码，已结束的序列不再输出，全部结束后返回
+        """
+        torch = self._torch
+        tokenizer = self.tokenizer
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        eos_ids = {tokenizer.eos_token_id}
+        configured_eos = getattr(getattr(self.model, "generation_config", None), "eos_token_id", None)
+        eos_ids.update(configured_eos if isinstance(configured_eos, (list, tuple)) else [configured_eos])
+        eos_ids.discard(None)
+
+        size = len(batch)
+        width = max(len(request.prompt_ids) for request in batch)
+        input_ids = torch.full((size, width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((size, width), dtype=torch.long)
+        for i, request in enumerate(batch):
+            length = len(request.prompt_ids)
+            input_ids[i, width - length:] = torch.tensor(request.prompt_ids, dtype=torch.long)
+            attention_mask[i, width - length:] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+
+        decoders = [_Decoder(tokenizer) for _ in batch]
+        finished = [False] * size
+        past_key_values = None
+        with torch.inference_mode():
+            for _ in range(max(request.max_new_tokens for request in batch)):
+                outputs = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+                past_key_values = outputs.past_key_values
+                next_ids = self._sample(outputs.logits[:, -1, :], batch).tolist()
+                for i, request in enumerate(batch):
+                    if finished[i]:
+                        continue
+                    reason = None
+                    stopped = False
+                    decoder = decoders[i]
+                    end = decoder.sent
+                    if request.cancelled:
+                        reason = "cancelled"
+                    elif next_ids[i] in eos_ids:
+                        reason = "stop"
+                    else:
+                        decoder.push(next_ids[i])
+                        # 与 OpenAI 接口一致，流式与非流式输出都不包含停止词及其后的内容
+                        end, stopped = split_at_stop(decoder.text, request.stop)
+                        if stopped:
+                            reason = "stop"
+                        elif len(decoder.ids) >= request.max_new_tokens:
+                            reason = "length"
+                    if reason in ("stop", "length") and not stopped:
+                        # 正常结束时补发因可能是停止词开头而暂缓发送的内容
+                        end = len(decoder.text)
+                    if end > decoder.sent:
+                        request.emit(decoder.text[decoder.sent:end])
+                        decoder.sent = end
+                    if reason is not None:
+                        finished[i] = True
+                        request.emit(_Done(reason, len(request.prompt_ids), len(decoder.ids)))
+                if all(finished):
+                    return
+                input_ids = torch.tensor(next_ids, dtype=torch.long, device=self.device).unsqueeze(1)
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((size, 1))], dim=1)
+                position_ids = position_ids[:, -1:] + 1
+
+    async def generate(self, payload):
+        """
+        提交一条生成请求，逐段返回生成的文本，最后返回结束标记
+
+        Args:
+            payload: OpenAI 兼容的请求体，使用 messages、max_tokens、temperature、top_p、stop
+
+        Yields:
+            文本片段（str），最后一项为 _Done
+        """
+        await self._ensure_started()
+        max_new_tokens = int(payload.get("max_tokens") or DEFAULT_MAX_NEW_TOKENS)
+        request = _Request(
+            self._encode(payload.get("messages") or [], max_new_tokens),
+            max_new_tokens,
+            float(payload.get("temperature", 0.7) or 0.0),
+            float(payload.get("top_p", 1.0) or 1.0),
+            _stop_list(payload),
+            asyncio.get_running_loop(),
+        )
+        await self._queue.put(request)
+        try:
+            while True:
+                item = await request.output.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                if isinstance(item, _Done):
+                    return
+        finally:
+            # 调用方提前离开（断开连接、任务取消）时通知推理线程停止该序列
+            request.cancelled = True
+
+    async def chat_completion(self, payload):
+        """
+        非流式生成，返回 OpenAI 兼容的响应结构
+        """
+        parts = []
+        done = None
+        async for item in self.generate(payload):
+            if isinstance(item, _Done):
+                done = item
+            else:
+                parts.append(item)
+        # 停止词及其后的内容在解码时已截掉
+        text = "".join(parts)
+        return {
+            "id": f"chatcmpl-local-{uuid.uuid4().hex[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": done.finish_reason}],
+            "usage": {
+                "prompt_tokens": done.prompt_tokens,
+                "completion_tokens": done.completion_tokens,
+                "total_tokens": done.prompt_tokens + done.completion_tokens,
+            },
+        }
+
+    async def stream(self, payload):
+        """
+        流式生成，逐段返回文本
+        """
+        async for item in self.generate(payload):
+            if not isinstance(item, _Done):
+                yield item
+
+    async def aclose(self):
+        """
+        停止调度协程与推理线程
+        """
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 进程内共享的本地推理引擎，模型在第一次使用时加载
+_engine = None
+
+
+def get_local_engine():
+    """
+    获取进程内共享的本地推理引擎
+    """
+    global _engine
+    if _engine is None:
+        _engine = LocalInferenceEngine()
+    return _engine
+
+
+async def close_local_engine():
+    """
+    关闭共享引擎，在应用退出时调用
+    """
+    global _engine
+    if _engine is not None:
+        await _engine.aclose()
+        _engine = None
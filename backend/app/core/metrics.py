@@ -0,0 +1,377 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 运行指标与调用链追踪：直方图/计数器按 Prometheus 文本格式输出到 /metrics，
+# 追踪开启时把每个HTTP请求与其中的大模型调用、出题各阶段记录为一棵span树
+# 指标只在当前进程内累计，多进程部署时由采集端按实例汇总
+
+# 耗时直方图的默认分桶（秒），覆盖毫秒级的解析与分钟级的大模型生成
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# 每次调用token数的分桶
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
+
+# 设置 TRACING_ENABLED=1 后记录调用链，内存中保留最近的若干条
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0").lower() in ("1", "true", "yes")
+MAX_TRACES = int(os.getenv("MAX_TRACES", "200"))
+# 单条调用链最多记录的span数，超出后只计数
+MAX_SPANS_PER_TRACE = 1000
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    单调递增计数器，按标签取值分别累计
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.label_names, key), value) for key, value in items]
+
+
+class Histogram:
+    """
+    累积分桶直方图，记录观测值的分布、总和与次数
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 标签取值 -> [各桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        记录代码块的耗时，异常退出时同样记录
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                samples.append((f"{self.name}_bucket", _format_labels(self.label_names, key, le), cumulative))
+            samples.append((f"{self.name}_bucket", _format_labels(self.label_names, key, 'le="+Inf"'), count))
+            samples.append((f"{self.name}_sum", _format_labels(self.label_names, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.label_names, key), count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    指标注册表：登记直方图、计数器，以及在采集时才读取当前状态的收集函数（如限流器、缓存统计）
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标重复注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector):
+        """
+        登记收集函数，采集时调用
+
+        Args:
+            collector: 无参函数，返回 [(指标名, 类型, 说明, [(标签字典, 值), ...]), ...]
+        """
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """
+        按 Prometheus 文本格式（0.0.4）输出全部指标
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        for collector in self._collectors:
+            for name, metric_type, documentation, values in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in values:
+                    if value is None:
+                        continue
+                    label_text = _format_labels(list(labels), list(labels.values()))
+                    lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的指标注册表
+metrics = MetricsRegistry()
+
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时（流式响应只计到开始输出）", ("method", "route", "status"))
+llm_request_seconds = metrics.histogram(
+    "llm_request_duration_seconds", "一次大模型调用的总耗时，含排队与重试", ("provider", "model", "outcome"))
+llm_queue_wait_seconds = metrics.histogram(
+    "llm_queue_wait_seconds", "等待限流器并发名额与配额的耗时", ("provider", "model"))
+llm_attempt_seconds = metrics.histogram(
+    "llm_attempt_duration_seconds", "单次HTTP请求耗时（非流式为首字延迟加生成时间）", ("provider", "model", "status"))
+llm_first_token_seconds = metrics.histogram(
+    "llm_time_to_first_token_seconds", "流式调用从发出请求到收到第一段内容的耗时", ("provider", "model"))
+llm_stream_generation_seconds = metrics.histogram(
+    "llm_stream_generation_seconds", "流式调用从第一段内容到结束的生成耗时", ("provider", "model"))
+llm_tokens = metrics.counter(
+    "llm_tokens_total", "大模型接口返回的token用量", ("provider", "model", "kind"))
+llm_completion_tokens = metrics.histogram(
+    "llm_completion_tokens", "每次调用生成的token数", ("provider", "model"), buckets=TOKEN_BUCKETS)
+generation_stage_seconds = metrics.histogram(
+    "question_generation_stage_seconds", "出题流程各阶段耗时", ("stage",))
+question_parse_results = metrics.counter(
+    "question_parse_total", "题目JSON解析结果：clean / repaired / truncated / skipped / not_found", ("outcome",))
+question_parse_skipped = metrics.counter(
+    "question_parse_skipped_items_total", "解析时因无法修复而跳过的题目数")
+question_invalid = metrics.counter(
+    "question_invalid_total", "解析成功但未通过校验而丢弃的题目数", ("reason",))
+question_followup_calls = metrics.counter(
+    "question_followup_calls_total", "有效题目不足时为缺少的数量追加调用大模型的次数")
+question_duplicates = metrics.counter(
+    "question_near_duplicates_total", "与题库中已有题目近似重复的题目数", ("source", "action"))
+evaluation_scores = metrics.counter(
+    "evaluation_scores_total", "评测打分的指标数：local（选择题本地判分）/ judge / judge_cached", ("method",))
+judge_calls = metrics.counter(
+    "judge_calls_total", "评审模型调用次数：ok / partial（部分条目缺失）/ error", ("outcome",))
+judge_batch_size = metrics.histogram(
+    "judge_batch_size", "每次评审调用包含的回答数", buckets=(1, 2, 4, 8, 16, 32, 64))
+local_batch_size = metrics.histogram(
+    "local_inference_batch_size", "本地推理每个批次合并的请求数", buckets=(1, 2, 4, 8, 16, 32, 64))
+local_queue_wait_seconds = metrics.histogram(
+    "local_inference_queue_wait_seconds", "本地推理请求从提交到进入批次的等待耗时")
+evaluation_checkpoint = metrics.counter(
+    "evaluation_checkpoint_records_total",
+    "评测检查点记录数：written（写入日志）/ compacted（并入数据仓库）/ skipped（继续任务时跳过的已完成题目）/ retried（继续任务时重试的失败题目）", ("outcome",))
+http_conditional_responses = metrics.counter(
+    "http_conditional_responses_total", "带 ETag 的读接口响应：not_modified（304）/ cached / built", ("endpoint", "outcome"))
+
+
+# ---------------------------------------------------------------- 调用链追踪
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    调用链中的一段，子span通过 contextvars 自动关联到当前span（asyncio 任务与 to_thread 都会继承）
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration")
+
+    def __init__(self, trace_id, name, parent_id=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.duration = None
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    进程内调用链记录器，只保留最近 max_traces 条调用链
+    """
+
+    def __init__(self, enabled=TRACING_ENABLED, max_traces=MAX_TRACES):
+        self.enabled = enabled
+        self.max_traces = max_traces
+        self._traces = OrderedDict()  # trace_id -> {"spans": [...], "dropped": 0}
+        self._lock = threading.Lock()
+
+    def start_span(self, name, trace_id=None, **attributes):
+        """
+        创建span但不设为当前span，用于跨越 yield 的异步生成器；需配合 end_span 使用
+
+        Args:
+            name: span名称
+            trace_id: 开启新调用链时指定，通常为HTTP请求ID
+            **attributes: 附加属性
+
+        Returns:
+            Span；未开启追踪，或不在任何调用链中且未指定 trace_id 时返回 None
+        """
+        parent = _current_span.get()
+        if not self.enabled or (parent is None and trace_id is None):
+            return None
+        parent_id = parent.span_id if parent is not None and trace_id is None else None
+        return Span(trace_id or parent.trace_id, name, parent_id, attributes)
+
+    def end_span(self, span, error=None):
+        """
+        结束并记录span
+        """
+        if span is None:
+            return
+        span.duration = time.time() - span.start
+        if error is not None:
+            span.attributes["error"] = type(error).__name__
+        self._record(span)
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """
+        在代码块期间记录一个span，并设为当前span，代码块中创建的span自动成为它的子span
+
+        Yields:
+            Span，未记录时为 None
+        """
+        span = self.start_span(name, trace_id, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def _record(self, span):
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+            if trace is None:
+                trace = self._traces[span.trace_id] = {"spans": [], "dropped": 0}
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(trace["spans"]) < MAX_SPANS_PER_TRACE:
+                trace["spans"].append(span.to_dict())
+            else:
+                trace["dropped"] += 1
+
+    def get_trace(self, trace_id):
+        """
+        返回调用链的全部span（按开始时间排序），不存在时返回 None
+        """
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            spans = sorted(trace["spans"], key=lambda s: s["start"])
+            return {"trace_id": trace_id, "spans": spans, "dropped_spans": trace["dropped"]}
+
+    def recent(self, limit=20):
+        """
+        最近结束的调用链概要，根span在最后结束，据此取名称与总耗时
+        """
+        with self._lock:
+            items = list(self._traces.items())[-limit:]
+        summaries = []
+        for trace_id, trace in reversed(items):
+            roots = [s for s in trace["spans"] if s["parent_id"] is None]
+            root = roots[-1] if roots else None
+            summaries.append({
+                "trace_id": trace_id,
+                "name": root["name"] if root else None,
+                "duration": root["duration"] if root else None,
+                "attributes": root["attributes"] if root else {},
+                "spans": len(trace["spans"]),
+            })
+        return summaries
+
+
+# 进程内共享的调用链记录器
+tracer = Tracer()
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    出题流程中的一个阶段：记录到阶段耗时直方图，追踪开启时同时记录为span
+    """
+    start = time.perf_counter()
+    try:
+        with tracer.span(name, **attributes) as span:
+            yield span
+    finally:
+        generation_stage_seconds.observe(time.perf_counter() - start, stage=name)
@@ -0,0 +1,55 @@
+import base64
+import binascii
+
+from app.core.serialization import dumps, loads
+
+# 游标分页：游标为上一页最后一条记录的排序键（JSON编码后做URL安全的base64），对客户端不透明；
+# 下一页从该排序键之后继续查询，不使用 OFFSET，翻到深处也不会变慢
+
+# 单页最多返回的记录数
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key):
+    """
+    把排序键编码为游标，没有下一页（key 为 None）时返回 None
+    """
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(dumps(key)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解码游标
+
+    Args:
+        cursor: encode_cursor 返回的字符串，为空时表示第一页
+
+    Returns:
+        排序键，第一页时为 None
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    if not cursor:
+        return None
+    try:
+        return loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("无效的分页游标") from e
+
+
+def decode_position(cursor):
+    """
+    解码按位置分页的游标（只追加的列表，如评测作答记录），第一页时返回 0
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    position = decode_cursor(cursor)
+    if position is None:
+        return 0
+    if not isinstance(position, int) or isinstance(position, bool) or position < 0:
+        raise ValueError("无效的分页游标")
+    return position
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from app.core.metrics import llm_queue_wait_seconds
+
+# 按服务提供方与模型限流：请求数/token数令牌桶 + AIMD自适应并发 + 带抖动的退避重试
+
+# 各服务提供方的默认配额，rpm/tpm 为 None 表示不限制；
+# 可通过环境变量 <PROVIDER>_RPM / <PROVIDER>_TPM / <PROVIDER>_MAX_CONCURRENCY 覆盖
+PROVIDER_LIMITS = {
+    "siliconflow": {"rpm": 1000, "tpm": 50000, "max_concurrency": 32},
+    "openai": {"rpm": 3500, "tpm": 90000, "max_concurrency": 32},
+    "zhipu": {"rpm": 600, "tpm": 300000, "max_concurrency": 16},
+    "wenxin": {"rpm": 300, "tpm": 300000, "max_concurrency": 16},
+    "local": {"rpm": None, "tpm": None, "max_concurrency": 8},
+}
+DEFAULT_LIMITS = {"rpm": 600, "tpm": 100000, "max_concurrency": 16}
+
+# 需要重试的状态码：限流与服务端暂时不可用
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 退避重试参数（秒）
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+def limits_for(provider):
+    """
+    读取服务提供方的配额配置，环境变量优先
+    """
+    limits = dict(PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS))
+    for name in ("rpm", "tpm", "max_concurrency"):
+        value = os.getenv(f"{provider.upper()}_{name.upper()}")
+        if value:
+            limits[name] = int(value) or None
+    return limits
+
+
+def estimate_tokens(payload):
+    """
+    粗略估计一次请求消耗的token数：中文约每1.5个字符一个token，加上最大生成长度
+    """
+    chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages", []))
+    return int(chars / 1.5) + int(payload.get("max_tokens") or 512)
+
+
+def parse_retry_after(response):
+    """
+    解析 Retry-After 响应头，支持秒数与HTTP日期两种格式，无法解析时返回 None
+    """
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """
+    指数退避加全抖动
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class _TokenBucket:
+    """
+    令牌桶，容量为每分钟配额，按秒匀速补充；允许结算后出现负余额（欠账），后续请求相应等待
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class ProviderLimiter:
+    """
+    单个服务提供方/模型的限流器
+
+    - 请求数与token数两个令牌桶，保证不超过每分钟配额
+    - 并发上限按AIMD调整：成功且延迟正常时缓慢加一，遇到429减半，延迟明显升高时小幅下调
+    - 收到带 Retry-After 的限流响应后，同一限流器上的所有请求暂停到指定时间
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=16, min_concurrency=1, provider="", model=""):
+        """
+        初始化限流器
+
+        Args:
+            rpm: 每分钟请求数上限，None 表示不限制
+            tpm: 每分钟token数上限，None 表示不限制
+            max_concurrency: 并发上限的最大值
+            min_concurrency: 并发上限的最小值
+            provider: 服务提供方名称，用作指标标签
+            model: 模型名称，用作指标标签
+        """
+        self.provider = provider
+        self.model = model
+        self.requests = _TokenBucket(rpm) if rpm else None
+        self.tokens = _TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max(min_concurrency, max_concurrency / 2)
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        self._budget_lock = asyncio.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "waited_seconds": 0.0}
+
+    @property
+    def limit(self):
+        return max(self.min_concurrency, int(self.concurrency))
+
+    async def acquire(self, tokens):
+        """
+        等待并发名额与配额，返回实际预占的token数
+        """
+        start = time.monotonic()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            await self._wait_budget(tokens)
+        except BaseException:
+            await self._release_slot()
+            raise
+        self.stats["requests"] += 1
+        llm_queue_wait_seconds.observe(time.monotonic() - start, provider=self.provider, model=self.model)
+        return tokens
+
+    async def _wait_budget(self, tokens):
+        # 持锁等待，保证排队的请求按先后顺序获得配额
+        async with self._budget_lock:
+            while True:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait <= 0:
+                    break
+                self.stats["waited_seconds"] += wait
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= tokens
+
+    async def _release_slot(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def release(self, latency, throttled=False, reserved_tokens=0, used_tokens=None, retry_after=None):
+        """
+        释放并发名额，并根据本次调用的结果调整并发上限与token余额
+
+        Args:
+            latency: 本次调用耗时（秒）
+            throttled: 是否被限流（429）
+            reserved_tokens: acquire 时预占的token数
+            used_tokens: 实际消耗的token数，未知时为 None
+            retry_after: 服务端要求的等待时间（秒）
+        """
+        now = time.monotonic()
+        if self.tokens is not None and used_tokens is not None:
+            self.tokens.level += reserved_tokens - used_tokens
+        if throttled:
+            self.stats["throttled"] += 1
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            # 同一时刻的一批429只减半一次
+            if now - self._last_decrease > 1.0:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self._last_decrease = now
+        elif latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            if latency > 2 * self.latency_ewma and now - self._last_decrease > 1.0:
+                self.concurrency = max(self.min_concurrency, self.concurrency * 0.9)
+                self._last_decrease = now
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+        await self._release_slot()
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "concurrency_limit": self.limit,
+            "in_flight": self.in_flight,
+            "latency_ewma": self.latency_ewma,
+            "requests_available": self.requests.level if self.requests else None,
+            "tokens_available": self.tokens.level if self.tokens else None,
+        }
+
+
+class RateLimiterRegistry:
+    """
+    按 (服务提供方, 模型) 管理限流器，生成与评测共享同一份状态
+    """
+
+    def __init__(self):
+        self._limiters = {}
+
+    def get(self, provider, model):
+        key = (provider, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = ProviderLimiter(**limits_for(provider), provider=provider, model=model or "")
+            self._limiters[key] = limiter
+        return limiter
+
+    def all(self):
+        """
+        当前全部限流器
+        """
+        return list(self._limiters.values())
+
+    def get_stats(self):
+        return {f"{provider}/{model}": limiter.get_stats() for (provider, model), limiter in self._limiters.items()}
+
+
+def is_retryable(error):
+    """
+    判断调用错误是否值得重试，返回 (是否重试, 是否为限流, Retry-After秒数)
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status in RETRYABLE_STATUS:
+            return True, status == 429, parse_retry_after(error.response)
+        return False, False, None
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True, False, None
+    return False, False, None
+
+
+async def call_with_limits(limiter, payload, send, max_retries=MAX_RETRIES):
+    """
+    在限流器约束下调用 send，失败时按 Retry-After 或带抖动的指数退避重试
+
+    Args:
+        limiter: ProviderLimiter
+        payload: 请求体，用于估计token消耗
+        send: 无参协程函数，返回接口的JSON结果
+        max_retries: 最大重试次数
+
+    Returns:
+        send 的返回值
+    """
+    reserved = estimate_tokens(payload)
+    attempt = 0
+    while True:
+        await limiter.acquire(reserved)
+        start = time.monotonic()
+        try:
+            result = await send()
+        except Exception as e:
+            retryable, throttled, retry_after = is_retryable(e)
+            await limiter.release(time.monotonic() - start, throttled, reserved, None, retry_after)
+            if not retryable or attempt >= max_retries:
+                raise
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            limiter.stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            await limiter.release(None, False, reserved, None)
+            raise
+        usage = result.get("usage") if isinstance(result, dict) else None
+        used = usage.get("total_tokens") if isinstance(usage, dict) else None
+        await limiter.release(time.monotonic() - start, False, reserved, used)
+        return result
@@ -0,0 +1,534 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from app.core.serialization import dumps_str, loads
+
+# 数据仓库：题目、文档与评测结果的持久化存储
+# 配置 MONGODB_URI 时使用MongoDB，否则使用内嵌的SQLite（单机部署与测试），两者接口一致
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_DB = os.getenv("MONGODB_DB", "question_bank")
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(DATA_DIR, "question_bank.db")
+
+# 各集合的二级索引字段：值为 "scalar" 的字段按等值查询，"multi" 的字段为数组，按包含某个值查询
+COLLECTIONS = {
+    "questions": {"document_id": "scalar", "type": "scalar", "tags": "multi"},
+    "documents": {"content_hash": "scalar", "upload_time": "scalar"},
+    "chunk_questions": {},
+    "evaluation_results": {
+        "evaluation_id": "scalar", "model_id": "scalar", "question_id": "scalar",
+        "created_at": "scalar", "metrics": "multi",
+    },
+}
+
+# 支持游标分页的排序字段，按 (字段, id) 建联合索引，翻页时从上一页最后一条之后继续查询
+SORT_KEYS = {
+    "documents": ("upload_time",),
+    "evaluation_results": ("created_at",),
+}
+
+# 查询条件中支持的比较运算，写法与MongoDB一致，如 {"created_at": {"$gte": "2024-01-01"}}
+FILTER_OPERATORS = {"$gte": ">=", "$gt": ">", "$lte": "<=", "$lt": "<", "$in": "IN"}
+
+# 单次批量写入的文档数
+BULK_WRITE_SIZE = 1000
+# 单次 $in 查询携带的ID数，MongoDB查询文档需小于16MB
+IN_QUERY_SIZE = 50000
+
+
+def question_id_for(question):
+    """
+    题目在题库中的ID：由题型、题干、选项与答案的内容哈希得到，同一道题重复保存只有一条记录
+    """
+    key = json.dumps(
+        [question.get("type"), question.get("content"), question.get("options", []), question.get("answer")],
+        ensure_ascii=False
+    )
+    return f"q-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _check_collection(collection):
+    if collection not in COLLECTIONS:
+        raise ValueError(f"未知的数据集合: {collection}")
+    return COLLECTIONS[collection]
+
+
+# 写入后的回调，参数为集合名称，用于让进程内的响应缓存失效
+_write_listeners = []
+
+
+def add_write_listener(listener):
+    """
+    登记写入回调，任一集合写入或删除后调用 listener(collection)
+    """
+    _write_listeners.append(listener)
+    return listener
+
+
+def _notify_write(collection):
+    for listener in _write_listeners:
+        listener(collection)
+
+
+def _check_sort_key(collection, order_by):
+    if order_by is not None and order_by not in SORT_KEYS.get(collection, ()):
+        raise ValueError(f"{collection} 不支持按 {order_by} 分页")
+
+
+def check_filters(collection, filters):
+    """
+    检查查询条件是否只使用了集合的索引字段，不满足时抛出 ValueError
+    """
+    indexes = _check_collection(collection)
+    for field, value in (filters or {}).items():
+        if field != "id" and field not in indexes:
+            raise ValueError(f"{collection} 不支持按 {field} 查询")
+        if isinstance(value, dict):
+            for operator, operand in value.items():
+                if operator not in FILTER_OPERATORS:
+                    raise ValueError(f"不支持的查询运算: {operator}")
+                if operator == "$in" and not isinstance(operand, list):
+                    raise ValueError("$in 的值必须是数组")
+                if operator != "$in" and indexes.get(field) == "multi":
+                    raise ValueError(f"数组字段 {field} 只支持等值与 $in 查询")
+    return indexes
+
+
+class SQLiteRepository:
+    """
+    基于SQLite的数据仓库
+
+    每个集合一张表：id 为主键，完整文档以JSON存放在 data 列，标量索引字段冗余为单独的列并建索引；
+    数组字段（如 tags）拆到 <集合>_<字段> 关联表中，按值建索引。
+    _versions 表记录各集合的版本号，与数据在同一个事务中递增，多个进程共用同一个数据库时也一致
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        """
+        初始化仓库并建表、建索引
+
+        Args:
+            path: 数据库文件路径，":memory:" 表示内存数据库
+        """
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            for collection, indexes in COLLECTIONS.items():
+                scalar = [field for field, kind in indexes.items() if kind == "scalar"]
+                columns = "".join(f", {field}" for field in scalar)
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {collection} (id TEXT PRIMARY KEY, data TEXT NOT NULL{columns})")
+                # 旧版本建的表缺少后来新增的索引列时补上，已有记录在下次写入时填充
+                existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({collection})")}
+                for field in scalar:
+                    if field not in existing:
+                        self._conn.execute(f"ALTER TABLE {collection} ADD COLUMN {field}")
+                for field in scalar:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{collection}_{field} ON {collection} ({field})")
+                for field in SORT_KEYS.get(collection, ()):
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{collection}_{field}_id ON {collection} ({field}, id)")
+                self._conn.execute("INSERT OR IGNORE INTO _versions (collection, version) VALUES (?, 0)", (collection,))
+                for field in (field for field, kind in indexes.items() if kind == "multi"):
+                    table = f"{collection}_{field}"
+                    self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (value, id))")
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id ON {table} (id)")
+
+    def bulk_upsert(self, collection, documents):
+        """
+        按 id 批量插入或整体替换文档
+
+        Args:
+            collection: 集合名称
+            documents: 文档列表，每个文档必须包含 id
+
+        Returns:
+            写入的文档数
+        """
+        indexes = _check_collection(collection)
+        scalar = [field for field, kind in indexes.items() if kind == "scalar"]
+        multi = [field for field, kind in indexes.items() if kind == "multi"]
+        columns = ", ".join(["id", "data", *scalar])
+        placeholders = ", ".join("?" * (2 + len(scalar)))
+        updates = ", ".join(f"{column} = excluded.{column}" for column in ["data", *scalar])
+        sql = f"INSERT INTO {collection} ({columns}) VALUES ({placeholders}) ON CONFLICT(id) DO UPDATE SET {updates}"
+        count = 0
+        for batch in _batches(list(documents), BULK_WRITE_SIZE):
+            rows = [
+                (str(doc["id"]), dumps_str(doc), *(doc.get(field) for field in scalar))
+                for doc in batch
+            ]
+            with self._lock, self._conn:
+                self._conn.executemany(sql, rows)
+                self._bump_version(collection)
+                ids = [(row[0],) for row in rows]
+                for field in multi:
+                    table = f"{collection}_{field}"
+                    self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+                    self._conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} (id, value) VALUES (?, ?)",
+                        [(str(doc["id"]), str(value)) for doc in batch for value in doc.get(field) or []]
+                    )
+            count += len(rows)
+        if count:
+            _notify_write(collection)
+        return count
+
+    def _bump_version(self, collection):
+        self._conn.execute("UPDATE _versions SET version = version + 1 WHERE collection = ?", (collection,))
+
+    def version(self, collection):
+        """
+        集合的版本号，每次写入或删除后递增，用于生成 ETag
+        """
+        _check_collection(collection)
+        with self._lock:
+            return self._conn.execute("SELECT version FROM _versions WHERE collection = ?", (collection,)).fetchone()[0]
+
+    def get(self, collection, document_id):
+        """
+        按 id 读取单个文档，不存在时返回 None
+        """
+        _check_collection(collection)
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {collection} WHERE id = ?", (str(document_id),)).fetchone()
+        return loads(row[0]) if row else None
+
+    def find_by_ids(self, collection, ids):
+        """
+        按 id 列表批量读取文档，ID列表作为一个JSON参数传入，一次主键索引查询返回全部结果
+
+        Returns:
+            按传入顺序排列的文档列表，不存在的ID被跳过
+        """
+        _check_collection(collection)
+        ids = [str(i) for i in ids]
+        found = {}
+        for batch in _batches(ids, IN_QUERY_SIZE):
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM {collection} WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(batch),)
+                ).fetchall()
+            found.update(rows)
+        return [loads(found[i]) for i in dict.fromkeys(ids) if i in found]
+
+    @staticmethod
+    def _condition(column, operator, value, params):
+        if operator == "$in":
+            params.append(json.dumps(value))
+            return f"{column} IN (SELECT value FROM json_each(?))"
+        params.append(value)
+        return f"{column} {FILTER_OPERATORS[operator]} ?"
+
+    def _where(self, collection, indexes, filters):
+        clauses = []
+        params = []
+        for field, value in (filters or {}).items():
+            if value is None:
+                continue
+            conditions = value if isinstance(value, dict) else {"$eq": value}
+            for operator, operand in conditions.items():
+                if indexes.get(field) == "multi":
+                    # 数组字段：关联表中存在满足条件的值即匹配
+                    if operator == "$in":
+                        inner = self._condition("value", operator, [str(v) for v in operand], params)
+                    else:
+                        inner = "value = ?"
+                        params.append(str(operand))
+                    clauses.append(f"id IN (SELECT id FROM {collection}_{field} WHERE {inner})")
+                elif operator == "$eq":
+                    clauses.append(f"{field} = ?")
+                    params.append(operand)
+                else:
+                    clauses.append(self._condition(field, operator, operand, params))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def find(self, collection, filters=None, limit=None, offset=0, order_by=None, descending=False):
+        """
+        按索引字段查询文档
+
+        Args:
+            collection: 集合名称
+            filters: 字段到值的字典，标量字段为等值匹配，数组字段为包含匹配，值为 None 的条件被忽略；
+                值也可以是 {"$gte": ..., "$lt": ..., "$in": [...]} 形式的比较条件
+            limit: 最多返回的文档数
+            offset: 跳过的文档数
+            order_by: 排序字段（索引字段），默认按写入顺序
+            descending: 是否倒序
+
+        Returns:
+            文档列表
+        """
+        indexes = check_filters(collection, filters)
+        if order_by is not None and indexes.get(order_by) != "scalar":
+            raise ValueError(f"{collection} 不支持按 {order_by} 排序")
+        where, params = self._where(collection, indexes, filters)
+        sql = f"SELECT data FROM {collection}{where} ORDER BY {order_by or 'rowid'}{' DESC' if descending else ''}"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def find_page(self, collection, filters=None, limit=50, after=None, order_by=None, descending=False):
+        """
+        游标分页：按 (order_by, id) 排序，从上一页最后一条之后继续查询，走联合索引，不随页数变慢
+
+        Args:
+            collection: 集合名称
+            filters: 同 find
+            limit: 每页文档数
+            after: 上一页返回的排序键，首页为 None
+            order_by: 排序字段，需在 SORT_KEYS 中，默认按 id
+            descending: 是否倒序
+
+        Returns:
+            (文档列表, 下一页的排序键)，没有下一页时排序键为 None
+        """
+        indexes = check_filters(collection, filters)
+        _check_sort_key(collection, order_by)
+        where, params = self._where(collection, indexes, filters)
+        columns = f"({order_by}, id)" if order_by else "id"
+        if after is not None:
+            condition = f"{columns} {'<' if descending else '>'} {'(?, ?)' if order_by else '?'}"
+            where += f" AND {condition}" if where else f" WHERE {condition}"
+            params += list(after)
+        direction = " DESC" if descending else ""
+        order = f"{order_by}{direction}, id{direction}" if order_by else f"id{direction}"
+        sql = f"SELECT data FROM {collection}{where} ORDER BY {order} LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, [*params, limit + 1]).fetchall()
+        documents = [loads(row[0]) for row in rows[:limit]]
+        if len(rows) <= limit:
+            return documents, None
+        last = documents[-1]
+        return documents, [last.get(order_by), last["id"]] if order_by else [last["id"]]
+
+    def iter_find(self, collection, filters=None, batch_size=BULK_WRITE_SIZE):
+        """
+        按写入顺序逐条遍历满足条件的文档
+
+        按 rowid 分批查询，每批查询结束即释放连接，内存占用只与 batch_size 有关，适合导出大量数据
+
+        Yields:
+            文档
+        """
+        indexes = check_filters(collection, filters)
+        where, params = self._where(collection, indexes, filters)
+        where += " AND rowid > ?" if where else " WHERE rowid > ?"
+        sql = f"SELECT rowid, data FROM {collection}{where} ORDER BY rowid LIMIT ?"
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, [*params, last, batch_size]).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield loads(data)
+            last = rows[-1][0]
+
+    def iter_by_ids(self, collection, ids, batch_size=BULK_WRITE_SIZE):
+        """
+        按 id 列表分批读取并逐条返回文档
+        """
+        for batch in _batches(list(ids), batch_size):
+            yield from self.find_by_ids(collection, batch)
+
+    def count(self, collection, filters=None):
+        """
+        统计满足条件的文档数
+        """
+        indexes = check_filters(collection, filters)
+        where, params = self._where(collection, indexes, filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {collection}{where}", params).fetchone()[0]
+
+    def delete_by_ids(self, collection, ids):
+        """
+        按 id 列表删除文档，返回删除的文档数
+        """
+        indexes = _check_collection(collection)
+        param = json.dumps([str(i) for i in ids])
+        with self._lock, self._conn:
+            for field in (field for field, kind in indexes.items() if kind == "multi"):
+                self._conn.execute(f"DELETE FROM {collection}_{field} WHERE id IN (SELECT value FROM json_each(?))", (param,))
+            cursor = self._conn.execute(f"DELETE FROM {collection} WHERE id IN (SELECT value FROM json_each(?))", (param,))
+            if cursor.rowcount:
+                self._bump_version(collection)
+        if cursor.rowcount:
+            _notify_write(collection)
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MongoRepository:
+    """
+    基于MongoDB的数据仓库
+
+    每个集合在 id 上建唯一索引，在 COLLECTIONS 中列出的字段上建二级索引（数组字段为多键索引）；
+    返回的文档不包含 MongoDB 的 _id 字段。各集合的版本号保存在 _versions 集合中，
+    在数据写入完成后单独递增（不使用事务，单节点部署也可用）：两步之间读到的是新数据与旧版本号，
+    版本号递增后这期间生成的 ETag 与缓存即失效
+    """
+
+    def __init__(self, uri=MONGODB_URI, database=MONGODB_DB):
+        """
+        连接MongoDB并创建索引
+
+        Args:
+            uri: MongoDB 连接串
+            database: 数据库名称
+        """
+        from pymongo import ASCENDING, MongoClient
+
+        self._client = MongoClient(uri)
+        self._db = self._client[database]
+        for collection, indexes in COLLECTIONS.items():
+            self._db[collection].create_index([("id", ASCENDING)], unique=True)
+            for field in indexes:
+                self._db[collection].create_index([(field, ASCENDING)])
+            for field in SORT_KEYS.get(collection, ()):
+                self._db[collection].create_index([(field, ASCENDING), ("id", ASCENDING)])
+
+    def bulk_upsert(self, collection, documents):
+        from pymongo import ReplaceOne
+
+        _check_collection(collection)
+        count = 0
+        for batch in _batches(list(documents), BULK_WRITE_SIZE):
+            operations = [ReplaceOne({"id": str(doc["id"])}, {**doc, "id": str(doc["id"])}, upsert=True) for doc in batch]
+            if operations:
+                self._db[collection].bulk_write(operations, ordered=False)
+            count += len(operations)
+        if count:
+            self._bump_version(collection)
+        return count
+
+    def _bump_version(self, collection):
+        # 在 bulk_write / delete_many 之后调用，与数据写入不在同一个事务中
+        self._db["_versions"].update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+        _notify_write(collection)
+
+    def version(self, collection):
+        _check_collection(collection)
+        record = self._db["_versions"].find_one({"_id": collection})
+        return record["version"] if record else 0
+
+    def get(self, collection, document_id):
+        _check_collection(collection)
+        return self._db[collection].find_one({"id": str(document_id)}, {"_id": 0})
+
+    def find_by_ids(self, collection, ids):
+        _check_collection(collection)
+        ids = [str(i) for i in ids]
+        found = {}
+        for batch in _batches(ids, IN_QUERY_SIZE):
+            for doc in self._db[collection].find({"id": {"$in": batch}}, {"_id": 0}):
+                found[doc["id"]] = doc
+        return [found[i] for i in dict.fromkeys(ids) if i in found]
+
+    @staticmethod
+    def _query(filters):
+        # 数组字段上的等值条件在MongoDB中即为包含匹配
+        return {field: value for field, value in (filters or {}).items() if value is not None}
+
+    def find(self, collection, filters=None, limit=None, offset=0, order_by=None, descending=False):
+        indexes = check_filters(collection, filters)
+        if order_by is not None and indexes.get(order_by) != "scalar":
+            raise ValueError(f"{collection} 不支持按 {order_by} 排序")
+        cursor = self._db[collection].find(self._query(filters), {"_id": 0})
+        cursor = cursor.sort(order_by or "_id", -1 if descending else 1)
+        if offset:
+            cursor = cursor.skip(offset)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def find_page(self, collection, filters=None, limit=50, after=None, order_by=None, descending=False):
+        check_filters(collection, filters)
+        _check_sort_key(collection, order_by)
+        query = self._query(filters)
+        compare = "$lt" if descending else "$gt"
+        if after is not None:
+            if order_by:
+                value, last_id = after
+                query = {"$and": [query, {"$or": [
+                    {order_by: {compare: value}}, {order_by: value, "id": {compare: last_id}},
+                ]}]}
+            else:
+                query = {"$and": [query, {"id": {compare: after[0]}}]}
+        direction = -1 if descending else 1
+        sort = [(order_by, direction), ("id", direction)] if order_by else [("id", direction)]
+        documents = list(self._db[collection].find(query, {"_id": 0}).sort(sort).limit(limit + 1))
+        if len(documents) <= limit:
+            return documents, None
+        last = documents[limit - 1]
+        return documents[:limit], [last.get(order_by), last["id"]] if order_by else [last["id"]]
+
+    def iter_find(self, collection, filters=None, batch_size=BULK_WRITE_SIZE):
+        check_filters(collection, filters)
+        cursor = self._db[collection].find(self._query(filters), {"_id": 0}).sort("_id", 1).batch_size(batch_size)
+        yield from cursor
+
+    def iter_by_ids(self, collection, ids, batch_size=BULK_WRITE_SIZE):
+        for batch in _batches(list(ids), batch_size):
+            yield from self.find_by_ids(collection, batch)
+
+    def count(self, collection, filters=None):
+        check_filters(collection, filters)
+        return self._db[collection].count_documents(self._query(filters))
+
+    def delete_by_ids(self, collection, ids):
+        _check_collection(collection)
+        deleted = self._db[collection].delete_many({"id": {"$in": [str(i) for i in ids]}}).deleted_count
+        if deleted:
+            self._bump_version(collection)
+        return deleted
+
+    def close(self):
+        self._client.close()
+
+
+# 进程内共享的数据仓库
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    """
+    获取进程内共享的数据仓库，首次调用时按配置创建
+    """
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = MongoRepository() if MONGODB_URI else SQLiteRepository()
+        return _repository
+
+
+def close_repository():
+    """
+    关闭数据仓库连接，在应用退出时调用
+    """
+    global _repository
+    with _repository_lock:
+        if _repository is not None:
+            _repository.close()
+            _repository = None
@@ -0,0 +1,221 @@
+import warnings
+
+import numpy as np
+
+# 评测得分聚合：逐题得分按 (模型, 指标) 存放在NumPy数组中，均值、分类统计与bootstrap置信区间均为批量向量化计算
+
+# bootstrap 每批重采样的次数，控制权重矩阵的内存占用
+_BOOTSTRAP_BATCH = 200
+
+
+class ScoreTable:
+    """
+    逐题得分表
+
+    每行对应一个 (模型, 题目) 的回答，scores 为 行数×指标数 的浮点矩阵，缺失得分记为 NaN；
+    模型与题目分类以整数编码存放，数组容量按倍数增长，追加一行为均摊 O(1)。
+    version 在每次追加或改写一行时递增
+    """
+
+    def __init__(self, metrics, capacity=1024):
+        """
+        初始化得分表
+
+        Args:
+            metrics: 指标名称列表
+            capacity: 初始容量（行数）
+        """
+        self.metrics = list(metrics)
+        self.models = []
+        self.categories = []
+        self._model_index = {}
+        self._category_index = {}
+        self.size = 0
+        self.version = 0
+        self._scores = np.full((capacity, len(self.metrics)), np.nan)
+        self._model_codes = np.zeros(capacity, dtype=np.int32)
+        self._category_codes = np.zeros(capacity, dtype=np.int32)
+
+    @staticmethod
+    def _code(value, names, index):
+        code = index.get(value)
+        if code is None:
+            code = len(names)
+            names.append(value)
+            index[value] = code
+        return code
+
+    def _grow(self):
+        capacity = len(self._model_codes) * 2
+        scores = np.full((capacity, len(self.metrics)), np.nan)
+        scores[:self.size] = self._scores[:self.size]
+        self._scores = scores
+        self._model_codes = np.resize(self._model_codes, capacity)
+        self._category_codes = np.resize(self._category_codes, capacity)
+
+    def add(self, model_id, category, scores):
+        """
+        追加一行得分
+
+        Args:
+            model_id: 模型ID
+            category: 题目分类，如题目类型
+            scores: 指标名到得分的字典，缺失或为 None 的指标记为 NaN
+        """
+        if self.size == len(self._model_codes):
+            self._grow()
+        self.size += 1
+        self.set(self.size - 1, model_id, category, scores)
+
+    def set(self, row, model_id, category, scores):
+        """
+        改写已有的一行得分，参数同 add
+        """
+        if not 0 <= row < self.size:
+            raise IndexError(f"行号超出范围: {row}")
+        self._model_codes[row] = self._code(model_id, self.models, self._model_index)
+        self._category_codes[row] = self._code(category, self.categories, self._category_index)
+        for j, metric in enumerate(self.metrics):
+            value = scores.get(metric)
+            self._scores[row, j] = np.nan if value is None else value
+        self.version += 1
+
+    def copy(self):
+        """
+        当前各行的副本，可以交给工作线程聚合，不受之后追加的行影响
+        """
+        table = ScoreTable(self.metrics, capacity=max(1, self.size))
+        table.models = list(self.models)
+        table.categories = list(self.categories)
+        table._model_index = dict(self._model_index)
+        table._category_index = dict(self._category_index)
+        table.size = self.size
+        table.version = self.version
+        table._scores[:self.size] = self.scores
+        table._model_codes[:self.size] = self.model_codes
+        table._category_codes[:self.size] = self.category_codes
+        return table
+
+    @property
+    def scores(self):
+        return self._scores[:self.size]
+
+    @property
+    def model_codes(self):
+        return self._model_codes[:self.size]
+
+    @property
+    def category_codes(self):
+        return self._category_codes[:self.size]
+
+
+def _group_means(codes, num_groups, values, mask):
+    """
+    按整数编码分组求各指标的均值（忽略NaN），返回 (均值矩阵, 计数矩阵)，形状均为 组数×指标数
+    """
+    num_metrics = values.shape[1]
+    flat_codes = (codes[:, None] * num_metrics + np.arange(num_metrics)[None, :]).ravel()
+    sums = np.bincount(flat_codes, weights=np.where(mask, values, 0.0).ravel(), minlength=num_groups * num_metrics)
+    counts = np.bincount(flat_codes, weights=mask.ravel().astype(float), minlength=num_groups * num_metrics)
+    sums = sums.reshape(num_groups, num_metrics)
+    counts = counts.reshape(num_groups, num_metrics)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return means, counts
+
+
+def _bootstrap_ci(values, mask, n_bootstrap, confidence, rng):
+    """
+    贝叶斯bootstrap：每次重采样用指数分布权重（归一化后即Dirichlet权重）代替有放回抽样，
+    所有重采样的加权均值通过一次矩阵乘法得到，比逐次抽样快一个数量级
+
+    Returns:
+        (下界, 上界) 两个长度为指标数的数组
+    """
+    filled = np.where(mask, values, 0.0).astype(np.float32)
+    weights_mask = mask.astype(np.float32)
+    estimates = []
+    remaining = n_bootstrap
+    while remaining > 0:
+        batch = min(_BOOTSTRAP_BATCH, remaining)
+        weights = rng.standard_exponential(size=(batch, len(values)), dtype=np.float32)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimates.append((weights @ filled) / (weights @ weights_mask))
+        remaining -= batch
+    estimates = np.vstack(estimates)
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # 某指标全部缺失时该列全为NaN，结果记为NaN即可
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low = np.nanquantile(estimates, alpha, axis=0)
+        high = np.nanquantile(estimates, 1 - alpha, axis=0)
+    return low, high
+
+
+def _to_float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def aggregate_scores(table, n_bootstrap=1000, confidence=0.95, seed=0):
+    """
+    汇总得分表
+
+    Args:
+        table: ScoreTable
+        n_bootstrap: bootstrap 重采样次数，为0时不计算置信区间
+        confidence: 置信水平
+        seed: 随机种子，保证同一数据的结果可复现
+
+    Returns:
+        以模型ID为键的字典，每个模型包含：
+            total_score: 各指标均值的平均
+            metrics_scores: 指标 -> 均值
+            metrics_ci: 指标 -> [下界, 上界]
+            metrics_counts: 指标 -> 有效得分数
+            category_scores: 分类 -> {指标 -> 均值}
+    """
+    if table.size == 0:
+        return {}
+    values = table.scores
+    mask = ~np.isnan(values)
+    model_codes = table.model_codes
+    num_models = len(table.models)
+    num_categories = len(table.categories)
+
+    model_means, model_counts = _group_means(model_codes, num_models, values, mask)
+    combined = model_codes * num_categories + table.category_codes
+    category_means, category_counts = _group_means(combined, num_models * num_categories, values, mask)
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(model_codes, kind="stable")
+    boundaries = np.searchsorted(model_codes[order], np.arange(num_models + 1))
+
+    results = {}
+    for m, model_id in enumerate(table.models):
+        means = model_means[m]
+        valid = ~np.isnan(means)
+        summary = {
+            "total_score": float(means[valid].mean()) if valid.any() else 0.0,
+            "metrics_scores": {metric: _to_float(means[j]) for j, metric in enumerate(table.metrics)},
+            "metrics_counts": {metric: int(model_counts[m, j]) for j, metric in enumerate(table.metrics)},
+            "metrics_ci": {},
+            "category_scores": {},
+        }
+        if n_bootstrap > 0:
+            rows = order[boundaries[m]:boundaries[m + 1]]
+            low, high = _bootstrap_ci(values[rows], mask[rows], n_bootstrap, confidence, rng)
+            # 重采样在float32下计算，转为float64后区间保留6位小数
+            low, high = np.round(low.astype(np.float64), 6), np.round(high.astype(np.float64), 6)
+            summary["metrics_ci"] = {
+                metric: [_to_float(low[j]), _to_float(high[j])]
+                for j, metric in enumerate(table.metrics)
+            }
+        for c, category in enumerate(table.categories):
+            row = m * num_categories + c
+            if category_counts[row].sum() == 0:
+                continue
+            summary["category_scores"][category] = {
+                metric: _to_float(category_means[row, j]) for j, metric in enumerate(table.metrics)
+            }
+        results[model_id] = summary
+    return results
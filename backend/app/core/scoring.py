@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+from app.core.completion_cache import CompletionCache
+from app.core.json_extract import extract_json_array
+from app.core.llm_client import get_llm_client
+from app.core.metrics import evaluation_scores, judge_batch_size, judge_calls
+
+# 回答评分：选择题在本地从回答中提取所选选项直接判分，不调用大模型；
+# 主观题与主观指标交给评审模型，多条回答合并到一次调用中评审，评审结果按 (题目, 回答) 的哈希缓存
+
+# 选择题可在本地判分的指标
+LOCAL_METRICS = {"accuracy"}
+ANSWER_LETTERS = "ABCD"
+
+# 评审模型与批量参数
+JUDGE_MODEL = os.getenv("JUDGE_MODEL", "Qwen/Qwen2.5-72B-Instruct")
+JUDGE_BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "8"))
+# 凑批的最长等待时间（秒），不足一批时到时即发出
+JUDGE_MAX_WAIT = float(os.getenv("JUDGE_MAX_WAIT", "0.5"))
+# 评审提示词中每道题目、参考答案与回答保留的最大字数
+JUDGE_MAX_CHARS = 1500
+# 评审打分区间为 0-10，换算为 0-1
+JUDGE_SCALE = 10.0
+
+# 各指标的评审标准，未列出的指标只给出名称
+METRIC_DESCRIPTIONS = {
+    "accuracy": "回答内容是否正确，与参考答案是否一致",
+    "fluency": "语言是否通顺、表达是否清晰",
+    "relevance": "回答是否切题，是否针对问题作答",
+}
+
+# 回答中明确给出答案的表述，如"答案是B"、"应选（C）"、"The answer is D"
+_KEYWORD_CHOICE = re.compile(
+    r"(?:正确答案|正确选项|参考答案|答案|应选|应该选|选择|(?i:the\s+answer\s+is|correct\s+answer|answer|option))"
+    r"[\)）】\]]?\s*(?:是|为|应该是|应为|选)?\s*[:：]?\s*[\(（【\[]?\s*([A-D])(?![A-Za-z])"
+)
+# 整个回答只有一个选项字母，或以选项字母开头（"B"、"(C)"、"D. xxx"）
+_ONLY_CHOICE = re.compile(r"^\W*([A-D])\W*$")
+_LEADING_CHOICE = re.compile(r"^\s*[\(（【\[]?([A-D])(?:[\.．、\)）】\]:：\s]|$)")
+# 独立出现的选项字母（前后不是英文字母）
+_STANDALONE_LETTER = re.compile(r"(?<![A-Za-z])([A-D])(?![A-Za-z])")
+# 选项文本前的字母标记
+_OPTION_PREFIX = re.compile(r"^\s*[\(（]?[A-Da-d][\.．、\)）:：]\s*")
+
+
+def normalize_answer(answer):
+    """
+    将题目的标准答案规范为单个大写字母，无法识别时返回 None
+    """
+    text = unicodedata.normalize("NFKC", str(answer or "")).strip().upper()
+    if text and text[0] in ANSWER_LETTERS and (len(text) == 1 or not text[1].isalpha()):
+        return text[0]
+    return None
+
+
+def extract_choice(text, options=None):
+    """
+    从模型的自由文本回答中提取所选选项
+
+    依次尝试：明确的答案表述（取最后一处，模型常在末尾给出结论）、只有一个字母或以字母开头、
+    回答中只出现某一个选项的原文、只出现一个独立的选项字母
+
+    Args:
+        text: 模型回答
+        options: 题目选项列表，用于按选项原文匹配
+
+    Returns:
+        选项字母，无法确定时返回 None
+    """
+    if not text:
+        return None
+    text = unicodedata.normalize("NFKC", str(text))
+    matches = _KEYWORD_CHOICE.findall(text)
+    if matches:
+        return matches[-1]
+    for pattern in (_ONLY_CHOICE, _LEADING_CHOICE):
+        match = pattern.match(text)
+        if match:
+            return match.group(1)
+    if options:
+        found = set()
+        for letter, option in zip(ANSWER_LETTERS, options):
+            body = _OPTION_PREFIX.sub("", unicodedata.normalize("NFKC", str(option))).strip()
+            if len(body) >= 2 and body in text:
+                found.add(letter)
+        if len(found) == 1:
+            return found.pop()
+    letters = set(_STANDALONE_LETTER.findall(text))
+    if len(letters) == 1:
+        return letters.pop()
+    return None
+
+
+def judge_key(question, response, metrics, model=JUDGE_MODEL):
+    """
+    评审结果的缓存键：题目内容、参考答案、回答、指标与评审模型的哈希
+    """
+    material = {
+        "content": question.get("content", ""),
+        "options": question.get("options", []),
+        "answer": question.get("answer"),
+        "response": response,
+        "metrics": sorted(metrics),
+        "model": model,
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _clip(text):
+    text = str(text or "")
+    return text if len(text) <= JUDGE_MAX_CHARS else text[:JUDGE_MAX_CHARS] + "……（已截断）"
+
+
+def build_judge_messages(items, metrics):
+    """
+    构造批量评审的对话消息，要求评审模型为每条回答按指标打 0-10 分并返回JSON数组
+    """
+    criteria = "\n".join(f"- {metric}: {METRIC_DESCRIPTIONS.get(metric, metric)}" for metric in metrics)
+    blocks = []
+    for index, (question, response) in enumerate(items, start=1):
+        lines = [f"### 第{index}条", f"【题目】{_clip(question.get('content'))}"]
+        lines.extend(str(option) for option in question.get("options") or [])
+        if question.get("answer"):
+            lines.append(f"【参考答案】{_clip(question.get('answer'))}")
+        lines.append(f"【待评回答】{_clip(response)}")
+        blocks.append("\n".join(lines))
+    example = ", ".join(f'"{metric}": 8' for metric in metrics)
+    content = (
+        f"你是严格的评审员。请逐条评审下面{len(items)}条模型回答，按以下指标分别打0-10的整数分：\n"
+        f"{criteria}\n\n"
+        + "\n\n".join(blocks)
+        + "\n\n只输出JSON数组，用```json代码块包裹，每条回答一个对象，index 与上面的序号对应，例如：\n"
+        f'```json\n[{{"index": 1, {example}}}]\n```'
+    )
+    return [{"role": "user", "content": content}]
+
+
+def parse_judgements(content, count, metrics):
+    """
+    解析评审模型的输出
+
+    Returns:
+        序号（从1开始）到 {指标: 0-1得分} 的字典，缺少或无法解析的条目不出现
+    """
+    items, _ = extract_json_array(content)
+    judgements = {}
+    for position, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("index", position))
+        except (TypeError, ValueError):
+            continue
+        if not 1 <= index <= count:
+            continue
+        scores = {}
+        for metric in metrics:
+            try:
+                value = float(item[metric])
+            except (KeyError, TypeError, ValueError):
+                continue
+            scores[metric] = round(min(max(value / JUDGE_SCALE, 0.0), 1.0), 4)
+        if scores:
+            judgements[index] = scores
+    return judgements
+
+
+class JudgeBatcher:
+    """
+    评审请求的合批器
+
+    各评测任务并发提交待评回答，凑满 batch_size 条或等待 max_wait 秒后合并为一次评审调用；
+    相同 (题目, 回答, 指标) 的请求先查缓存，在途时共享同一个结果
+    """
+
+    def __init__(self, llm_client=None, model=JUDGE_MODEL, batch_size=JUDGE_BATCH_SIZE, max_wait=JUDGE_MAX_WAIT, cache=None):
+        """
+        初始化合批器
+
+        Args:
+            llm_client: 大模型客户端，默认使用进程内共享的客户端
+            model: 评审模型ID
+            batch_size: 每次评审调用包含的回答数
+            max_wait: 凑批的最长等待时间（秒）
+            cache: 评审结果缓存，默认使用 JUDGE_CACHE_DIR 下的两级缓存
+        """
+        self._llm_client = llm_client
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.cache = cache if cache is not None else CompletionCache(
+            cache_dir=os.getenv("JUDGE_CACHE_DIR", "cache/judgements")
+        )
+        self._pending = []   # [(键, 题目, 回答, 指标, future)]
+        self._waiting = {}   # 键 -> future，在途的相同请求共享
+        self._timer = None
+        self._batches = set()
+
+    @property
+    def llm_client(self):
+        return self._llm_client or get_llm_client()
+
+    async def judge(self, question, response, metrics):
+        """
+        评审一条回答
+
+        Returns:
+            {指标: 0-1得分}，评审失败的指标为 None
+        """
+        metrics = list(metrics)
+        key = judge_key(question, response, metrics, self.model)
+        cached = self.cache.get_memory(key)
+        if cached is None:
+            cached = await asyncio.to_thread(self.cache.get_disk, key)
+        if cached is not None:
+            evaluation_scores.inc(len(metrics), method="judge_cached")
+            return cached
+        future = self._waiting.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[key] = future
+            self._pending.append((key, question, response, metrics, future))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        # shield：调用方被取消时评审照常完成并写入缓存，其他等待方不受影响
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        metrics = list(dict.fromkeys(metric for _, _, _, item_metrics, _ in batch for metric in item_metrics))
+        judge_batch_size.observe(len(batch))
+        judgements = {}
+        try:
+            messages = build_judge_messages([(question, response) for _, question, response, _, _ in batch], metrics)
+            content = await self.llm_client.chat(
+                self.model, messages, use_cache=False, temperature=0, max_tokens=64 + 32 * len(batch) * len(metrics)
+            )
+            judgements = parse_judgements(content, len(batch), metrics)
+            judge_calls.inc(outcome="ok" if len(judgements) == len(batch) else "partial")
+        except Exception as e:
+            judge_calls.inc(outcome="error")
+            print(f"评审调用失败: {str(e)}")
+        finally:
+            # 先让等待方拿到结果（取消时各指标为 None），再写缓存
+            results = []
+            for index, (key, _, _, item_metrics, future) in enumerate(batch, start=1):
+                scores = judgements.get(index, {})
+                result = {metric: scores.get(metric) for metric in item_metrics}
+                results.append((key, result))
+                self._waiting.pop(key, None)
+                if not future.done():
+                    future.set_result(result)
+        for key, result in results:
+            if all(value is not None for value in result.values()):
+                evaluation_scores.inc(len(result), method="judge")
+                await asyncio.to_thread(self.cache.set, key, result)
+
+
+# 进程内共享的合批器
+_judge = None
+
+
+def get_judge():
+    """
+    获取进程内共享的评审合批器
+    """
+    global _judge
+    if _judge is None:
+        _judge = JudgeBatcher()
+    return _judge
+
+
+async def score_response(question, response, metrics, judge=None):
+    """
+    为一条回答按各指标打分
+
+    选择题（标准答案为 A-D）的 accuracy 在本地判分：提取回答所选的选项，与答案一致为1，否则为0；
+    其余指标及非选择题交给评审模型批量评审
+
+    Args:
+        question: 题目
+        response: 模型回答
+        metrics: 指标列表
+        judge: 评审合批器，默认使用进程内共享的合批器
+
+    Returns:
+        (各指标得分字典, 提取出的选项)，非选择题提取结果为 None
+    """
+    scores = {}
+    choice = None
+    answer = normalize_answer(question.get("answer")) if question.get("type") == "multiple_choice" else None
+    if answer is not None:
+        choice = extract_choice(response, question.get("options"))
+        for metric in metrics:
+            if metric in LOCAL_METRICS:
+                scores[metric] = 1.0 if choice == answer else 0.0
+                evaluation_scores.inc(method="local")
+    remaining = [metric for metric in metrics if metric not in scores]
+    if remaining:
+        scores.update(await (judge or get_judge()).judge(question, response, remaining))
+    return {metric: scores.get(metric) for metric in metrics}, choice
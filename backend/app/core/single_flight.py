@@ -0,0 +1,75 @@
+import asyncio
+
+# 请求合并（single-flight）：相同的请求同时在途时只实际执行一次，所有等待方共享同一个结果
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    按键合并并发的相同调用
+
+    首个请求把调用放到独立的任务中执行，之后到达的相同请求直接等待该任务；
+    任务结束后立即移除，后续请求重新执行（缓存由调用方负责）。
+    单个等待方被取消不影响其他等待方，所有等待方都离开时才取消在途的调用
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.stats = {"calls": 0, "coalesced": 0, "abandoned": 0}
+
+    def __contains__(self, key):
+        return key in self._flights
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key, factory):
+        """
+        执行或加入键对应的调用
+
+        Args:
+            key: 请求键，键相同的请求视为同一个调用
+            factory: 无参协程函数，只在没有相同请求在途时调用
+
+        Returns:
+            调用结果；调用抛出的异常会传给所有等待方
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        flight.waiters += 1
+        try:
+            # shield：等待方被取消时只是不再等待，调用本身继续为其他等待方执行
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 没有人再等待结果，先移出在途表，避免新请求加入一个正在取消的调用
+                self._remove(key, flight)
+                flight.task.cancel()
+                self.stats["abandoned"] += 1
+
+    def _remove(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finish(self, key, flight):
+        self._remove(key, flight)
+        # 取走异常，避免所有等待方都已离开时出现 "exception was never retrieved" 警告
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self):
+        return {**self.stats, "in_flight": len(self._flights)}
@@ -1,5 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import re
+import time
+import uuid
 import uvicorn
 
 app = FastAPI(
@@ -15,17 +19,99 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],  # 浏览器端读取分页游标与 ETag
 )
 
 # 导入API路由
 from app.api import api_router
+from app.core.metrics import http_request_seconds, metrics, tracer
+
+def _route_template(request):
+    # 按路由模板而不是实际路径分组，避免路径参数导致标签取值无限增长；
+    # 子路由中的模板不含前缀，前缀从实际路径中截取
+    route = request.scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    params = request.scope.get("path_params") or {}
+    rendered = re.sub(r"\{(\w+)(?::\w+)?\}", lambda m: str(params.get(m.group(1), m.group(0))), template)
+    path = request.url.path
+    return path[:len(path) - len(rendered)] + template if path.endswith(rendered) else template
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # 记录请求耗时；开启追踪时以请求ID作为调用链ID，请求中的大模型调用、出题各阶段都记录在这条链下
+    trace_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    start = time.perf_counter()
+    status = 500
+    try:
+        with tracer.span("http.request", trace_id=trace_id, method=request.method, path=request.url.path) as span:
+            response = await call_next(request)
+            status = response.status_code
+            if span is not None:
+                span.attributes["status"] = status
+    finally:
+        http_request_seconds.observe(
+            time.perf_counter() - start, method=request.method, route=_route_template(request), status=status
+        )
+    response.headers["X-Request-ID"] = trace_id
+    return response
 
 @app.get("/")
 async def root():
     return {"message": "欢迎使用大模型评测平台API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus 文本格式的运行指标
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/traces")
+async def list_traces(limit: int = 20):
+    """
+    最近的调用链概要，需设置 TRACING_ENABLED=1
+    """
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="未开启调用链追踪，请设置 TRACING_ENABLED=1")
+    return tracer.recent(limit)
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """
+    单条调用链的全部span，trace_id 即响应头中的 X-Request-ID
+    """
+    trace = tracer.get_trace(trace_id) if tracer.enabled else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"调用链不存在: {trace_id}")
+    return trace
+
 # 注册API路由
 app.include_router(api_router, prefix="/api")
 
+from app.core.llm_client import close_llm_client
+from app.core.local_inference import close_local_engine
+from app.core.document_processing import shutdown_process_pool
+from app.core.evaluation_jobs import EVALUATION_AUTO_RESUME, evaluation_jobs
+from app.core.data_import import import_jobs
+from app.core.repository import close_repository
+
+@app.on_event("startup")
+async def startup():
+    # 从检查点继续上次进程退出时未结束的评测任务，已完成的题目不再调用模型
+    if EVALUATION_AUTO_RESUME:
+        await evaluation_jobs.resume_interrupted()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # 停止评测与导入任务，关闭共享的大模型连接池、本地推理引擎、文档解析进程池与数据仓库连接
+    await evaluation_jobs.shutdown()
+    await import_jobs.shutdown()
+    await close_llm_client()
+    await close_local_engine()
+    shutdown_process_pool()
+    close_repository()
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
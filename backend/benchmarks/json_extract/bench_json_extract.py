@@ -0,0 +1,106 @@
+"""
+题目JSON解析微基准
+
+对比旧的正则修复链（一次 re.search + 四次 re.sub，失败后再 re.sub 一次重新解析）
+与单遍容错解析器 extract_json_array 在语料与不同规模输入上的成功率和耗时。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.json_extract.bench_json_extract
+"""
+import json
+import re
+import sys
+import time
+from json import JSONDecodeError
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.core.json_extract import extract_json_array
+
+HERE = Path(__file__).resolve().parent
+
+
+def legacy_parse(content):
+    """
+    旧版 generate_from_prompt 中的解析流程，保留用于对比
+    """
+    json_str = re.search(r'```json\n(.*?)\n```', content, re.DOTALL).group(1).strip()
+    json_str = re.sub(r"(?<!\\)'", '"', json_str)
+    json_str = re.sub(r',\s*([}\]])', r'\1', json_str)
+    json_str = re.sub(r'(\{|,)\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*:', r'\1"\2":', json_str)
+    json_str = re.sub(r'}\s*{', r'},{', json_str)
+    try:
+        return json.loads(json_str)
+    except JSONDecodeError:
+        json_str = re.sub(r'[\x00-\x1F\x7F]', '', json_str)
+        return json.loads(json_str)
+
+
+def new_parse(content):
+    items, _ = extract_json_array(content)
+    return items
+
+
+def load_corpus():
+    expected = json.loads((HERE / "expected.json").read_text(encoding="utf-8"))
+    corpus = {}
+    for name in expected:
+        with open(HERE / "corpus" / name, encoding="utf-8", newline="") as f:
+            corpus[name] = f.read()
+    return corpus, expected
+
+
+def make_batch(num_questions):
+    questions = [
+        {
+            "id": i + 1,
+            "type": "multiple_choice",
+            "content": f"这是第{i + 1}道关于数据结构与算法的题目，下列说法正确的是？",
+            "options": ["A. 选项一", "B. 选项二", "C. 选项三", "D. 选项四"],
+            "answer": "ABCD"[i % 4],
+        }
+        for i in range(num_questions)
+    ]
+    return "```json\n" + json.dumps(questions, ensure_ascii=False, indent=2) + "\n```"
+
+
+def timeit(func, content, repeat):
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(content)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def main():
+    corpus, expected = load_corpus()
+    print("== 语料恢复情况（恢复题数 / 期望题数） ==")
+    print(f"{'样本':<36}{'旧解析':>10}{'新解析':>10}")
+    legacy_ok = new_ok = 0
+    for name, content in corpus.items():
+        try:
+            legacy = len(legacy_parse(content))
+        except Exception:
+            legacy = 0
+        new = len(new_parse(content))
+        legacy_ok += legacy >= expected[name]
+        new_ok += new >= expected[name]
+        print(f"{name:<36}{legacy:>7}/{expected[name]:<2}{new:>7}/{expected[name]:<2}")
+    print(f"完全恢复：旧解析 {legacy_ok}/{len(corpus)}，新解析 {new_ok}/{len(corpus)}")
+
+    print()
+    print("== 耗时（合法输入，取三轮最优的单次平均值） ==")
+    print(f"{'题数':>6}{'字符数':>10}{'旧解析(us)':>14}{'新解析(us)':>14}")
+    for num_questions in (5, 20, 50, 200):
+        content = make_batch(num_questions)
+        repeat = max(10, 2000 // num_questions)
+        legacy = timeit(legacy_parse, content, repeat) * 1e6
+        new = timeit(new_parse, content, repeat) * 1e6
+        print(f"{num_questions:>6}{len(content):>10}{legacy:>14.1f}{new:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
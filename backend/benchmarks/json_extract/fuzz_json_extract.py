@@ -0,0 +1,95 @@
+"""
+题目JSON解析模糊测试
+
+以语料中的真实异常输出为种子做随机变异（截断、删除、插入、替换结构字符），检查：
+  - extract_json_array 不抛出异常，返回值结构正确
+  - 在任意位置截断时恢复出的题目（对象）数不超过完整输出，且随截断位置单调不减
+  - 耗时随输入长度线性增长
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.json_extract.fuzz_json_extract [迭代次数] [随机种子]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.core.json_extract import extract_json_array
+from benchmarks.json_extract.bench_json_extract import load_corpus, make_batch
+
+STRUCTURAL = list("{}[],:\"' \n\\") + ["```", "```json\n", "'s", "true", "None", "\x00", "中"]
+
+
+def mutate(text, rng):
+    pos = rng.randrange(len(text) + 1)
+    action = rng.randrange(4)
+    if action == 0:
+        return text[:pos]
+    if action == 1:
+        end = min(len(text), pos + rng.randint(1, 8))
+        return text[:pos] + text[end:]
+    if action == 2:
+        return text[:pos] + rng.choice(STRUCTURAL) + text[pos:]
+    return text[:pos] + rng.choice(STRUCTURAL) + text[pos + 1:]
+
+
+def check(text):
+    items, report = extract_json_array(text)
+    assert isinstance(items, list), text
+    assert set(report) == {"found", "truncated", "skipped", "repairs"}, report
+    return items, report
+
+
+def count_objects(text):
+    return sum(isinstance(item, dict) for item in check(text)[0])
+
+
+def fuzz_truncation(corpus):
+    for name, content in corpus.items():
+        full = count_objects(content)
+        previous = 0
+        for end in range(len(content) + 1):
+            count = count_objects(content[:end])
+            assert count <= full, (name, end, count, full)
+            assert count >= previous, (name, end, count, previous)
+            previous = count
+    print(f"截断检查通过：{len(corpus)} 个样本的全部前缀")
+
+
+def fuzz_mutation(corpus, iterations, seed):
+    rng = random.Random(seed)
+    seeds = list(corpus.values())
+    for _ in range(iterations):
+        text = rng.choice(seeds)
+        for _ in range(rng.randint(1, 5)):
+            text = mutate(text, rng)
+        check(text)
+    print(f"变异检查通过：{iterations} 次，随机种子 {seed}")
+
+
+def check_linear_time():
+    timings = []
+    for num_questions in (100, 800):
+        content = make_batch(num_questions)
+        start = time.perf_counter()
+        check(content)
+        timings.append((len(content), time.perf_counter() - start))
+    (small_len, small_time), (large_len, large_time) = timings
+    ratio = (large_time / small_time) / (large_len / small_len)
+    print(f"耗时增长与输入长度之比：{ratio:.2f}（接近1为线性）")
+    assert ratio < 3, ratio
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 20240601
+    corpus, _ = load_corpus()
+    fuzz_truncation(corpus)
+    fuzz_mutation(corpus, iterations, seed)
+    check_linear_time()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+端到端压测
+
+在指定并发下反复调用后端热点接口，统计每个场景的 p50/p95/p99 延迟与吞吐：
+    from-prompt  POST /api/question-generation/from-prompt（关闭补全缓存）
+    upload       POST /api/document-analysis/upload（每次上传内容不同的文本文档）
+    evaluate     POST /api/model-evaluation/evaluate 后轮询 /results/{id} 直到结束，计端到端耗时
+    export       POST /api/data-management/export-file 导出评测结果（NDJSON，完整读取响应）
+
+默认使用 --spawn 在临时数据目录中启动模拟大模型服务与后端，大模型地址全部指向模拟服务、
+关闭后端的请求数/token配额限制，结果只反映本服务自身的开销；也可以用 --base-url 压测已经启动的服务。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.load.bench_endpoints --concurrency 1,8,32 --requests 64
+    python -m benchmarks.load.bench_endpoints --save baseline.json
+    python -m benchmarks.load.bench_endpoints --baseline baseline.json --max-regression 0.2
+
+指定 --baseline 时，任一场景的 p95 比基线慢超过 --max-regression 的比例即以退出码1结束，可用于上线前检查。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+SCENARIOS = ["from-prompt", "upload", "evaluate", "export"]
+PROVIDER_NAMES = ["SILICONFLOW", "OPENAI", "ZHIPU", "WENXIN", "LOCAL_LLM"]
+# 评测场景每次提交的题目数与轮询间隔
+EVALUATION_QUESTIONS = 10
+POLL_INTERVAL = 0.05
+
+
+def percentile(sorted_values, q):
+    """
+    最近秩法求分位数
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+async def scenario_from_prompt(client, i):
+    response = await client.post("/api/question-generation/from-prompt", json={
+        "prompt": f"压测提示词 {i} {uuid.uuid4().hex[:8]}",
+        "num_questions": 5,
+        "use_cache": False,
+    })
+    response.raise_for_status()
+
+
+async def scenario_upload(client, i):
+    paragraphs = [f"第{p}段：压测文档{i}-{uuid.uuid4().hex}。" + "内容" * 200 for p in range(8)]
+    response = await client.post(
+        "/api/document-analysis/upload",
+        files={"file": (f"bench-{i}.txt", "\n\n".join(paragraphs).encode("utf-8"), "text/plain")},
+        data={"num_questions": "5"},
+    )
+    response.raise_for_status()
+
+
+async def scenario_evaluate(client, i):
+    questions = [
+        {"id": f"q{n}", "type": "multiple_choice", "content": f"压测题目{i}-{n}-{uuid.uuid4().hex[:8]}",
+         "options": ["A. 1", "B. 2", "C. 3", "D. 4"], "answer": "A"}
+        for n in range(EVALUATION_QUESTIONS)
+    ]
+    response = await client.post("/api/model-evaluation/evaluate", json={
+        "model_id": "glm-4", "questions": questions, "use_cache": False,
+    })
+    response.raise_for_status()
+    evaluation_id = response.json()["evaluation_id"]
+    while True:
+        result = await client.get(f"/api/model-evaluation/results/{evaluation_id}")
+        result.raise_for_status()
+        status = result.json()["status"]
+        if status not in ("pending", "running"):
+            if status != "completed":
+                raise RuntimeError(f"评测未完成: {status}")
+            return
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def scenario_export(client, i):
+    async with client.stream("POST", "/api/data-management/export-file", json={
+        "data_type": "evaluation_results", "format": "ndjson",
+    }) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+
+
+SCENARIO_FUNCTIONS = {
+    "from-prompt": scenario_from_prompt,
+    "upload": scenario_upload,
+    "evaluate": scenario_evaluate,
+    "export": scenario_export,
+}
+
+
+async def run_level(base_url, scenario, concurrency, total):
+    """
+    以固定并发执行 total 次请求
+
+    Returns:
+        统计结果字典
+    """
+    function = SCENARIO_FUNCTIONS[scenario]
+    latencies = []
+    errors = []
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    await function(client, i)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _wait_ready(url, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出: {' '.join(process.args)}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def spawn_services(args, work_dir):
+    """
+    启动模拟大模型服务与后端，后端的数据、缓存目录均放在临时目录中
+
+    Returns:
+        (后端地址, 进程列表)
+    """
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.load.mock_llm_server",
+        "--port", str(args.mock_port),
+        "--latency-median", str(args.latency_median),
+        "--latency-sigma", str(args.latency_sigma),
+        "--token-rate", str(args.token_rate),
+        "--malformed-rate", str(args.malformed_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--seed", "0",
+    ], cwd=BACKEND_DIR)
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": str(work_dir / "data"),
+        "COMPLETION_CACHE_DIR": str(work_dir / "cache"),
+        "JUDGE_CACHE_DIR": str(work_dir / "judgements"),
+        "DOCUMENT_SPOOL_DIR": str(work_dir),
+    })
+    for name in PROVIDER_NAMES:
+        env[f"{name}_BASE_URL"] = f"{mock_url}/v1"
+        # 云端服务必须配置密钥才会发起调用，模拟服务不校验密钥
+        env.setdefault(f"{name}_API_KEY", "mock")
+    for provider in ["SILICONFLOW", "OPENAI", "ZHIPU", "WENXIN", "LOCAL"]:
+        # 0 表示不限制，压测只衡量本服务的开销
+        env[f"{provider}_RPM"] = "0"
+        env[f"{provider}_TPM"] = "0"
+        env[f"{provider}_MAX_CONCURRENCY"] = str(max(64, max(args.concurrency) * 4))
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--port", str(args.app_port), "--log-level", "warning",
+    ], cwd=BACKEND_DIR, env=env)
+    processes = [mock, app]
+    try:
+        _wait_ready(f"{mock_url}/stats", mock)
+        _wait_ready(f"http://127.0.0.1:{args.app_port}/", app)
+    except Exception:
+        stop_services(processes)
+        raise
+    return f"http://127.0.0.1:{args.app_port}", processes
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _ms(value):
+    return f"{value * 1000:9.1f}" if value is not None else "        -"
+
+
+def print_report(results):
+    print(f"{'场景':<12}{'并发':>6}{'成功':>7}{'失败':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'rps':>9}")
+    for r in results:
+        print(f"{r['scenario']:<12}{r['concurrency']:>6}{r['ok']:>7}{r['errors']:>6}"
+              f"{_ms(r['p50'])} {_ms(r['p95'])} {_ms(r['p99'])}{r['rps']:>9.1f}")
+        if r["first_error"]:
+            print(f"    首个错误: {r['first_error'][:200]}")
+
+
+def compare_with_baseline(results, baseline, max_regression):
+    """
+    与基线比较 p95 延迟
+
+    Returns:
+        超出允许范围的场景描述列表
+    """
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get((r["scenario"], r["concurrency"]))
+        if base is None or not base.get("p95") or r["p95"] is None:
+            continue
+        ratio = r["p95"] / base["p95"] - 1
+        if ratio > max_regression:
+            regressions.append(
+                f"{r['scenario']} 并发{r['concurrency']}: p95 {base['p95'] * 1000:.1f}ms -> {r['p95'] * 1000:.1f}ms (+{ratio:.0%})"
+            )
+    return regressions
+
+
+async def run_all(base_url, scenarios, concurrency_levels, total):
+    results = []
+    for scenario in scenarios:
+        for concurrency in concurrency_levels:
+            results.append(await run_level(base_url, scenario, concurrency, max(total, concurrency)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端热点接口端到端压测")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，可选 {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发数")
+    parser.add_argument("--requests", type=int, default=64, help="每个并发级别的请求数")
+    parser.add_argument("--base-url", default=None, help="压测已启动的后端，不指定时自动启动模拟服务与后端")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--mock-port", type=int, default=8101)
+    parser.add_argument("--latency-median", type=float, default=0.2)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--save", default=None, help="将结果保存为JSON，可作为之后的基线")
+    parser.add_argument("--baseline", default=None, help="基线结果JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的p95变慢比例")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in scenarios if s not in SCENARIO_FUNCTIONS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        base_url = args.base_url
+        if base_url is None:
+            base_url, processes = spawn_services(args, Path(work_dir))
+        try:
+            results = asyncio.run(run_all(base_url, scenarios, args.concurrency, args.requests))
+        finally:
+            stop_services(processes)
+
+    print_report(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\n性能回退：")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\n与基线相比没有超出允许范围的回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+本地模拟的 OpenAI 兼容大模型服务
+
+实现 POST /v1/chat/completions（含 stream=true 的SSE流式输出），用于压测与离线联调，不消耗真实配额：
+    - 首字延迟服从对数正态分布（--latency-median / --latency-sigma）
+    - 按 --token-rate 的速度"生成"内容，非流式请求在生成完后一次返回
+    - 按 --malformed-rate 的比例返回有格式问题的题目JSON（截断、末尾逗号、缺少逗号）
+    - 按 --throttle-rate 的比例返回 429 并带 Retry-After
+出题请求（提示词中包含"生成N道"）返回N道选择题的JSON代码块，批量评审请求返回各条回答的随机得分，
+其余请求返回简短的作答文本。
+GET /stats 返回请求计数。
+
+运行方式（在 backend 目录下）：
+    python -m benchmarks.load.mock_llm_server --port 8001 --latency-median 0.5 --token-rate 200
+
+让后端调用模拟服务：将 SILICONFLOW_BASE_URL / OPENAI_BASE_URL / ZHIPU_BASE_URL / WENXIN_BASE_URL /
+LOCAL_LLM_BASE_URL 设置为 http://127.0.0.1:8001/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 每个token约对应的字符数，用于按token速率切分流式输出
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class MockConfig:
+    latency_median: float = 0.3   # 首字延迟中位数（秒）
+    latency_sigma: float = 0.5    # 首字延迟对数正态分布的sigma，0为固定延迟
+    token_rate: float = 0.0       # 每秒生成的token数，0表示不模拟生成耗时
+    malformed_rate: float = 0.0   # 返回格式有问题的JSON的比例
+    throttle_rate: float = 0.0    # 返回429的比例
+    retry_after: float = 1.0      # 429响应的 Retry-After（秒）
+    seed: int = None
+
+
+def _questions(count, malformed, rng):
+    questions = [
+        {
+            "id": i + 1,
+            "type": "multiple_choice",
+            "content": f"模拟题目{uuid.uuid4().hex[:12]}：以下哪个选项是正确的？",
+            "options": ["A. 选项一", "B. 选项二", "C. 选项三", "D. 选项四"],
+            "answer": rng.choice("ABCD"),
+        }
+        for i in range(count)
+    ]
+    text = json.dumps(questions, ensure_ascii=False, indent=2)
+    if malformed:
+        damage = rng.choice(["truncate", "trailing_comma", "missing_comma"])
+        if damage == "truncate":
+            text = text[:int(len(text) * rng.uniform(0.5, 0.95))]
+        elif damage == "trailing_comma":
+            text = text.replace("\n  }", ",\n  }", 1)
+        else:
+            text = text.replace('",\n    "options"', '"\n    "options"', 1)
+    return f"```json\n{text}\n```"
+
+
+def _completion_text(payload, malformed, rng):
+    messages = payload.get("messages") or []
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    match = re.search(r"生成(\d+)道", prompt)
+    if match:
+        return _questions(int(match.group(1)), malformed, rng)
+    match = re.search(r"逐条评审下面(\d+)条", prompt)
+    if match:
+        metrics = re.findall(r"^- (\w+):", prompt, re.M)
+        judgements = [
+            {"index": i + 1, **{metric: rng.randint(5, 10) for metric in metrics}} for i in range(int(match.group(1)))
+        ]
+        return f"```json\n{json.dumps(judgements)}\n```"
+    return f"答案：{rng.choice('ABCD')}。这是模拟模型对问题的回答。"
+
+
+def create_app(config=None):
+    """
+    创建模拟服务应用
+
+    Args:
+        config: MockConfig，默认使用默认参数
+    """
+    config = config or MockConfig()
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "streams": 0, "throttled": 0, "malformed": 0}
+    app = FastAPI(title="模拟大模型服务")
+
+    def first_token_delay():
+        if config.latency_sigma <= 0:
+            return config.latency_median
+        return rng.lognormvariate(0, config.latency_sigma) * config.latency_median
+
+    def generation_time(text):
+        return len(text) / CHARS_PER_TOKEN / config.token_rate if config.token_rate > 0 else 0.0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        stats["requests"] += 1
+        if rng.random() < config.throttle_rate:
+            stats["throttled"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "rate limit exceeded", "type": "rate_limit"}},
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        malformed = rng.random() < config.malformed_rate
+        if malformed:
+            stats["malformed"] += 1
+        text = _completion_text(payload, malformed, rng)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in payload.get("messages", [])) // CHARS_PER_TOKEN
+        completion_tokens = len(text) // CHARS_PER_TOKEN + 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = payload.get("model", "mock")
+        delay = first_token_delay()
+
+        if payload.get("stream"):
+            stats["streams"] += 1
+
+            async def events():
+                await asyncio.sleep(delay)
+                step = CHARS_PER_TOKEN
+                interval = 1 / config.token_rate if config.token_rate > 0 else 0.0
+                for start in range(0, len(text), step):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": text[start:start + step]}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    if interval:
+                        await asyncio.sleep(interval)
+                done = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(done)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay + generation_time(text))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-median", type=float, default=0.3, help="首字延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="首字延迟对数正态分布的sigma")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒生成的token数，0为不模拟生成耗时")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回格式有问题的JSON的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        token_rate=args.token_rate,
+        malformed_rate=args.malformed_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
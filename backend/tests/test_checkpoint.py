@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core import checkpoint, evaluation_jobs, repository
+from app.core.checkpoint import CheckpointLog, RunLock
+from app.core.evaluation_jobs import COMPLETED, INTERRUPTED, RUNNING, EvaluationJob, EvaluationJobManager, checkpoint_key
+from app.core.repository import SQLiteRepository
+
+# 检查点日志的测试：崩溃留下的不完整末行被截掉、按幂等键读取、fsync 批量执行，
+# 以及评测任务从日志继续时只为未完成的题目调用模型
+
+
+def _lines(path):
+    return path.read_bytes().splitlines(keepends=True)
+
+
+def _response(question_id, score):
+    return {"question_id": question_id, "model_id": "m", "response_content": "A", "score": score}
+
+
+def test_open_trims_torn_tail_and_appends_after_it(tmp_path):
+    path = tmp_path / "job" / "results.jsonl"
+    log = CheckpointLog(path).open()
+    log.append("a", {"value": 1})
+    log.append("b", {"value": 2})
+    log.close()
+    # 模拟写到一半时崩溃
+    with open(path, "ab") as f:
+        f.write(b'{"value": 3, "ke')
+    assert list(CheckpointLog.read(path)) == ["a", "b"]
+
+    log = CheckpointLog(path).open()
+    assert log.size == 2
+    log.append("c", {"value": 3})
+    log.close()
+    assert len(_lines(path)) == 3
+    assert CheckpointLog.read(path) == {"a": {"value": 1}, "b": {"value": 2}, "c": {"value": 3}}
+
+
+def test_open_truncates_log_without_any_complete_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(b'{"value": 1')
+    log = CheckpointLog(path).open()
+    assert log.size == 0 and path.read_bytes() == b""
+    log.close(remove=True)
+    assert not path.exists()
+
+
+def test_read_keeps_last_record_per_key(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_bytes(
+        b'{"question_id": "q1", "score": null}\n'
+        b'{"value": 2, "key": "k2"}\n'
+        b"not json\n"
+        b"\n"
+        b'{"question_id": "q1", "score": 1.0}\n'
+    )
+    records = CheckpointLog.read(path, key=lambda record: record["question_id"])
+    # 顺序按幂等键首次出现，内容取最后一条（重试成功的结果追加在失败的结果之后）
+    assert list(records) == ["q1", "k2"]
+    assert records["q1"] == {"question_id": "q1", "score": 1.0}
+    assert CheckpointLog.read(tmp_path / "missing.jsonl") == {}
+
+
+def test_sync_is_batched_and_truncate_resets_the_log(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(checkpoint.os, "fsync", synced.append)
+    log = CheckpointLog(tmp_path / "results.jsonl", fsync_batch=3, fsync_interval=3600).open()
+    log.append("a", {})
+    log.append("b", {})
+    assert not log.sync_due()
+    log.append("c", {})
+    assert log.sync_due()
+    log.sync()
+    assert len(synced) == 1 and not log.sync_due()
+    # 没有新记录时不再 fsync
+    log.sync()
+    assert len(synced) == 1
+    log.truncate()
+    assert log.size == 0 and log.path.read_bytes() == b""
+    log.append("d", {})
+    log.close()
+    assert list(CheckpointLog.read(log.path)) == ["d"]
+
+
+@pytest.mark.skipif(checkpoint.fcntl is None, reason="没有 fcntl 的平台上不做跨进程互斥")
+def test_run_lock_is_exclusive(tmp_path):
+    path = tmp_path / "job" / "run.lock"
+    first, second = RunLock(path), RunLock(path)
+    assert not second.held_elsewhere() and not path.exists()
+    assert first.acquire() and first.acquire()
+    assert not second.acquire() and second.held_elsewhere()
+    first.release()
+    assert not second.held_elsewhere()
+    assert second.acquire()
+    second.release()
+
+
+def test_interrupted_evaluation_resumes_from_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(repository, "_repository", SQLiteRepository(str(tmp_path / "bank.db")))
+    calls = []
+
+    async def fake_answer(model_id, question_id, question, use_cache=True, metrics=("accuracy",)):
+        calls.append(question_id)
+        return _response(question_id, 1.0)
+
+    monkeypatch.setattr(evaluation_jobs, "answer_question", fake_answer)
+    questions = [{"id": f"q{i}", "content": f"题目{i}", "type": "multiple_choice"} for i in range(4)]
+    manager = EvaluationJobManager(data_dir=tmp_path)
+    job = EvaluationJob("eval-0123456789abcdef", "m", questions, ["accuracy"])
+    job.status = RUNNING
+    manager._write_meta(job)
+    # 上次运行写完了两道题，第三道写到一半时进程退出
+    log = CheckpointLog(manager.root / job.evaluation_id / "results.jsonl").open()
+    for question_id in ("q0", "q2"):
+        log.append(checkpoint_key("m", question_id), _response(question_id, 0.0))
+    log.close()
+    with open(log.path, "ab") as f:
+        f.write(json.dumps({"question_id": "q1"}).encode()[:10])
+
+    async def run():
+        loaded = await manager.get(job.evaluation_id)
+        state = (loaded.status, len(loaded.responses))
+        resumed = await manager.resume(job.evaluation_id)
+        await resumed.task
+        return state, resumed
+
+    state, resumed = asyncio.run(run())
+    assert state == (INTERRUPTED, 2)
+    assert sorted(calls) == ["q1", "q3"]
+    assert resumed.status == COMPLETED and len(resumed.responses) == 4
+    # 结束后结果已并入数据仓库，日志被删除
+    assert not log.path.exists()
+    assert repository.get_repository().count("evaluation_results", {"evaluation_id": job.evaluation_id}) == 4
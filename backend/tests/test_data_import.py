@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from app.core import data_import
+from app.core.data_import import ImportJob, prepare_record, run_import
+from app.core.dedup_index import NearDuplicateIndex
+from app.core.repository import SQLiteRepository
+
+# 流式导入的测试：CSV 与 NDJSON 文件中不合法的行被拒绝并记录行号，其余记录分批写入题库
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / "bank.db"))
+    # 每个测试使用独立的近似重复索引，避免进程内共享的索引残留其他测试的题目
+    index = NearDuplicateIndex()
+    monkeypatch.setattr(data_import, "get_dedup_index", lambda: index)
+    yield repository
+    repository.close()
+
+
+TOPICS = [
+    "光合作用的主要场所是哪种细胞器",
+    "牛顿第二定律描述了哪些物理量之间的关系",
+    "元素周期表中第一主族元素有什么共同性质",
+    "唐朝实行的科举制度包括哪些考试科目",
+    "二次函数图像的对称轴如何求得",
+    "地球自转产生了哪些地理现象",
+]
+
+
+def _question(i, **extra):
+    return {
+        "type": "multiple_choice",
+        "content": TOPICS[i],
+        "options": [f"A. {TOPICS[i][:4]}", f"B. {TOPICS[i][-4:]}"],
+        "answer": "A",
+        **extra,
+    }
+
+
+def _run(tmp_path, repository, import_format, text, batch_size=2):
+    path = tmp_path / f"upload.{import_format}"
+    path.write_text(text, encoding="utf-8")
+    job = ImportJob("job", "questions", import_format, path.name, path.stat().st_size, batch_size)
+    run_import(job, str(path), repository=repository)
+    return job
+
+
+def test_ndjson_import_rejects_bad_lines_and_keeps_the_rest(tmp_path, repository):
+    lines = [
+        json.dumps(_question(1), ensure_ascii=False),
+        '{"type": "multiple_choice", "content": ',
+        json.dumps({"type": "multiple_choice", "content": "缺少答案"}, ensure_ascii=False),
+        "",
+        json.dumps(_question(2, options="A. 不是数组"), ensure_ascii=False),
+        json.dumps(["不是对象"], ensure_ascii=False),
+        json.dumps(_question(3), ensure_ascii=False),
+        json.dumps(_question(4, tags="生物"), ensure_ascii=False),
+        json.dumps(_question(5), ensure_ascii=False),
+    ]
+    job = _run(tmp_path, repository, "ndjson", "\n".join(lines) + "\n")
+
+    assert job.accepted == 3 and job.rejected == 5
+    # 空行不计入记录序号
+    assert [error["record"] for error in job.errors] == [2, 3, 4, 5, 7]
+    assert job.errors[0]["error"].startswith("JSON格式错误")
+    assert job.errors[1]["error"] == "题目缺少字段: answer"
+    assert job.errors[2]["error"] == "字段 options 必须是字符串数组"
+    assert job.errors[3]["error"] == "每个条目必须是JSON对象"
+    assert job.errors[4]["error"] == "字段 tags 必须是字符串或数值组成的数组"
+    assert job.processed_bytes == job.total_bytes
+    stored = repository.find("questions")
+    assert sorted(q["content"] for q in stored) == sorted(_question(i)["content"] for i in (1, 3, 5))
+    assert all(q["tags"] == [] for q in stored)
+
+
+def test_csv_import_parses_json_cells_and_rejects_bad_rows(tmp_path, repository):
+    first, second = _question(1), _question(2)
+    text = "\n".join([
+        "id,type,content,options,answer,tags",
+        f'q1,multiple_choice,{first["content"]},"[""A. 甲"", ""B. 乙""]",A,"[""生物""]"',
+        f'q2,multiple_choice,{second["content"]},"[""A. 甲"", ",A,',
+        "q3,multiple_choice,,,B,",
+        f'q4,short_answer,{_question(4)["content"]},,答案,',
+    ]) + "\n"
+    job = _run(tmp_path, repository, "csv", text)
+
+    assert job.accepted == 2 and job.rejected == 2
+    assert [error["record"] for error in job.errors] == [2, 3]
+    assert job.errors[0]["error"].startswith("字段格式错误")
+    # 空单元格视为缺失字段
+    assert job.errors[1]["error"] == "题目缺少字段: content"
+    stored = {q["id"]: q for q in repository.find("questions")}
+    assert sorted(stored) == ["q1", "q4"]
+    assert stored["q1"]["options"] == ["A. 甲", "B. 乙"] and stored["q1"]["tags"] == ["生物"]
+    assert stored["q4"]["options"] == []
+
+
+def test_failed_batch_is_retried_record_by_record(tmp_path, repository, monkeypatch):
+    bulk_upsert = repository.bulk_upsert
+
+    def flaky_upsert(collection, documents):
+        if any(d["id"] == "bad" for d in documents):
+            raise RuntimeError("磁盘已满")
+        return bulk_upsert(collection, documents)
+
+    monkeypatch.setattr(repository, "bulk_upsert", flaky_upsert)
+    lines = [json.dumps(_question(i, id=question_id), ensure_ascii=False) for i, question_id in enumerate(["a", "bad", "c"])]
+    job = _run(tmp_path, repository, "ndjson", "\n".join(lines), batch_size=3)
+
+    assert job.accepted == 2
+    assert job.errors == [{"record": 2, "error": "写入失败: 磁盘已满"}]
+    assert sorted(q["id"] for q in repository.find("questions")) == ["a", "c"]
+    # 写入失败的题目不会进入近似重复索引
+    index = data_import.get_dedup_index()
+    assert index.query(_question(0), exclude_id="other")[0] == "a"
+    assert index.query(_question(1), exclude_id="other") is None
+
+
+def test_duplicates_within_the_file_are_flagged_or_rejected(tmp_path, repository, monkeypatch):
+    lines = [json.dumps(_question(1, id=question_id), ensure_ascii=False) for question_id in ("a", "b")]
+    job = _run(tmp_path, repository, "ndjson", "\n".join(lines))
+    assert job.accepted == 2 and job.duplicates == 1
+    assert repository.find_by_ids("questions", ["b"])[0]["duplicate_of"] == "a"
+
+    monkeypatch.setattr(data_import, "DEDUP_MODE", "reject")
+    job = _run(tmp_path, repository, "ndjson", json.dumps(_question(1, id="c"), ensure_ascii=False))
+    assert job.accepted == 0 and job.duplicates == 1
+    assert job.errors[0]["record"] == 1 and "近似重复" in job.errors[0]["error"]
+
+
+def test_prepare_record_derives_question_id_from_content():
+    first = prepare_record("questions", _question(1))
+    assert first["id"] == prepare_record("questions", _question(1))["id"]
+    assert first["tags"] == [] and "id" not in _question(1)
+    with pytest.raises(ValueError, match="字段必须是字符串: answer"):
+        prepare_record("questions", _question(1, answer=1))
+    with pytest.raises(ValueError, match="字段 id"):
+        prepare_record("questions", _question(1, id=["q1"]))
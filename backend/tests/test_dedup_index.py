@@ -0,0 +1,76 @@
+from app.core import dedup_index
+from app.core.dedup_index import NearDuplicateIndex, PendingDuplicates, shingles
+
+# 近似重复索引的测试：题干相似度门槛、文本规范化、同ID替换与批次内查重
+
+OPTIONS = [
+    "A. 使用 def 关键字并写出名称与参数列表",
+    "B. 使用 lambda 表达式创建匿名对象",
+    "C. 使用 import 语句从模块导入",
+    "D. 使用 with 语句管理上下文资源",
+]
+
+
+def _question(content, options=OPTIONS):
+    return {"type": "multiple_choice", "content": content, "options": list(options)}
+
+
+def test_same_options_with_different_stem_is_not_a_duplicate():
+    index = NearDuplicateIndex()
+    index.add("q1", _question("在Python中如何定义函数？"))
+    other = _question("在Python中如何定义类？")
+    values, _, stem_values = index.signature(other)
+    first, _, first_stem = index.signature(_question("在Python中如何定义函数？"))
+    # 选项占了大部分文本，整体相似度超过阈值，只有题干相似度把两道题区分开
+    assert (first == values).mean() >= index.threshold
+    assert (first_stem == stem_values).mean() < index.stem_threshold
+    assert index.query(other) is None
+    # 去掉题干门槛后同一对题目被视为重复
+    lenient = NearDuplicateIndex(stem_threshold=0.0)
+    lenient.add("q1", _question("在Python中如何定义函数？"))
+    assert lenient.query(other)[0] == "q1"
+
+
+def test_near_identical_question_matches_after_normalization():
+    index = NearDuplicateIndex()
+    index.add("q1", _question("在Python中如何定义函数？"))
+    rewritten = _question("在 Python 中，如何定义函数", ["(A) 使用def关键字并写出名称与参数列表"] + OPTIONS[1:])
+    assert index.query(rewritten) == ("q1", 1.0)
+    assert index.query(rewritten, exclude_id="q1") is None
+    assert index.query(_question("光合作用的主要场所是哪种细胞器", ["A. 叶绿体", "B. 线粒体"])) is None
+
+
+def test_shingles_strip_option_markers_and_punctuation():
+    assert shingles({"content": "定义，函数！", "options": ["A. 关键字"]}, size=2) == {"定义", "义函", "函数", "关键", "键字"}
+    assert shingles({"content": "", "options": []}) == set()
+    assert NearDuplicateIndex().signature({"content": " ？", "options": []}) is None
+
+
+def test_readding_an_id_replaces_its_entry(monkeypatch):
+    # 合并阈值调小，让部分条目进入有序数组、部分留在字典中
+    monkeypatch.setattr(dedup_index, "MERGE_SIZE", 2)
+    index = NearDuplicateIndex()
+    index.add("q1", _question("在Python中如何定义函数？"))
+    index.add("q2", _question("光合作用的主要场所是哪种细胞器", ["A. 叶绿体", "B. 线粒体"]))
+    index.add("q3", _question("牛顿第二定律描述了哪些物理量之间的关系", ["A. 力、质量与加速度", "B. 功与能量"]))
+    index.add("q1", _question("唐朝实行的科举制度包括哪些考试科目", ["A. 明经", "B. 进士"]))
+    assert len(index) == 3
+    assert index.query(_question("在Python中如何定义函数？")) is None
+    assert index.query(_question("唐朝实行的科举制度包括哪些考试科目", ["A. 明经", "B. 进士"]))[0] == "q1"
+    assert index.query(_question("光合作用的主要场所是哪种细胞器", ["A. 叶绿体", "B. 线粒体"]))[0] == "q2"
+
+
+def test_pending_duplicates_only_commit_written_questions():
+    index = NearDuplicateIndex()
+    pending = PendingDuplicates(index)
+    first = _question("在Python中如何定义函数？")
+    pending.add("q1", first, index.signature(first))
+    # 同一批次中的题目互相查重，题干不同的题目不算重复
+    assert pending.query("q2", index.signature(_question("在Python中如何定义函数"))) == ("q1", 1.0)
+    assert pending.query("q1", index.signature(first)) is None
+    assert pending.query("q3", index.signature(_question("在Python中如何定义类？"))) is None
+    second = _question("光合作用的主要场所是哪种细胞器", ["A. 叶绿体", "B. 线粒体"])
+    pending.add("q2", second, index.signature(second))
+    pending.commit({"q2"})
+    assert len(pending) == 0 and len(index) == 1
+    assert index.query(first) is None and index.query(second)[0] == "q2"
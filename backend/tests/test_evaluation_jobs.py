@@ -0,0 +1,116 @@
+import asyncio
+
+import numpy as np
+
+from app.core import evaluation_jobs, repository
+from app.core.evaluation_jobs import COMPLETED, RUNNING, EvaluationJob, EvaluationJobManager
+from app.core.repository import SQLiteRepository
+from app.core.score_aggregation import ScoreTable, aggregate_scores
+
+# 评测任务的测试：结果记录、失败题目的重试、汇总得分的刷新与置信区间的取值；
+# 模型调用替换为按题目返回预设得分的函数，数据仓库使用临时目录中的SQLite
+
+
+def _job(num_questions=4):
+    questions = [{"id": f"q{i}", "content": f"题目{i}", "type": "multiple_choice"} for i in range(num_questions)]
+    return EvaluationJob("eval-0123456789abcdef", "m", questions, ["accuracy"])
+
+
+def _response(question_id, score):
+    return {
+        "question_id": question_id,
+        "model_id": "m",
+        "response_content": "A",
+        "score": score,
+        "metrics_scores": {"accuracy": score},
+    }
+
+
+def test_running_job_refreshes_aggregate_at_most_once_per_interval(monkeypatch):
+    monkeypatch.setattr(evaluation_jobs, "EVALUATION_AGGREGATE_INTERVAL", 3600)
+    job = _job()
+    job.status = RUNNING
+
+    async def run():
+        job.record(_response("q0", 1.0))
+        await job.refresh_aggregate()
+        first = job.summary()
+        job.record(_response("q1", 0.0))
+        await job.refresh_aggregate()
+        throttled = job.summary()
+        job.status = COMPLETED
+        await job.refresh_aggregate()
+        return first, throttled, job.summary()
+
+    first, throttled, final = asyncio.run(run())
+    assert first["total_score"] == 1.0
+    # 间隔内不重新汇总，已完成数照常更新
+    assert throttled["total_score"] == 1.0 and throttled["completed"] == 2
+    assert job.aggregated_version == job.table.version and final["total_score"] == 0.5
+
+
+def test_confidence_interval_is_rounded_to_six_decimals():
+    table = ScoreTable(["accuracy"])
+    rng = np.random.default_rng(1)
+    for value in rng.random(200):
+        table.add("m", "multiple_choice", {"accuracy": float(value)})
+    low, high = aggregate_scores(table)["m"]["metrics_ci"]["accuracy"]
+    assert low < high
+    for bound in (low, high):
+        assert bound == round(bound, 6) and len(repr(bound).split(".")[1]) <= 6
+
+
+def test_copy_is_not_affected_by_later_rows():
+    table = ScoreTable(["accuracy"], capacity=1)
+    table.add("m", "a", {"accuracy": 1.0})
+    snapshot = table.copy()
+    table.add("m", "b", {"accuracy": 0.0})
+    assert snapshot.size == 1 and snapshot.categories == ["a"]
+    assert aggregate_scores(snapshot, n_bootstrap=0)["m"]["total_score"] == 1.0
+
+
+def test_failed_answers_are_replaced_in_place():
+    job = _job()
+    assert job.record(_response("q0", None))
+    assert job.record(_response("q1", 1.0))
+    job.compacted = 2
+    assert not job.is_answered("q0") and job.is_answered("q1")
+    # 成功的结果不会被覆盖，失败的结果不会覆盖失败的结果
+    assert not job.record(_response("q1", 0.0))
+    assert not job.record(_response("q0", None))
+    assert job.record(_response("q0", 0.5))
+    assert [r.score for r in job.responses] == [0.5, 1.0]
+    assert job.failed == 0 and job.stale == {0}
+    assert job.table.scores[0, 0] == 0.5
+
+
+def test_resume_retries_only_failed_questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(repository, "_repository", SQLiteRepository(str(tmp_path / "bank.db")))
+    outage = {"q1", "q3"}
+    calls = []
+
+    async def fake_answer(model_id, question_id, question, use_cache=True, metrics=("accuracy",)):
+        calls.append(question_id)
+        return _response(question_id, None if question_id in outage else 1.0)
+
+    monkeypatch.setattr(evaluation_jobs, "answer_question", fake_answer)
+
+    async def run():
+        manager = EvaluationJobManager(data_dir=tmp_path)
+        job = manager.submit("m", _job().questions, ["accuracy"])
+        await job.task
+        first = (job.status, job.failed, sorted(calls))
+        calls.clear()
+        outage.clear()
+        job = await manager.resume(job.evaluation_id)
+        await job.task
+        second = (job.status, job.failed, sorted(calls), [r.question_id for r in job.responses])
+        # 新的管理器从数据仓库还原，重试的结果已经替换了失败的记录
+        loaded = await EvaluationJobManager(data_dir=tmp_path).get(job.evaluation_id)
+        return first, second, loaded.failed, len(loaded.responses)
+
+    first, second, failed, count = asyncio.run(run())
+    assert first == (COMPLETED, 2, ["q0", "q1", "q2", "q3"])
+    assert second[:3] == (COMPLETED, 0, ["q1", "q3"])
+    assert sorted(second[3]) == ["q0", "q1", "q2", "q3"]
+    assert failed == 0 and count == 4
@@ -0,0 +1,46 @@
+from app.core.http_cache import ResponseCache, make_etag
+
+# 响应缓存的测试：LRU 淘汰、按集合失效，以及淘汰后集合登记随之清除
+
+
+def test_evicted_entries_are_removed_from_collection_index():
+    cache = ResponseCache(max_entries=2)
+    for i in range(100):
+        cache.put(("list", i), "e", b"{}", collections=("questions", "documents"))
+    assert len(cache) == 2
+    # 只有仍在缓存中的条目留有登记
+    assert cache._by_collection == {"questions": {("list", 98), ("list", 99)}, "documents": {("list", 98), ("list", 99)}}
+
+
+def test_lru_keeps_recently_read_entries():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "e1", b"a", collections=("questions",))
+    cache.put("b", "e1", b"b", collections=("questions",))
+    assert cache.get("a", "e1") == (b"a", {})
+    cache.put("c", "e1", b"c", collections=("documents",))
+    assert cache.get("b", "e1") is None and cache.get("a", "e1") == (b"a", {})
+    assert cache._by_collection == {"questions": {"a"}, "documents": {"c"}}
+    # ETag 不一致视为未命中
+    assert cache.get("a", "e2") is None
+
+
+def test_invalidate_clears_entries_and_their_other_registrations():
+    cache = ResponseCache(max_entries=8)
+    cache.put("both", "e", b"1", collections=("questions", "documents"))
+    cache.put("questions", "e", b"2", collections=("questions",))
+    cache.put("documents", "e", b"3", {"X-Total": "1"}, collections=("documents",))
+    cache.invalidate("questions")
+    assert len(cache) == 1 and cache.get("documents", "e") == (b"3", {"X-Total": "1"})
+    assert cache._by_collection == {"documents": {"documents"}}
+    # 同一个键重新缓存时按新的依赖登记
+    cache.put("documents", "e", b"4", collections=("evaluation_results",))
+    assert cache._by_collection == {"evaluation_results": {"documents"}}
+    cache.invalidate("documents")
+    assert cache.get("documents", "e") == (b"4", {})
+
+
+def test_oversized_bodies_are_not_cached_and_etags_are_stable():
+    cache = ResponseCache(max_bytes=4)
+    cache.put("big", "e", b"12345", collections=("questions",))
+    assert len(cache) == 0 and cache._by_collection == {}
+    assert make_etag("questions", 3, None) == make_etag("questions", 3, None) != make_etag("questions", 4, None)
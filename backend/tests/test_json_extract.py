@@ -0,0 +1,62 @@
+import pytest
+
+from app.core.json_extract import extract_json_array, loads_tolerant
+from app.core.json_stream import JSONArrayStream
+
+# 大模型回复的JSON提取测试：代码块、截断、常见的格式错误，以及流式增量解析
+
+
+def test_fenced_array_with_surrounding_text():
+    items, report = extract_json_array('说明如下：\n```json\n[{"id": 1, "content": "a"}, {"id": 2}]\n```\n以上')
+    assert items == [{"id": 1, "content": "a"}, {"id": 2}]
+    assert report == {"found": True, "truncated": False, "skipped": 0, "repairs": 0}
+
+
+def test_truncated_output_keeps_complete_elements():
+    items, report = extract_json_array('```json\n[{"id": 1, "content": "a"}, {"id": 2, "content": "b')
+    assert items == [{"id": 1, "content": "a"}]
+    assert report["truncated"] and report["found"]
+
+
+def test_common_syntax_errors_are_repaired():
+    items, report = extract_json_array('[{"id": 1, "content": "a",}, {id: 2, \'content\': "b"}]')
+    assert items == [{"id": 1, "content": "a"}, {"id": 2, "content": "b"}]
+    assert report["repairs"] > 0 and not report["skipped"]
+
+
+def test_raw_newline_inside_string():
+    items, _ = extract_json_array('[{"content": "第一行\n第二行"}]')
+    assert items == [{"content": "第一行\n第二行"}]
+
+
+def test_malformed_element_is_skipped_and_parsing_continues():
+    items, report = extract_json_array('[{"id": 1}, {"id": 2, "content": ]}, {"id": 3}]')
+    assert items == [{"id": 1}, {"id": 3}]
+    assert report["skipped"] == 1
+
+
+def test_concatenated_objects_are_treated_as_array():
+    items, _ = extract_json_array('{"id": 1} {"id": 2} 以上是题目')
+    assert items == [{"id": 1}, {"id": 2}]
+
+
+def test_reply_without_json():
+    items, report = extract_json_array("抱歉，我不能回答")
+    assert items == [] and not report["found"]
+
+
+def test_loads_tolerant():
+    assert loads_tolerant('{a: 1, "b": [1, 2,],}') == {"a": 1, "b": [1, 2]}
+    with pytest.raises(ValueError):
+        loads_tolerant('{"a": [1, 2')
+
+
+def test_stream_yields_objects_as_they_close():
+    stream = JSONArrayStream()
+    text = '```json\n[{"content": "a{b}"}, {"content": "c\\"d"}, {"content": "e'
+    closed = []
+    for i in range(0, len(text), 3):
+        closed.extend(stream.feed(text[i:i + 3]))
+    # 字符串中的括号与转义引号不影响对象边界，未闭合的最后一个对象不返回
+    assert closed == [{"content": "a{b}"}, {"content": "c\"d"}]
+    assert stream.started and not stream.finished and not stream.errors
@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.completion_cache import CompletionCache
+from app.core.llm_client import PROVIDERS, LLMClient, ProviderConfigError
+
+# 大模型客户端的测试：用 httpx.MockTransport 代替上游接口，补全缓存放在临时目录
+
+
+@pytest.fixture(autouse=True)
+def _api_key(monkeypatch):
+    monkeypatch.setitem(PROVIDERS["siliconflow"], "api_key", "test-key")
+
+
+def _client(tmp_path, replies):
+    """
+    创建依次返回 replies 中各段内容的客户端，返回 (客户端, 上游收到的请求数列表)
+    """
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        content = replies[min(len(calls), len(replies)) - 1]
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    client = LLMClient(cache=CompletionCache(cache_dir=str(tmp_path / "cache")))
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+def _content(result):
+    return result["choices"][0]["message"]["content"]
+
+
+def test_results_rejected_by_validate_are_not_cached(tmp_path):
+    client, calls = _client(tmp_path, ["截断的回复", "完整的回复"])
+    payload = {"model": "m", "messages": [{"role": "user", "content": "出题"}]}
+
+    def validate(result):
+        return _content(result) == "完整的回复"
+
+    async def run():
+        try:
+            first = await client.chat_completion(payload, use_cache=True, validate=validate)
+            second = await client.chat_completion(payload, use_cache=True, validate=validate)
+            third = await client.chat_completion(payload, use_cache=True, validate=validate)
+        finally:
+            await client.aclose()
+        return [_content(result) for result in (first, second, third)]
+
+    assert asyncio.run(run()) == ["截断的回复", "完整的回复", "完整的回复"]
+    assert len(calls) == 2
+
+
+def test_cached_entries_failing_validate_are_misses(tmp_path):
+    client, calls = _client(tmp_path, ["旧的回复", "新的回复"])
+    payload = {"model": "m", "messages": [{"role": "user", "content": "出题"}]}
+
+    async def run():
+        try:
+            await client.chat_completion(payload, use_cache=True)
+            result = await client.chat_completion(payload, use_cache=True, validate=lambda r: _content(r) != "旧的回复")
+        finally:
+            await client.aclose()
+        return _content(result)
+
+    assert asyncio.run(run()) == "新的回复"
+    assert len(calls) == 2
+
+
+def test_missing_api_key_fails_before_calling_provider(tmp_path, monkeypatch):
+    monkeypatch.setitem(PROVIDERS["siliconflow"], "api_key", None)
+    client, calls = _client(tmp_path, ["回复"])
+
+    async def run():
+        try:
+            await client.chat_completion({"model": "m", "messages": []})
+        finally:
+            await client.aclose()
+
+    with pytest.raises(ProviderConfigError, match="SILICONFLOW_API_KEY"):
+        asyncio.run(run())
+    assert calls == []
+
+
+def test_api_key_is_sent_as_bearer_token(tmp_path):
+    client, calls = _client(tmp_path, ["回复"])
+
+    async def run():
+        try:
+            await client.chat_completion({"model": "m", "messages": []})
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert calls[0].headers["Authorization"] == "Bearer test-key"
@@ -0,0 +1,268 @@
+import asyncio
+import contextlib
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.core import llm_client
+from app.core.llm_client import ProviderConfigError, check_model_configured
+from app.core.local_inference import LocalInferenceEngine, LocalInferenceError, split_at_stop
+
+# 本地推理引擎的测试：停止词与调度协程退出的处理不依赖 torch；
+# 批量解码先用 NumPy 实现的张量与假模型走一遍（不依赖 torch），再用一个极小的 torch 模型在CPU上走一遍，未安装 torch 时跳过后者；
+# 设置 LOCAL_INFERENCE_TEST_MODEL（如 Qwen/Qwen2.5-0.5B-Instruct）时另外用真实小模型在CPU上生成一次
+
+
+class CharTokenizer:
+    """
+    字符级分词器：字母 a-z 对应 0-25，26 为结束符
+    """
+
+    eos_token_id = 26
+    pad_token_id = 26
+    chat_template = None
+
+    def __call__(self, text):
+        return {"input_ids": [ord(char) % 26 for char in text]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(ord("a") + i) for i in ids if i != self.eos_token_id)
+
+
+def _payload(**extra):
+    return {"messages": [{"role": "user", "content": "hi"}], "temperature": 0, "max_tokens": 40, **extra}
+
+
+def test_split_at_stop():
+    assert split_at_stop("hello world", ["wor"]) == (6, True)
+    # 末尾可能是停止词的开头，暂不发送
+    assert split_at_stop("hello wo", ["world"]) == (6, False)
+    assert split_at_stop("hello", ["xyz"]) == (5, False)
+    assert split_at_stop("hello", []) == (5, False)
+
+
+def test_scheduler_exit_fails_pending_requests():
+    async def run():
+        engine = LocalInferenceEngine(
+            model=SimpleNamespace(config=SimpleNamespace()), tokenizer=CharTokenizer(), max_batch_size=1, max_wait=0
+        )
+        engine._torch = object()  # 跳过模型加载
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocked_batch(batch):
+            started.set()
+            release.wait(5)
+
+        engine._run_batch = blocked_batch
+
+        async def consume():
+            return [item async for item in engine.stream(_payload())]
+
+        running = asyncio.create_task(consume())
+        await asyncio.to_thread(started.wait, 5)
+        queued = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        engine._scheduler.cancel()
+        try:
+            for task in (running, queued):
+                with pytest.raises(LocalInferenceError):
+                    await asyncio.wait_for(task, 2)
+        finally:
+            release.set()
+            await engine.aclose()
+
+    asyncio.run(run())
+
+
+class ArrayTensor(np.ndarray):
+    """
+    用 NumPy 数组实现引擎在贪心解码中用到的张量方法
+    """
+
+    def to(self, device):
+        return self
+
+    def cumsum(self, dim):
+        return np.cumsum(np.asarray(self), axis=dim).view(ArrayTensor)
+
+    def clamp(self, min):
+        return np.maximum(np.asarray(self), min).view(ArrayTensor)
+
+    def argmax(self, dim):
+        return np.asarray(self).argmax(axis=dim).view(ArrayTensor)
+
+    def unsqueeze(self, dim):
+        return np.expand_dims(np.asarray(self), dim).view(ArrayTensor)
+
+    def new_ones(self, shape):
+        return np.ones(shape, dtype=self.dtype).view(ArrayTensor)
+
+
+ARRAY_TORCH = SimpleNamespace(
+    long=np.int64,
+    tensor=lambda data, dtype=None, device=None: np.array(data, dtype=dtype).view(ArrayTensor),
+    full=lambda shape, value, dtype=None: np.full(shape, value, dtype=dtype).view(ArrayTensor),
+    zeros=lambda shape, dtype=None: np.zeros(shape, dtype=dtype).view(ArrayTensor),
+    cat=lambda tensors, dim: np.concatenate([np.asarray(t) for t in tensors], axis=dim).view(ArrayTensor),
+    inference_mode=contextlib.nullcontext,
+)
+
+
+class ArrayNextLetterModel:
+    """
+    与 NextLetterModel 相同的预测规则，用 NumPy 计算，并记录每一步的输入
+    """
+
+    def __init__(self):
+        self.config = SimpleNamespace(max_position_embeddings=128)
+        self.steps = []
+
+    def __call__(self, input_ids, attention_mask=None, position_ids=None, past_key_values=None, use_cache=True):
+        self.steps.append((np.asarray(input_ids).copy(), np.asarray(attention_mask).copy(), np.asarray(position_ids).copy()))
+        logits = np.eye(27)[(np.asarray(input_ids) + 1) % 27] * 10
+        return SimpleNamespace(logits=logits.view(ArrayTensor), past_key_values=(past_key_values or 0) + 1)
+
+
+def test_concurrent_requests_decode_in_one_left_padded_batch():
+    model = ArrayNextLetterModel()
+
+    async def run():
+        engine = LocalInferenceEngine(model=model, tokenizer=CharTokenizer(), max_batch_size=4, max_wait=0.05)
+        engine._torch = ARRAY_TORCH  # 已加载的模型不再经过 _load
+        try:
+            return await asyncio.gather(
+                engine.chat_completion(_payload()),
+                engine.chat_completion(_payload(messages=[{"role": "user", "content": "hello"}], max_tokens=3)),
+                _collect(engine.stream(_payload(stop=["kl"]))),
+            )
+        finally:
+            await engine.aclose()
+
+    full, short, streamed = asyncio.run(run())
+    assert full["choices"][0]["message"]["content"] == "hijklmnopqrstuvwxyz"
+    assert full["choices"][0]["finish_reason"] == "stop"
+    assert short["choices"][0]["message"]["content"] == "hij"
+    assert short["choices"][0]["finish_reason"] == "length"
+    assert short["usage"]["completion_tokens"] == 3
+    assert "".join(streamed) == "hij"
+    # 三条请求合成一个批次：第一步输入完整提示词，较短的提示词在左侧补齐，位置从第一个真实token开始计
+    input_ids, attention_mask, position_ids = model.steps[0]
+    assert input_ids.shape[0] == 3
+    short_row = int(np.argmin(attention_mask.sum(axis=1)))
+    padding = int((attention_mask[short_row] == 0).sum())
+    assert padding == 3 and (input_ids[short_row, :padding] == CharTokenizer.pad_token_id).all()
+    assert position_ids[short_row, padding] == 0 and position_ids[short_row, -1] == input_ids.shape[1] - padding - 1
+    # 之后每步只输入上一步生成的token，全部序列结束（z 之后为结束符）后不再解码
+    assert all(step[0].shape == (3, 1) for step in model.steps[1:])
+    assert len(model.steps) == 20
+
+
+def test_unconfigured_local_model_is_reported(monkeypatch):
+    monkeypatch.setattr(llm_client, "LOCAL_LLM_BACKEND", "")
+    with pytest.raises(ProviderConfigError, match="LOCAL_MODEL_PATH"):
+        check_model_configured("custom-model")
+    monkeypatch.setattr(llm_client, "LOCAL_LLM_BACKEND", "transformers")
+    monkeypatch.setattr(llm_client, "LOCAL_MODEL_PATH", None)
+    with pytest.raises(ProviderConfigError, match="LOCAL_MODEL_PATH"):
+        check_model_configured("custom-model")
+    monkeypatch.setattr(llm_client, "LOCAL_LLM_BACKEND", "http")
+    check_model_configured("custom-model")
+
+
+def test_engine_without_model_path_does_not_load_a_default_model():
+    engine = LocalInferenceEngine(model_path=None)
+    try:
+        with pytest.raises(LocalInferenceError, match="LOCAL_MODEL_PATH"):
+            engine._load()
+    finally:
+        engine._executor.shutdown()
+
+
+def _tiny_model():
+    torch = pytest.importorskip("torch")
+
+    class NextLetterModel(torch.nn.Module):
+        """
+        每个位置都预测下一个字母（z 之后为结束符），不使用KV缓存的内容
+        """
+
+        def __init__(self):
+            super().__init__()
+            self.config = SimpleNamespace(max_position_embeddings=128)
+            self.scale = torch.nn.Parameter(torch.tensor(10.0))
+
+        def forward(self, input_ids, attention_mask=None, position_ids=None, past_key_values=None, use_cache=True):
+            logits = torch.nn.functional.one_hot((input_ids + 1) % 27, 27).float() * self.scale
+            return SimpleNamespace(logits=logits, past_key_values=past_key_values)
+
+    return NextLetterModel()
+
+
+def test_tiny_model_generates_on_cpu_and_stops_at_stop_string():
+    model = _tiny_model()
+
+    async def run():
+        engine = LocalInferenceEngine(model=model, tokenizer=CharTokenizer(), device="cpu", max_batch_size=4, max_wait=0.05)
+        try:
+            # 提示词以空格结尾（编码为 g），之后依次生成 h..z 再结束
+            full, streamed, stopped = await asyncio.gather(
+                engine.chat_completion(_payload()),
+                _collect(engine.stream(_payload(stop=["kl"]))),
+                engine.chat_completion(_payload(stop="mn")),
+            )
+        finally:
+            await engine.aclose()
+        assert full["choices"][0]["message"]["content"] == "hijklmnopqrstuvwxyz"
+        assert full["choices"][0]["finish_reason"] == "stop"
+        assert "".join(streamed) == "hij"
+        assert stopped["choices"][0]["message"]["content"] == "hijkl"
+
+    asyncio.run(run())
+
+
+def test_tiny_model_respects_max_tokens():
+    model = _tiny_model()
+
+    async def run():
+        engine = LocalInferenceEngine(model=model, tokenizer=CharTokenizer(), device="cpu")
+        try:
+            result = await engine.chat_completion(_payload(max_tokens=3, stop=["xyz"]))
+        finally:
+            await engine.aclose()
+        assert result["choices"][0]["message"]["content"] == "hij"
+        assert result["choices"][0]["finish_reason"] == "length"
+
+    asyncio.run(run())
+
+
+async def _collect(stream):
+    return [item async for item in stream]
+
+
+@pytest.mark.skipif(not os.getenv("LOCAL_INFERENCE_TEST_MODEL"), reason="未设置 LOCAL_INFERENCE_TEST_MODEL")
+def test_small_model_on_cpu():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+
+    async def run():
+        engine = LocalInferenceEngine(model_path=os.environ["LOCAL_INFERENCE_TEST_MODEL"], device="cpu")
+        try:
+            results = await asyncio.gather(*[
+                engine.chat_completion({
+                    "messages": [{"role": "user", "content": f"用一句话介绍数字{i}"}],
+                    "temperature": 0,
+                    "max_tokens": 16,
+                })
+                for i in range(3)
+            ])
+        finally:
+            await engine.aclose()
+        for result in results:
+            assert result["choices"][0]["message"]["content"].strip()
+            assert 0 < result["usage"]["completion_tokens"] <= 16
+
+    asyncio.run(run())
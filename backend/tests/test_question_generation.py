@@ -0,0 +1,90 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from app.core.dedup_index import NearDuplicateIndex
+from app.core.llm_client import ProviderConfigError
+from app.core.question_generation import QuestionGenerator
+from app.core.repository import SQLiteRepository
+
+# 出题流程的测试：用按顺序返回预设回复的假客户端代替大模型，题库使用临时目录中的SQLite
+
+
+class ScriptedClient:
+    """
+    按顺序返回预设回复的假大模型客户端，记录每次调用的请求体与 use_cache
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    async def chat_completion(self, payload, provider=None, use_cache=False, validate=None):
+        self.calls.append({"payload": payload, "use_cache": use_cache, "validate": validate})
+        content = self.replies.pop(0)
+        return {"choices": [{"message": {"content": content}}]}
+
+
+def _questions(*stems):
+    return [
+        {"id": str(i + 1), "content": stem, "options": ["甲", "乙", "丙", "丁"], "answer": "A", "explanation": ""}
+        for i, stem in enumerate(stems)
+    ]
+
+
+def _reply(*stems):
+    return "```json\n" + json.dumps(_questions(*stems), ensure_ascii=False) + "\n```"
+
+
+def _generator(tmp_path, client):
+    return QuestionGenerator(
+        llm_client=client, repository=SQLiteRepository(str(tmp_path / "bank.db")), dedup_index=NearDuplicateIndex()
+    )
+
+
+def _generate_batch(generator, num_questions):
+    return asyncio.run(generator._generate_batch("光合作用", num_questions, "multiple_choice", asyncio.Semaphore(1)))
+
+
+def test_followups_bypass_cache_when_reply_is_unusable(tmp_path):
+    client = ScriptedClient(["抱歉，无法生成", "```json\n[{\"content\": \"截断", _reply("叶绿体位于哪里", "光反应的产物是什么")])
+    questions = _generate_batch(_generator(tmp_path, client), 2)
+    assert [q["content"] for q in questions] == ["叶绿体位于哪里", "光反应的产物是什么"]
+    assert [call["use_cache"] for call in client.calls] == [True, False, False]
+
+
+def test_followups_request_only_missing_questions(tmp_path):
+    client = ScriptedClient([_reply("叶绿体位于哪里", "叶绿体位于哪里"), _reply("暗反应发生在哪里")])
+    questions = _generate_batch(_generator(tmp_path, client), 2)
+    assert [q["content"] for q in questions] == ["叶绿体位于哪里", "暗反应发生在哪里"]
+    followup = client.calls[1]["payload"]["messages"][-1]["content"]
+    assert "生成1道" in followup and "叶绿体位于哪里" in followup
+
+
+def test_reply_validator_requires_enough_valid_questions():
+    validate = QuestionGenerator._reply_validator(2, "multiple_choice")
+    assert validate({"choices": [{"message": {"content": _reply("叶绿体位于哪里", "暗反应发生在哪里")}}]})
+    assert not validate({"choices": [{"message": {"content": _reply("叶绿体位于哪里")}}]})
+    assert not validate({"choices": [{"message": {"content": "抱歉，无法生成"}}]})
+    assert not validate({"choices": []})
+
+
+def test_missing_provider_configuration_is_reported(tmp_path):
+    class UnconfiguredClient:
+        async def chat_completion(self, payload, provider=None, use_cache=False, validate=None):
+            raise ProviderConfigError("服务提供方 siliconflow 未配置API密钥")
+
+    with pytest.raises(ProviderConfigError):
+        _generate_batch(_generator(tmp_path, UnconfiguredClient()), 2)
+
+
+def test_unusable_replies_are_logged_without_their_content(tmp_path, caplog):
+    secret = "这段回复内容不应出现在日志中"
+    client = ScriptedClient([secret, f"```json\n[{{\"content\": \"{secret}", secret])
+    with caplog.at_level(logging.DEBUG, logger="app.core.question_generation"):
+        questions = _generate_batch(_generator(tmp_path, client), 1)
+    assert questions == [] and not client.replies
+    assert "子批次题目不足" in caplog.text and "回复长度" in caplog.text
+    assert secret not in caplog.text
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from app.core.rate_limit import ProviderLimiter, call_with_limits, is_retryable, parse_retry_after
+
+# 限流器的测试：AIMD 并发调整、Retry-After 的解析与暂停、失败重试
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request("POST", "http://provider.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after(httpx.Response(429, headers={"Retry-After": "3"})) == 3.0
+    delay = parse_retry_after(httpx.Response(429, headers={"Retry-After": formatdate(time.time() + 30, usegmt=True)}))
+    assert 25 < delay <= 30
+    assert parse_retry_after(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    assert parse_retry_after(httpx.Response(429)) is None
+
+
+def test_is_retryable():
+    assert is_retryable(_status_error(429, {"Retry-After": "2"})) == (True, True, 2.0)
+    assert is_retryable(_status_error(503)) == (True, False, None)
+    assert is_retryable(_status_error(400)) == (False, False, None)
+    assert is_retryable(httpx.ReadTimeout("timeout")) == (True, False, None)
+    assert is_retryable(ValueError("bad json")) == (False, False, None)
+
+
+def test_aimd_halves_on_throttle_and_grows_additively():
+    async def run():
+        limiter = ProviderLimiter(max_concurrency=16)
+        assert limiter.concurrency == 8
+        await limiter.acquire(10)
+        await limiter.release(0.1, throttled=True)
+        assert limiter.concurrency == 4
+        # 同一批429只减半一次
+        await limiter.acquire(10)
+        await limiter.release(0.1, throttled=True)
+        assert limiter.concurrency == 4
+        await limiter.acquire(10)
+        await limiter.release(0.1)
+        assert limiter.concurrency == pytest.approx(4.25)
+        # 延迟明显升高时小幅下调
+        limiter._last_decrease = 0.0
+        await limiter.acquire(10)
+        await limiter.release(1.0)
+        assert limiter.concurrency == pytest.approx(4.25 * 0.9)
+        assert limiter.stats["throttled"] == 2 and limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_concurrency_limit_blocks_extra_requests():
+    async def run():
+        limiter = ProviderLimiter(max_concurrency=2)
+        assert limiter.limit == 1
+        await limiter.acquire(1)
+        waiting = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0.02)
+        assert not waiting.done()
+        await limiter.release(0.01)
+        await asyncio.wait_for(waiting, 1)
+        await limiter.release(0.01)
+
+    asyncio.run(run())
+
+
+def test_retry_after_pauses_all_requests_on_the_limiter():
+    async def run():
+        limiter = ProviderLimiter(max_concurrency=4)
+        await limiter.acquire(1)
+        await limiter.release(0.01, throttled=True, retry_after=0.2)
+        start = time.monotonic()
+        await limiter.acquire(1)
+        waited = time.monotonic() - start
+        await limiter.release(0.01)
+        return waited
+
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_call_with_limits_retries_after_throttle():
+    attempts = []
+
+    async def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _status_error(429, {"Retry-After": "0.1"})
+        return {"usage": {"total_tokens": 5}}
+
+    async def run():
+        limiter = ProviderLimiter(tpm=10000, max_concurrency=4)
+        result = await call_with_limits(limiter, {"messages": [], "max_tokens": 100}, send)
+        return limiter, result
+
+    limiter, result = asyncio.run(run())
+    assert result == {"usage": {"total_tokens": 5}}
+    assert len(attempts) == 2 and attempts[1] - attempts[0] >= 0.09
+    assert limiter.stats["retries"] == 1 and limiter.stats["throttled"] == 1
+
+
+def test_reserved_tokens_are_settled_with_actual_usage():
+    async def run():
+        limiter = ProviderLimiter(tpm=6000, max_concurrency=4)
+        await limiter.acquire(100)
+        reserved_level = limiter.tokens.level
+        await limiter.release(0.01, reserved_tokens=100, used_tokens=5)
+        return reserved_level, limiter.tokens.level
+
+    reserved_level, settled_level = asyncio.run(run())
+    assert reserved_level == pytest.approx(5900, abs=1)
+    assert settled_level == pytest.approx(5995, abs=1)
+
+
+def test_call_with_limits_does_not_retry_client_errors():
+    calls = []
+
+    async def send():
+        calls.append(1)
+        raise _status_error(400)
+
+    async def run():
+        await call_with_limits(ProviderLimiter(max_concurrency=4), {"messages": []}, send)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+    assert len(calls) == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from app.core.repository import SQLiteRepository
+
+# SQLite 数据仓库的测试：批量写入、索引字段查询（含 $in 与数组字段）、游标分页与版本号
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = SQLiteRepository(str(tmp_path / "bank.db"))
+    yield repository
+    repository.close()
+
+
+def _question(i, **extra):
+    return {"id": f"q{i}", "type": "multiple_choice", "content": f"题目{i}", "tags": [], **extra}
+
+
+def test_in_queries_on_scalar_and_array_fields(repository):
+    repository.bulk_upsert("questions", [
+        _question(1, document_id="d1", tags=["生物", "光合作用"]),
+        _question(2, document_id="d2", tags=["化学"]),
+        _question(3, document_id="d3", tags=["生物"]),
+        _question(4, document_id=None, tags=[]),
+    ])
+    ids = lambda documents: sorted(d["id"] for d in documents)
+    assert ids(repository.find("questions", {"document_id": {"$in": ["d1", "d3", "missing"]}})) == ["q1", "q3"]
+    assert ids(repository.find("questions", {"tags": "生物"})) == ["q1", "q3"]
+    assert ids(repository.find("questions", {"tags": {"$in": ["化学", "光合作用"]}})) == ["q1", "q2"]
+    assert ids(repository.find("questions", {"id": {"$in": ["q2", "q4"]}})) == ["q2", "q4"]
+    assert repository.count("questions", {"tags": {"$in": ["生物"]}, "document_id": "d3"}) == 1
+    # 值为 None 的条件被忽略
+    assert repository.count("questions", {"document_id": None}) == 4
+
+
+def test_upsert_replaces_array_field_values(repository):
+    repository.bulk_upsert("questions", [_question(1, tags=["旧"])])
+    repository.bulk_upsert("questions", [_question(1, tags=["新"])])
+    assert repository.find("questions", {"tags": "旧"}) == []
+    assert [d["id"] for d in repository.find("questions", {"tags": "新"})] == ["q1"]
+    assert repository.count("questions") == 1
+
+
+def test_invalid_filters_are_rejected(repository):
+    with pytest.raises(ValueError):
+        repository.find("questions", {"content": "题目1"})
+    with pytest.raises(ValueError):
+        repository.find("questions", {"document_id": {"$in": "d1"}})
+    with pytest.raises(ValueError):
+        repository.find("questions", {"tags": {"$gte": "a"}})
+    with pytest.raises(ValueError):
+        repository.find_page("questions", order_by="content")
+
+
+def test_keyset_pagination_visits_every_document_once(repository):
+    # 排序键有大量重复值，翻页依靠 (排序键, id) 区分
+    documents = [
+        {"id": f"doc{i:03d}", "content_hash": f"h{i}", "upload_time": f"2024-01-{1 + i % 5:02d}"} for i in range(53)
+    ]
+    repository.bulk_upsert("documents", documents)
+    for descending in (False, True):
+        seen = []
+        after = None
+        while True:
+            page, after = repository.find_page("documents", limit=10, after=after, order_by="upload_time", descending=descending)
+            seen.extend(page)
+            if after is None:
+                break
+        keys = [(d["upload_time"], d["id"]) for d in seen]
+        assert keys == sorted(keys, reverse=descending)
+        assert len(set(keys)) == 53
+
+
+def test_keyset_pagination_with_filters_and_default_order(repository):
+    repository.bulk_upsert("evaluation_results", [
+        {"id": f"e{i:02d}", "evaluation_id": "eval-a" if i % 2 else "eval-b", "created_at": f"2024-01-{1 + i:02d}"}
+        for i in range(20)
+    ])
+    page, after = repository.find_page("evaluation_results", {"evaluation_id": "eval-a"}, limit=4)
+    assert [d["id"] for d in page] == ["e01", "e03", "e05", "e07"] and after == ["e07"]
+    page, after = repository.find_page(
+        "evaluation_results", {"evaluation_id": "eval-a", "created_at": {"$gte": "2024-01-15"}}, limit=4, after=after
+    )
+    assert [d["id"] for d in page] == ["e15", "e17", "e19"] and after is None
+
+
+def test_find_by_ids_keeps_order_and_versions_track_writes(repository):
+    assert repository.version("questions") == 0
+    repository.bulk_upsert("questions", [_question(i) for i in range(5)])
+    assert repository.version("questions") == 1
+    assert [d["id"] for d in repository.find_by_ids("questions", ["q3", "missing", "q0", "q3"])] == ["q3", "q0"]
+    assert repository.delete_by_ids("questions", ["q0", "missing"]) == 1
+    assert repository.version("questions") == 2
+    # 没有删除任何文档时版本号不变
+    assert repository.delete_by_ids("questions", ["missing"]) == 0
+    assert repository.version("questions") == 2
+    assert [d["id"] for d in repository.iter_find("questions", batch_size=2)] == ["q1", "q2", "q3", "q4"]